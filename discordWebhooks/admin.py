@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import DiscordWebhook, WebhookSettings
+from .models import DiscordWebhook, WebhookSettings, WebhookOutbox
 
 admin.site.register(DiscordWebhook)
 admin.site.register(WebhookSettings)
+admin.site.register(WebhookOutbox)
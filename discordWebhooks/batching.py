@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Event coalescing and embed batching for Discord Webhooks
+Packs notifications several embeds to a message and folds repeated events
+(the same IP failing SSH over and over) into one summary per window
+"""
+import time
+from datetime import datetime, timedelta
+
+# Discord's limits for one webhook message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_MESSAGE_EMBED_CHARS = 6000
+# How long an embed waits for others to share its message
+BATCH_DELAY = 2.0
+DEFAULT_AGGREGATION_WINDOW = 60
+
+
+def embed_size(embed):
+    """Characters Discord counts against the per-message embed limit"""
+    size = len(embed.get('title', '')) + len(embed.get('description', ''))
+    size += len(embed.get('footer', {}).get('text', '')) + len(embed.get('author', {}).get('name', ''))
+    for field in embed.get('fields', []):
+        size += len(field.get('name', '')) + len(field.get('value', ''))
+    return size
+
+
+class EventBatcher:
+    """Coalesce events and hand embeds to send() in full messages
+
+    add() takes an embed and, optionally, a key identifying "the same
+    event" (e.g. failed SSH logins from one IP). The first event for a key
+    is sent as usual; repeats within the aggregation window are only
+    counted, and when the window ends one summary embed, built by the
+    summarize callback, reports how many there were. A key that keeps
+    repeating gets one summary per window.
+
+    Windows end window seconds after they open by the clock, and also once
+    an event's own timestamp is window seconds past the one that opened
+    it: a backlog read in one go is summarized per window of log time, not
+    folded into one summary for everything read together.
+
+    Embeds are held for up to batch_delay seconds so that events arriving
+    together share a message, and go out at once when a message is full.
+    The batcher isn't thread safe; its owner calls poll() when the
+    deadline it returned has passed, and flush() before exiting.
+
+    Args:
+        send: called with a list of up to MAX_EMBEDS_PER_MESSAGE embeds
+        window: aggregation window in seconds; 0 sends every event
+    """
+
+    def __init__(self, send, window=DEFAULT_AGGREGATION_WINDOW, batch_delay=BATCH_DELAY, clock=time.monotonic):
+        self.send = send
+        self.window = window
+        self.batch_delay = batch_delay
+        self.clock = clock
+        self.pending = []
+        self.pending_since = None
+        self.groups = {}  # key -> repeats seen in the current window
+
+    def add(self, embed, key=None, detail=None, summarize=None, timestamp=None):
+        """
+        Queue an embed
+
+        Args:
+            embed: Discord embed dict for this event
+            key: events with equal keys are coalesced; None never coalesces
+            detail: value collected from repeats for the summary (e.g. username)
+            summarize: called as summarize(count, details, first_seen, last_seen)
+                to build the summary embed for the repeats of a window
+            timestamp: when the event happened, as a naive local datetime;
+                defaults to now
+
+        Returns:
+            bool: False if the event was folded into a pending summary
+        """
+        now = self.clock()
+        if key is None or self.window <= 0:
+            self._push(embed, now)
+            return True
+
+        timestamp = timestamp or datetime.now()
+        group = self.groups.get(key)
+        while group is not None and (timestamp - group['started']).total_seconds() >= self.window:
+            # The event is past this window's stretch of log time
+            self._close_window(key, group, now)
+            group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = self._new_group(now, summarize, timestamp)
+            self._push(embed, now)
+            return True
+
+        if group['count'] == 0:
+            group['first_seen'] = timestamp
+        group['count'] += 1
+        group['last_seen'] = timestamp
+        if detail is not None:
+            group['details'][detail] = group['details'].get(detail, 0) + 1
+        return False
+
+    def _new_group(self, now, summarize, started):
+        return {
+            'opened': now,
+            'started': started,
+            'count': 0,
+            'details': {},
+            'first_seen': None,
+            'last_seen': None,
+            'summarize': summarize,
+        }
+
+    def _push(self, embed, now):
+        if self.pending and (len(self.pending) >= MAX_EMBEDS_PER_MESSAGE or
+                             sum(map(embed_size, self.pending)) + embed_size(embed) > MAX_MESSAGE_EMBED_CHARS):
+            self._send_pending()
+        if not self.pending:
+            self.pending_since = now
+        self.pending.append(embed)
+        if len(self.pending) >= MAX_EMBEDS_PER_MESSAGE:
+            self._send_pending()
+
+    def _send_pending(self):
+        embeds, self.pending, self.pending_since = self.pending, [], None
+        if embeds:
+            self.send(embeds)
+
+    def _close_window(self, key, group, now):
+        if group['count'] == 0:
+            # Quiet for a whole window; the next event is news again
+            del self.groups[key]
+            return
+        if group['summarize'] is not None:
+            self._push(
+                group['summarize'](group['count'], group['details'], group['first_seen'], group['last_seen']),
+                now
+            )
+        self.groups[key] = self._new_group(now, group['summarize'], group['started'] + timedelta(seconds=self.window))
+
+    def poll(self):
+        """Send whatever is due; returns seconds until the next deadline, or None if idle"""
+        now = self.clock()
+        for key, group in list(self.groups.items()):
+            if now - group['opened'] >= self.window:
+                self._close_window(key, group, now)
+        if self.pending and now - self.pending_since >= self.batch_delay:
+            self._send_pending()
+
+        deadlines = [group['opened'] + self.window for group in self.groups.values()]
+        if self.pending:
+            deadlines.append(self.pending_since + self.batch_delay)
+        return max(0, min(deadlines) - now) if deadlines else None
+
+    def flush(self):
+        """Summarize open windows early and send everything now"""
+        now = self.clock()
+        for key, group in list(self.groups.items()):
+            if group['count'] and group['summarize'] is not None:
+                self._push(
+                    group['summarize'](group['count'], group['details'], group['first_seen'], group['last_seen']),
+                    now
+                )
+        self.groups.clear()
+        self._send_pending()
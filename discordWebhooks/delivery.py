@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Outbound delivery queue for Discord webhooks
+Callers enqueue an embed and return at once; messages are stored in the
+outbox, and a dispatcher thread fans them out to their webhooks over one
+keep-alive session and retries failed sends with exponential backoff
+"""
+import collections
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
+from . import outbox
+from .models import DiscordWebhook
+from .ratelimit import RateLimiter
+from .utils import build_webhook_payload, is_discord_webhook_url, send_discord_webhook, webhook_label
+
+# Sends in flight at once, across all webhooks (one per webhook at a time)
+DELIVERY_WORKERS = 4
+SEND_TIMEOUT = 10
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# 429s a message may get before it's dropped; they don't count as attempts
+MAX_RATE_LIMITED = 10
+# Messages held in memory at once; the rest wait in the outbox
+MAX_IN_MEMORY = 500
+# How often the outbox is checked for replayed messages and ones other processes left behind
+DRAIN_INTERVAL = 5
+DRAIN_BATCH = 100
+CLAIM_REFRESH_INTERVAL = 30
+PURGE_INTERVAL = 600
+# How long a cron-started monitor waits for its sends before exiting
+EXIT_FLUSH_TIMEOUT = 30
+
+
+def make_session(pool_size=DELIVERY_WORKERS):
+    """requests.Session keeping up to pool_size connections alive per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def is_retryable(result):
+    """Whether a failed send_discord_webhook() result is worth another try"""
+    status_code = result.get('status_code', 0)
+    return status_code == 0 or status_code >= 500
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+    """Seconds to wait after the attempt-th failed try, with jitter"""
+    delay = min(maximum, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _db(func, *args):
+    # The dispatcher thread is long-lived; don't let its connection go stale
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+class WebhookDelivery:
+    """Deliver webhook messages from the outbox in the background
+
+    enqueue() stores one WebhookOutbox row per webhook and wakes the
+    dispatcher, which claims due rows in batches and sends them. Each
+    webhook has its own FIFO queue and at most one send in flight, so
+    messages reach a channel in order while different webhooks are sent to
+    in parallel. Sends are paced by a RateLimiter so Discord's buckets
+    aren't overrun; a 429 puts the message back at the head of its queue
+    until the bucket (or the global limit) resets. A send that times out,
+    fails to connect or gets a 5xx is retried after an exponential backoff;
+    after max_attempts tries, or on any other error, the message is marked
+    failed and can be replayed from the plugin page.
+
+    Outcomes are written back to the outbox by the dispatcher in batches.
+    Claimed rows belong to this process until it hands them back on
+    close(), or until its claims go stale after a crash, so several
+    processes can drain the outbox without sending a message twice.
+    """
+
+    def __init__(self, workers=DELIVERY_WORKERS, max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, max_in_memory=MAX_IN_MEMORY, timeout=SEND_TIMEOUT):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_in_memory = max_in_memory
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.queues = {}  # webhook url -> deque of claimed messages
+        self.busy = {}  # webhook url -> outbox id of the send in flight
+        self.not_before = {}  # webhook url -> monotonic time its next send may start
+        self.results = []  # outcomes waiting to be written to the outbox
+        self.recording = 0  # outcomes being written right now
+        self.scan_requested = False
+        self.scanning = False  # an outbox claim is running right now
+        self.counters = collections.Counter()
+        self.rate_limiter = RateLimiter()
+        self.token = None
+        self.session = None
+        self.pool = None
+        self.thread = None
+        self.pid = None
+        self.generation = 0
+        self.closed = True
+
+    def _start(self):
+        # Called with self.cond held
+        if not self.closed and self.pid == os.getpid() and self.thread.is_alive():
+            return
+        # First use, after close(), or a forked child; a child's inherited
+        # messages are still claimed by its parent, so start from scratch
+        self.pid = os.getpid()
+        self.generation += 1
+        self.closed = False
+        self.token = uuid.uuid4().hex
+        self.queues.clear()
+        self.busy.clear()
+        self.results = []
+        # Pick up whatever earlier runs left in the outbox
+        self.scan_requested = True
+        self.session = make_session(self.workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='discord-delivery')
+        self.thread = threading.Thread(
+            target=self._dispatch, args=(self.generation,), name='discord-delivery-dispatch', daemon=True
+        )
+        self.thread.start()
+
+    def start(self):
+        """Start sending whatever is due in the outbox"""
+        with self.cond:
+            self._start()
+            self.scan_requested = True
+            self.cond.notify_all()
+
+    def enqueue(self, embed_data, webhooks=None):
+        """
+        Store a message for each webhook and return without waiting for Discord
+
+        Args:
+            embed_data: Embed dict, message dict or plain text
+            webhooks: Webhooks to send to; defaults to the enabled webhooks in the database
+
+        Returns:
+            int: Number of webhooks the message was queued for
+        """
+        if webhooks is None:
+            webhooks = DiscordWebhook.objects.filter(enabled=True)
+        valid = []
+        for webhook in webhooks:
+            if is_discord_webhook_url(webhook.url):
+                valid.append(webhook)
+            else:
+                logging.writeToFile(f"Discord webhook {webhook.name}: invalid Discord webhook URL")
+        if not valid:
+            return 0
+
+        queued = outbox.add_messages(build_webhook_payload(embed_data), valid)
+        with self.cond:
+            self.counters['queued'] += queued
+        # Rows written inside a caller's transaction only exist for the dispatcher once it commits
+        transaction.on_commit(self.start)
+        return queued
+
+    def _pending(self):
+        return (self._in_memory() + len(self.results) + self.recording +
+                (1 if self.scan_requested or self.scanning else 0))
+
+    def _in_memory(self):
+        return sum(len(queue) for queue in self.queues.values()) + len(self.busy)
+
+    def _dispatch(self, generation):
+        token = self.token
+        last_scan = last_refresh = last_purge = time.monotonic()
+        while True:
+            with self.cond:
+                if self.generation != generation or self.closed:
+                    break
+                results, self.results = self.results, []
+                self.recording = len(results)
+                now = time.monotonic()
+                room = min(DRAIN_BATCH, self.max_in_memory - self._in_memory())
+                scan = (self.scan_requested or now - last_scan >= DRAIN_INTERVAL) and room > 0
+                if scan:
+                    # A start() from here on asks for another scan; it may
+                    # have stored rows this claim doesn't see
+                    self.scan_requested = False
+                    self.scanning = True
+
+            claimed = []
+            try:
+                if results:
+                    _db(self._record, token, results)
+                if scan:
+                    claimed = _db(outbox.claim, token, room)
+                    last_scan = now
+                if now - last_refresh >= CLAIM_REFRESH_INTERVAL:
+                    _db(outbox.refresh_claims, token)
+                    last_refresh = now
+                if now - last_purge >= PURGE_INTERVAL:
+                    _db(outbox.purge)
+                    last_purge = now
+            except Exception as e:
+                logging.writeToFile(f"Discord webhook outbox error: {str(e)}")
+                with self.cond:
+                    self.results[:0] = results
+                    if scan:
+                        self.scan_requested = True
+                last_scan = now
+                scan = False
+                time.sleep(1)
+
+            with self.cond:
+                self.recording = 0
+                self.scanning = False
+                if scan and len(claimed) >= room:
+                    # A full batch means there may be more waiting
+                    self.scan_requested = True
+                for row in claimed:
+                    self._add_claimed(row)
+                if self.generation != generation or self.closed:
+                    break
+                wait = self._start_sends()
+                self.cond.notify_all()
+                can_scan = self.scan_requested and self._in_memory() < self.max_in_memory
+                if not self.results and not can_scan:
+                    next_scan = max(0, last_scan + DRAIN_INTERVAL - time.monotonic())
+                    self.cond.wait(next_scan if wait is None else min(wait, next_scan))
+
+        # Let sends in flight finish, write what's left and hand back what wasn't sent
+        with self.cond:
+            deadline = time.monotonic() + self.timeout
+            while self.busy and time.monotonic() < deadline:
+                self.cond.wait(deadline - time.monotonic())
+            results, self.results = self.results, []
+            in_flight = list(self.busy.values())
+        try:
+            if results:
+                _db(self._record, token, results)
+            _db(outbox.release_claims, token, in_flight)
+        except Exception as e:
+            logging.writeToFile(f"Discord webhook outbox error: {str(e)}")
+        with self.cond:
+            self.cond.notify_all()
+
+    def _add_claimed(self, row):
+        # Called with self.cond held
+        webhook = row.webhook
+        if not webhook.enabled or not is_discord_webhook_url(webhook.url):
+            reason = 'Webhook disabled' if not webhook.enabled else 'Invalid Discord webhook URL'
+            self.results.append(('failed', row.pk, row.attempts, reason))
+            self.counters['failed'] += 1
+            return
+        self.queues.setdefault(webhook.url, collections.deque()).append({
+            'id': row.pk,
+            'name': webhook.name,
+            'payload': json.loads(row.payload),
+            'attempts': row.attempts,
+            'rate_limited': 0,
+        })
+
+    def _start_sends(self):
+        """Submit every send that may start now; returns seconds until the next one may, or None"""
+        # Called with self.cond held
+        now = time.monotonic()
+        wait = None
+        for url, queue in self.queues.items():
+            if not queue or url in self.busy:
+                continue
+            delay = self.not_before.get(url, 0) - now
+            if delay <= 0:
+                delay = self.rate_limiter.acquire(url, now)
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            message = queue.popleft()
+            self.busy[url] = message['id']
+            self.pool.submit(self._send, url, message)
+        return wait
+
+    def _send(self, url, message):
+        message['attempts'] += 1
+        try:
+            result = send_discord_webhook(url, message['payload'], timeout=self.timeout, session=self.session)
+        except Exception as e:
+            result = {'success': False, 'message': str(e), 'status_code': 0}
+        self.rate_limiter.update(url, result['status_code'], result.get('rate_limit'))
+
+        gave_up = False
+        with self.cond:
+            self.busy.pop(url, None)
+            if result['success']:
+                self.counters['sent'] += 1
+                self.not_before.pop(url, None)
+                self.results.append(('delivered', message['id'], message['attempts']))
+            elif result['status_code'] == 429 and message['rate_limited'] < MAX_RATE_LIMITED:
+                # The rate limiter now holds the webhook back until Discord's reset
+                message['attempts'] -= 1
+                message['rate_limited'] += 1
+                self.counters['rate_limited'] += 1
+                if not self.closed:
+                    self.queues.setdefault(url, collections.deque()).appendleft(message)
+            elif is_retryable(result) and message['attempts'] < self.max_attempts:
+                delay = backoff_delay(message['attempts'], self.backoff_base, self.backoff_max)
+                self.counters['retried'] += 1
+                self.results.append(('retry', message['id'], message['attempts'], delay, result['message']))
+                # Once closing, the message goes back to the outbox for the next run
+                if not self.closed:
+                    self.not_before[url] = time.monotonic() + delay
+                    self.queues.setdefault(url, collections.deque()).appendleft(message)
+            else:
+                self.counters['failed'] += 1
+                self.results.append(('failed', message['id'], message['attempts'], result['message']))
+                gave_up = True
+            self.cond.notify_all()
+
+        if gave_up:
+            logging.writeToFile(
+                f"Failed to send webhook to {message['name']} after {message['attempts']} attempt(s): {result['message']}"
+            )
+
+    def _record(self, token, results):
+        now = timezone.now()
+        delivered, retries, failed = [], [], []
+        for outcome, pk, attempts, *rest in results:
+            if outcome == 'delivered':
+                delivered.append((pk, attempts))
+            elif outcome == 'retry':
+                delay, error = rest
+                retries.append((pk, attempts, now + timedelta(seconds=delay), error))
+            else:
+                failed.append((pk, attempts, rest[0]))
+        outbox.record_results(token, delivered, retries, failed, now)
+
+    def flush(self, timeout=None):
+        """Wait until every claimed message is sent or given up on; False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self._pending() and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Flush, then stop; unsent messages stay in the outbox for the next run"""
+        flushed = self.flush(timeout)
+        with self.cond:
+            lost = self._in_memory()
+            self.closed = True
+            self.cond.notify_all()
+            thread, pool, session = self.thread, self.pool, self.session
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.timeout)
+        if pool is not None:
+            pool.shutdown(wait=False)
+        if session is not None:
+            session.close()
+        with self.cond:
+            self.queues.clear()
+        if not flushed:
+            logging.writeToFile(f"Discord webhook delivery stopped with {lost} message(s) left in the outbox")
+        return flushed
+
+    def drain(self, timeout=None):
+        """Send everything due in the outbox, including what earlier runs left, then close"""
+        self.start()
+        return self.close(timeout)
+
+    def stats(self):
+        """Counters, how many messages each webhook has waiting, and the rate limit buckets"""
+        with self.cond:
+            now = time.monotonic()
+            return {
+                'queued': self.counters['queued'],
+                'sent': self.counters['sent'],
+                'retried': self.counters['retried'],
+                'failed': self.counters['failed'],
+                'rate_limited': self.counters['rate_limited'],
+                'pending': {
+                    webhook_label(url): {
+                        'waiting': len(queue),
+                        'in_flight': url in self.busy,
+                        'retry_in': max(0, round(self.not_before.get(url, now) - now, 1)),
+                    }
+                    for url, queue in self.queues.items() if queue or url in self.busy
+                },
+                'rate_limits': self.rate_limiter.state(now),
+            }
+
+
+_delivery = None
+_delivery_lock = threading.Lock()
+
+
+def get_delivery():
+    """Process-wide delivery queue shared by the monitors"""
+    global _delivery
+    with _delivery_lock:
+        if _delivery is None:
+            _delivery = WebhookDelivery()
+        return _delivery
@@ -31,6 +31,9 @@ class WebhookSettingsForm(forms.ModelForm):
         fields = [
             'ssh_logins_enabled',
             'security_warnings_enabled',
+            'aggregation_window',
+            'backlog_policy',
+            'max_backlog_mb',
             'server_usage_enabled',
             'server_usage_cpu',
             'server_usage_memory',
@@ -40,11 +43,16 @@ class WebhookSettingsForm(forms.ModelForm):
             'cpu_threshold',
             'memory_threshold',
             'disk_threshold',
+            'usage_statistic',
+            'usage_window',
             'check_interval'
         ]
         widgets = {
             'ssh_logins_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'security_warnings_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'aggregation_window': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'max': 3600}),
+            'backlog_policy': forms.Select(attrs={'class': 'form-control'}),
+            'max_backlog_mb': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 10240}),
             'server_usage_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'server_usage_cpu': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'server_usage_memory': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
@@ -54,5 +62,7 @@ class WebhookSettingsForm(forms.ModelForm):
             'cpu_threshold': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'max': 100}),
             'memory_threshold': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'max': 100}),
             'disk_threshold': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'max': 100}),
+            'usage_statistic': forms.Select(attrs={'class': 'form-control'}),
+            'usage_window': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 60}),
             'check_interval': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 60})
         }
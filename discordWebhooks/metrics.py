@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Server metric sampling for Discord Webhooks
+Keeps CPU, memory, disk and network samples in a ring buffer and sums them
+up over a rolling window, so usage alerts follow sustained load rather
+than whatever a single instant happened to show
+"""
+import json
+import math
+import os
+import time
+from collections import deque
+
+import psutil
+from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
+from discordWebhooks.monitors.logtail import write_atomically
+
+# How much history the ring buffer covers (the longest usage window)
+HISTORY_SECONDS = 3600
+# CPU and network counters further apart than this aren't turned into a
+# rate: the monitor wasn't running in between
+MAX_COUNTER_GAP = 900
+# Metrics summed up over the window; the rest are taken from the latest sample
+WINDOW_METRICS = ('cpu_percent', 'memory_percent', 'disk_percent', 'network_sent_rate', 'network_recv_rate')
+DEFAULT_STATISTIC = 'average'
+DEFAULT_WINDOW_MINUTES = 5
+
+
+def format_rate(bytes_per_second):
+    """'12.3 MB/s' style rate"""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if bytes_per_second < 1024:
+            return f"{bytes_per_second:.1f} {unit}"
+        bytes_per_second /= 1024
+    return f"{bytes_per_second:.1f} GB/s"
+
+
+def describe_statistic(statistic, minutes):
+    """How summary() measured the values, e.g. '5-minute average'"""
+    if statistic == 'average':
+        return f"{minutes}-minute average"
+    if statistic == 'p95':
+        return f"{minutes}-minute 95th percentile"
+    return "latest sample"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def read_counters(now):
+    """CPU time and network byte counters, from which the next sample computes rates"""
+    cpu = psutil.cpu_times()
+    # Guest time is already counted in user time
+    total = sum(cpu) - getattr(cpu, 'guest', 0) - getattr(cpu, 'guest_nice', 0)
+    idle = cpu.idle + getattr(cpu, 'iowait', 0)
+    counters = {'time': now, 'cpu_busy': total - idle, 'cpu_total': total}
+    try:
+        net = psutil.net_io_counters()
+        counters.update(net_sent=net.bytes_sent, net_recv=net.bytes_recv)
+    except Exception:
+        pass
+    return counters
+
+
+def load_average_percent():
+    """1-minute load average as a CPU percentage, for when there's no earlier sample to compare with"""
+    try:
+        return min(os.getloadavg()[0] / (psutil.cpu_count() or 1) * 100, 100)
+    except (OSError, AttributeError):
+        return None
+
+
+class MetricsSampler:
+    """Take server metric samples into a ring buffer and sum them up over a window
+
+    Nothing here waits: CPU usage and network throughput are worked out
+    from the counters' change since the previous sample, so they're
+    averages over the time in between, however long that was. The buffer
+    holds enough samples at interval seconds apart to cover HISTORY_SECONDS.
+
+    The monitor daemon samples every few seconds and keeps the sampler in
+    memory; the cron monitor loads it from state_file, takes one sample a
+    run and saves it again.
+
+    Args:
+        interval: expected seconds between samples, which sizes the buffer
+        state_file: where load() and save() keep the samples between runs
+    """
+
+    def __init__(self, interval, state_file=None, clock=time.time):
+        self.samples = deque(maxlen=HISTORY_SECONDS // max(1, int(interval)) + 1)
+        self.state_file = state_file
+        self.clock = clock
+        self.counters = None
+
+    def load(self):
+        """Restore samples and counters from state_file; False if there was nothing usable"""
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.counters = state.get('counters')
+            self.samples.extend(state.get('samples', []))
+            return True
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    def save(self):
+        try:
+            write_atomically(self.state_file, json.dumps(
+                {'counters': self.counters, 'samples': list(self.samples)}, separators=(',', ':')
+            ))
+        except OSError as e:
+            logging.writeToFile(f"Error saving server metrics to {self.state_file}: {str(e)}")
+
+    def sample(self):
+        """Take a sample and add it to the buffer; returns it"""
+        now = self.clock()
+        sample = {'time': now}
+        try:
+            counters = read_counters(now)
+        except Exception as e:
+            logging.writeToFile(f"Error reading CPU and network counters: {str(e)}")
+            counters = None
+        previous, self.counters = self.counters, counters
+        usable = (previous is not None and counters is not None
+                  and 0 < now - previous['time'] <= MAX_COUNTER_GAP)
+
+        # CPU usage since the previous sample
+        if usable and counters['cpu_total'] > previous['cpu_total']:
+            busy = counters['cpu_busy'] - previous['cpu_busy']
+            sample['cpu_percent'] = min(max(busy / (counters['cpu_total'] - previous['cpu_total']) * 100, 0), 100)
+        else:
+            sample['cpu_percent'] = load_average_percent()
+
+        # Memory usage
+        try:
+            mem = psutil.virtual_memory()
+            sample.update(memory_percent=mem.percent, memory_total=mem.total, memory_used=mem.used,
+                          memory_available=mem.available)
+        except Exception:
+            pass
+
+        # Disk usage (root partition)
+        try:
+            disk = psutil.disk_usage('/')
+            sample.update(disk_percent=disk.percent, disk_total=disk.total, disk_used=disk.used, disk_free=disk.free)
+        except Exception:
+            pass
+
+        # Network throughput since the previous sample; counters going
+        # backwards (a reboot, or a wrapped counter) give no rate
+        if usable and 'net_sent' in counters and 'net_sent' in previous:
+            elapsed = now - previous['time']
+            sent, recv = counters['net_sent'] - previous['net_sent'], counters['net_recv'] - previous['net_recv']
+            if sent >= 0 and recv >= 0:
+                sample.update(network_sent_rate=sent / elapsed, network_recv_rate=recv / elapsed)
+
+        self.samples.append(sample)
+        return sample
+
+    def summary(self, window=DEFAULT_WINDOW_MINUTES * 60, statistic=DEFAULT_STATISTIC):
+        """
+        The metrics over the last window seconds, in get_server_metrics() form
+
+        Args:
+            window: seconds of samples to take into account
+            statistic: 'latest' (the last sample), 'average' or 'p95'
+
+        Returns:
+            dict: cpu_percent, memory_percent, disk_percent and network (a
+                readable rate), each present only if some sample had it
+        """
+        if not self.samples:
+            return {}
+        latest = self.samples[-1]
+        metrics = {key: value for key, value in latest.items() if key != 'time' and key not in WINDOW_METRICS}
+        since = latest['time'] - window
+        recent = [sample for sample in self.samples if sample['time'] > since] or [latest]
+        for key in WINDOW_METRICS:
+            values = [sample[key] for sample in recent if sample.get(key) is not None]
+            if not values:
+                continue
+            if statistic == 'average':
+                metrics[key] = sum(values) / len(values)
+            elif statistic == 'p95':
+                metrics[key] = percentile(values, 0.95)
+            else:
+                metrics[key] = values[-1]
+        if 'network_sent_rate' in metrics:
+            metrics['network'] = (f"Sent: {format_rate(metrics['network_sent_rate'])}, "
+                                  f"Recv: {format_rate(metrics['network_recv_rate'])}")
+        metrics['samples'] = len(recent)
+        return metrics
+
+
+_sampler = None
+
+
+def get_sampler():
+    """This process's sampler, for one-off readings"""
+    global _sampler
+    if _sampler is None:
+        _sampler = MetricsSampler(interval=60)
+    return _sampler
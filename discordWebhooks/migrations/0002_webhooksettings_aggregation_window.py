@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discordWebhooks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhooksettings',
+            name='aggregation_window',
+            field=models.IntegerField(default=60, help_text='Seconds to combine repeated events into one summary (0 sends every event)'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discordWebhooks', '0002_webhooksettings_aggregation_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField(help_text='JSON webhook payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.CharField(blank=True, default='', max_length=255)),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('webhook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='discordWebhooks.discordwebhook')),
+            ],
+            options={
+                'verbose_name': 'Webhook Outbox Message',
+                'verbose_name_plural': 'Webhook Outbox',
+                'ordering': ['-id'],
+                'indexes': [
+                    models.Index(fields=['status', 'next_attempt'], name='discordWebh_status_9d588c_idx'),
+                    models.Index(fields=['claimed_by', 'status'], name='discordWebh_claimed_d8c7cc_idx'),
+                    models.Index(fields=['created_at'], name='discordWebh_created_9d34b7_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discordWebhooks', '0003_webhookoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhooksettings',
+            name='backlog_policy',
+            field=models.CharField(choices=[('summarize', 'Summarize'), ('skip', 'Skip to the end'), ('all', 'Send every event')], default='summarize', help_text='What to do with a log backlog larger than the maximum', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='webhooksettings',
+            name='max_backlog_mb',
+            field=models.IntegerField(default=50, help_text='Unread log size in MB above which the backlog policy applies'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discordWebhooks', '0004_webhooksettings_backlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhooksettings',
+            name='usage_statistic',
+            field=models.CharField(choices=[('average', 'Average'), ('p95', '95th percentile'), ('latest', 'Latest sample')], default='average', help_text='How the samples in the usage window are combined', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='webhooksettings',
+            name='usage_window',
+            field=models.IntegerField(default=5, help_text='Minutes of server usage samples checked against the thresholds (1-60)'),
+        ),
+    ]
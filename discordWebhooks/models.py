@@ -21,12 +21,30 @@ class DiscordWebhook(models.Model):
 
 class WebhookSettings(models.Model):
     """Model to store plugin configuration settings (singleton pattern)"""
+    BACKLOG_POLICY_CHOICES = [
+        ('summarize', 'Summarize'),
+        ('skip', 'Skip to the end'),
+        ('all', 'Send every event'),
+    ]
+    USAGE_STATISTIC_CHOICES = [
+        ('average', 'Average'),
+        ('p95', '95th percentile'),
+        ('latest', 'Latest sample'),
+    ]
+
     # SSH Login Notifications
     ssh_logins_enabled = models.BooleanField(default=False, help_text="Enable SSH login notifications")
     
     # Security Warning Notifications
     security_warnings_enabled = models.BooleanField(default=False, help_text="Enable security warning notifications")
     
+    # Repeated SSH logins / security events within this many seconds are summarized (0 = send every event)
+    aggregation_window = models.IntegerField(default=60, help_text="Seconds to combine repeated events into one summary (0 sends every event)")
+    
+    # Unread log left by a monitor outage: past max_backlog_mb, backlog_policy decides what happens to it
+    backlog_policy = models.CharField(max_length=10, choices=BACKLOG_POLICY_CHOICES, default='summarize', help_text="What to do with a log backlog larger than the maximum")
+    max_backlog_mb = models.IntegerField(default=50, help_text="Unread log size in MB above which the backlog policy applies")
+    
     # Server Usage Notifications
     server_usage_enabled = models.BooleanField(default=False, help_text="Enable server usage notifications")
     server_usage_cpu = models.BooleanField(default=True, help_text="Include CPU metrics in server usage notifications")
@@ -42,6 +60,10 @@ class WebhookSettings(models.Model):
     memory_threshold = models.IntegerField(default=80, help_text="Memory threshold percentage (0-100)")
     disk_threshold = models.IntegerField(default=85, help_text="Disk usage threshold percentage (0-100)")
     
+    # Thresholds are checked against this statistic of the last usage_window minutes of samples
+    usage_statistic = models.CharField(max_length=10, choices=USAGE_STATISTIC_CHOICES, default='average', help_text="How the samples in the usage window are combined")
+    usage_window = models.IntegerField(default=5, help_text="Minutes of server usage samples checked against the thresholds (1-60)")
+    
     # Monitoring interval in minutes
     check_interval = models.IntegerField(default=5, help_text="Server usage check interval in minutes (minimum 1)")
     
@@ -66,3 +88,42 @@ class WebhookSettings(models.Model):
         """Ensure only one settings instance exists"""
         self.pk = 1
         super(WebhookSettings, self).save(*args, **kwargs)
+
+
+class WebhookOutbox(models.Model):
+    """A webhook message waiting to be sent, or the record of one that was
+
+    Rows are claimed by one delivery process at a time (claimed_by), so the
+    monitor daemon and the cron monitors can share the outbox without
+    sending anything twice.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    ]
+
+    webhook = models.ForeignKey(DiscordWebhook, on_delete=models.CASCADE, related_name='outbox')
+    payload = models.TextField(help_text="JSON webhook payload")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+    claimed_by = models.CharField(max_length=32, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Webhook Outbox Message"
+        verbose_name_plural = "Webhook Outbox"
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt']),
+            models.Index(fields=['claimed_by', 'status']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} to {self.webhook_id} ({self.status})"
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+systemd journal source for the Discord Webhooks monitors
+Reads entries through the systemd Python bindings when they're installed,
+and through journalctl otherwise, turning each one into a syslog-style line
+so the monitors parse journal and log file lines alike
+"""
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
+from discordWebhooks.monitors.logtail import write_atomically
+
+try:
+    from systemd import journal as systemd_journal
+    SYSTEMD_BINDINGS_AVAILABLE = True
+except ImportError:
+    systemd_journal = None
+    SYSTEMD_BINDINGS_AVAILABLE = False
+
+JOURNALCTL = shutil.which('journalctl') or '/usr/bin/journalctl'
+# How often the daemon saves its cursor while entries keep coming
+CURSOR_SAVE_INTERVAL = 5.0
+# Entries handed over per pass when following with the bindings
+READ_BATCH = 1000
+# How long the bindings wait for new entries before checking again
+WAIT_TIMEOUT = 1.0
+# Longest journalctl output line the daemon accepts (one JSON entry)
+MAX_ENTRY_SIZE = 1024 * 1024
+
+
+def journal_available():
+    """Whether entries can be read from the journal at all"""
+    return SYSTEMD_BINDINGS_AVAILABLE or os.access(JOURNALCTL, os.X_OK)
+
+
+def _text(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, list):
+        # journalctl -o json writes fields that aren't valid UTF-8 as byte arrays
+        return bytes(value).decode('utf-8', errors='replace')
+    return '' if value is None else str(value)
+
+
+def entry_line(entry):
+    """
+    Syslog-style line for a journal entry, e.g.
+    "2026-03-03T09:15:42.123456+00:00 web1 sshd[811]: Accepted publickey for ..."
+
+    Args:
+        entry: journal entry, from journalctl -o json (strings) or the bindings (typed values)
+    """
+    realtime = entry.get('__REALTIME_TIMESTAMP')
+    if isinstance(realtime, datetime):
+        # The bindings give local time
+        stamp = (realtime if realtime.tzinfo else realtime.astimezone()).isoformat()
+    elif realtime:
+        stamp = datetime.fromtimestamp(int(realtime) / 1000000, timezone.utc).isoformat()
+    else:
+        stamp = datetime.now().astimezone().isoformat()
+    identifier = _text(entry.get('SYSLOG_IDENTIFIER') or entry.get('_COMM') or 'unknown')
+    pid = _text(entry.get('SYSLOG_PID') or entry.get('_PID'))
+    tag = f"{identifier}[{pid}]" if pid else identifier
+    return f"{stamp} {_text(entry.get('_HOSTNAME')) or '-'} {tag}: {_text(entry.get('MESSAGE'))}"
+
+
+def read_cursor(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class JournalReader:
+    """Follow the journal entries selected by matches, handing each to on_line
+
+    The position is a journal cursor kept in cursor_file, in the format
+    journalctl's --cursor-file uses, and written atomically. Without a
+    cursor, reading starts at the end of the journal: a monitor that has
+    never run doesn't send the journal's whole history.
+
+    read_new_entries() reads what's new once and is all the cron monitors
+    need; the monitor daemon awaits run(), which follows the journal as
+    entries arrive.
+
+    Args:
+        matches: journalctl style "FIELD=value" matches; values of the same
+            field are alternatives, different fields must all match
+        cursor_file: where the cursor is kept
+        on_line: called with each entry as a syslog-style line
+    """
+
+    def __init__(self, matches, cursor_file, on_line):
+        self.matches = list(matches)
+        self.cursor_file = cursor_file
+        self.on_line = on_line
+        self.cursor = read_cursor(cursor_file)
+        self.saved_cursor = self.cursor
+        self.reader = None
+        self.executor = None
+
+    def save_cursor(self):
+        if self.cursor is None or self.cursor == self.saved_cursor:
+            return
+        try:
+            write_atomically(self.cursor_file, self.cursor + '\n')
+            self.saved_cursor = self.cursor
+        except OSError as e:
+            logging.writeToFile(f"Error saving journal cursor to {self.cursor_file}: {str(e)}")
+
+    def _handle(self, entry):
+        cursor = entry.get('__CURSOR')
+        if cursor:
+            self.cursor = _text(cursor)
+        self.on_line(entry_line(entry))
+
+    def read_new_entries(self):
+        """Read the entries added since the cursor; returns how many"""
+        try:
+            if SYSTEMD_BINDINGS_AVAILABLE:
+                count = 0
+                for entry in self._binding_entries(limit=None):
+                    self._handle(entry)
+                    count += 1
+                return count
+            return self._journalctl_once()
+        finally:
+            self.save_cursor()
+
+    async def run(self, stopping):
+        """Follow the journal until the stopping event is set (or the task is cancelled)"""
+        try:
+            if SYSTEMD_BINDINGS_AVAILABLE:
+                await self._follow_bindings(stopping)
+            else:
+                await self._follow_journalctl(stopping)
+        finally:
+            self.save_cursor()
+
+    # systemd Python bindings
+
+    def _open_reader(self):
+        reader = systemd_journal.Reader()
+        for match in self.matches:
+            reader.add_match(match)
+        if self.cursor:
+            reader.seek_cursor(self.cursor)
+            # seek_cursor() lands on the entry already handled; step past it
+            entry = reader.get_next()
+            if entry and not reader.test_cursor(self.cursor):
+                # The cursor's entry was vacuumed; this one is new
+                reader.get_previous()
+        else:
+            reader.seek_tail()
+            reader.get_previous()
+        return reader
+
+    def _binding_entries(self, limit):
+        if self.reader is None:
+            self.reader = self._open_reader()
+        count = 0
+        while limit is None or count < limit:
+            entry = self.reader.get_next()
+            if not entry:
+                return
+            count += 1
+            yield entry
+
+    def _next_batch(self, timeout):
+        """Wait up to timeout for entries and return up to READ_BATCH of them (worker thread)"""
+        entries = list(self._binding_entries(READ_BATCH))
+        if not entries:
+            self.reader.wait(timeout)
+            entries = list(self._binding_entries(READ_BATCH))
+        return entries
+
+    async def _follow_bindings(self, stopping):
+        loop = asyncio.get_running_loop()
+        # sd_journal isn't thread safe; keep the reader on one thread
+        self.executor = self.executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='discord-journal')
+        last_save = time.monotonic()
+        while not stopping.is_set():
+            for entry in await loop.run_in_executor(self.executor, self._next_batch, WAIT_TIMEOUT):
+                self._handle(entry)
+            if time.monotonic() - last_save >= CURSOR_SAVE_INTERVAL:
+                self.save_cursor()
+                last_save = time.monotonic()
+
+    # journalctl
+
+    def _journalctl_command(self, follow):
+        command = [JOURNALCTL, '-o', 'json', '--no-pager', '--cursor-file', self.cursor_file]
+        if follow:
+            command.append('--follow')
+        if self.cursor is None:
+            # Nothing read yet: the daemon starts with what comes next; a
+            # cron run only fetches the latest entry, for its cursor
+            command += ['--lines', '0' if follow else '1']
+        return command + self.matches
+
+    def _journalctl_once(self):
+        fresh = self.cursor is None
+        count = 0
+        with subprocess.Popen(self._journalctl_command(follow=False), stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL) as process:
+            for raw in process.stdout:
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    continue
+                if fresh:
+                    self.cursor = _text(entry.get('__CURSOR')) or None
+                    continue
+                self._handle(entry)
+                count += 1
+        return count
+
+    async def _follow_journalctl(self, stopping):
+        process = await asyncio.create_subprocess_exec(
+            *self._journalctl_command(follow=True),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL, limit=MAX_ENTRY_SIZE
+        )
+        last_save = time.monotonic()
+        try:
+            while not stopping.is_set():
+                raw = await process.stdout.readline()
+                if not raw:
+                    raise RuntimeError(f"journalctl exited with status {await process.wait()}")
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    continue
+                self._handle(entry)
+                if time.monotonic() - last_save >= CURSOR_SAVE_INTERVAL:
+                    self.save_cursor()
+                    last_save = time.monotonic()
+        finally:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+            # journalctl writes the last cursor it printed on exit; put back
+            # the last one actually handled
+            self.saved_cursor = None
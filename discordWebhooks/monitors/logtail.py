@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+"""
+Log tailing for the Discord Webhooks monitors
+Follows logs across rotation and truncation, keeps each monitor's positions
+in a small checkpoint file, and wakes the daemon's tailers through inotify
+when the kernel supports it (polling otherwise)
+"""
+import asyncio
+import collections
+import concurrent.futures
+import ctypes
+import ctypes.util
+import glob
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
+
+# inotify event flags (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+EVENT_HEADER = struct.Struct('iIII')
+
+# How often tailers look at their file without inotify, and as a safety net with it
+POLL_INTERVAL = 1.0
+SAFETY_POLL_INTERVAL = 10.0
+READ_CHUNK = 64 * 1024
+# An unfinished line longer than this is handed on as it is
+MAX_PARTIAL_LINE = 64 * 1024
+# How often the daemon's tailers write their checkpoints while lines keep coming
+CHECKPOINT_INTERVAL = 5.0
+# How often a daemon tailer's reader thread, waiting on the loop, checks whether it was stopped
+HAND_OFF_POLL = 0.5
+# Checkpoint this often (in bytes read) while catching up on a long backlog
+CHECKPOINT_BYTES = 16 * 1024 * 1024
+MB = 1024 * 1024
+
+# What to do with more unread log than max_backlog (WebhookSettings.backlog_policy)
+BACKLOG_SKIP = 'skip'
+BACKLOG_SUMMARIZE = 'summarize'
+BACKLOG_ALL = 'all'
+# Distinct IPs a backlog summary tallies before the rarest are dropped
+MAX_BACKLOG_IPS = 1000
+
+
+class DirectoryWatcher:
+    """Call back when files change, watching their directories with inotify
+
+    Watching the directory rather than the file keeps working across log
+    rotation (the new file shows up as IN_CREATE or IN_MOVED_TO). If
+    inotify can't be set up, available is False and callers poll.
+    """
+
+    def __init__(self):
+        self.fd = None
+        self.directories = {}  # watch descriptor -> directory
+        self.watched = set()
+        self.callbacks = {}  # file path -> callbacks
+        self.loop = None
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+        except (OSError, AttributeError):
+            self.libc = None
+
+    @property
+    def available(self):
+        return self.fd is not None
+
+    def watch(self, path, callback):
+        """Call callback() whenever path is written, created or moved into place"""
+        self.callbacks.setdefault(path, []).append(callback)
+        directory = os.path.dirname(path) or '.'
+        if not self.available or directory in self.watched:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.watched.add(directory)
+            self.directories[wd] = directory
+
+    def start(self, loop):
+        if self.available:
+            self.loop = loop
+            loop.add_reader(self.fd, self._read)
+
+    def close(self):
+        if self.available:
+            if self.loop is not None:
+                self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; wake everyone
+                changed.update(self.callbacks)
+            elif wd in self.directories and name:
+                changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+
+        for path in changed:
+            for callback in self.callbacks.get(path, ()):
+                callback()
+
+
+def write_atomically(path, text):
+    """Replace path with text through a temporary file, so readers never see half of it"""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class CheckpointStore:
+    """Where each followed log was read up to, kept in one JSON file
+
+    A checkpoint is the file's device and inode, the offset read up to and
+    any unfinished last line, so a reader can tell a rotated or truncated
+    log from one that grew. save() writes a temporary file and renames it
+    over the old one, so a crash never leaves a half-written store, and
+    does nothing when no checkpoint changed. Store files from older
+    versions ("path:offset" lines) are read as offsets without an inode.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoints = self._load()
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = f.read()
+        except OSError:
+            return {}
+        try:
+            checkpoints = json.loads(data)
+            return checkpoints if isinstance(checkpoints, dict) else {}
+        except ValueError:
+            pass
+        checkpoints = {}
+        for line in data.splitlines():
+            log_path, _, offset = line.strip().rpartition(':')
+            if log_path and offset.isdigit():
+                checkpoints[log_path] = {'offset': int(offset)}
+        return checkpoints
+
+    def get(self, log_path):
+        return self.checkpoints.get(log_path)
+
+    def set(self, log_path, dev, ino, offset, partial=b''):
+        checkpoint = {
+            'dev': dev,
+            'ino': ino,
+            'offset': offset,
+            # surrogateescape keeps bytes that aren't UTF-8 through the JSON round trip
+            'partial': partial.decode('utf-8', errors='surrogateescape'),
+        }
+        if self.checkpoints.get(log_path) != checkpoint:
+            self.checkpoints[log_path] = checkpoint
+            self.dirty = True
+
+    def save(self):
+        """Write the store if anything changed; False if it couldn't be written"""
+        if not self.dirty:
+            return True
+        try:
+            write_atomically(self.path, json.dumps(self.checkpoints, separators=(',', ':')))
+        except OSError as e:
+            logging.writeToFile(f"Error saving log checkpoints to {self.path}: {str(e)}")
+            return False
+        self.dirty = False
+        return True
+
+
+class BacklogCounter:
+    """Tally the events in a backlog too large to notify line by line
+
+    Memory stays bounded however large the backlog: only counts are kept,
+    and past 2 * max_ips distinct IPs the tally is cut back to the
+    max_ips most frequent.
+
+    Args:
+        parse: called with each line; returns (event label, ip) or None
+        report: called as report(path, size, events, ips) with the counts
+            once a backlog holding any events has been read
+    """
+
+    def __init__(self, parse, report, max_ips=MAX_BACKLOG_IPS):
+        self.parse = parse
+        self.report = report
+        self.max_ips = max_ips
+        self.events = collections.Counter()
+        self.ips = collections.Counter()
+
+    def add(self, line):
+        parsed = self.parse(line)
+        if parsed is None:
+            return
+        label, ip = parsed
+        self.events[label] += 1
+        self.ips[ip] += 1
+        if len(self.ips) > 2 * self.max_ips:
+            self.ips = collections.Counter(dict(self.ips.most_common(self.max_ips)))
+
+    def finish(self, path, size):
+        if self.events:
+            self.report(path, size, dict(self.events), dict(self.ips))
+        self.events, self.ips = collections.Counter(), collections.Counter()
+
+
+def rotated_candidates(path):
+    """Where logrotate may have moved path: path.1, or path-YYYYMMDD with dateext"""
+    candidates = [f'{path}.1']
+    candidates += sorted(
+        (name for name in glob.glob(f'{glob.escape(path)}-*') if not name.endswith(('.gz', '.xz', '.bz2', '.zst'))),
+        reverse=True
+    )
+    return candidates
+
+
+class LogTailer:
+    """Follow one log file and hand each new complete line to on_line
+
+    Positions are kept in a CheckpointStore as (device, inode, offset,
+    unfinished line). When the log has been rotated, the rest of the old
+    file is read first from wherever logrotate moved it (found by its
+    inode), then the new file from the start. When it has been truncated
+    in place (copytruncate), the tail of the copy in path.1 is read before
+    starting again at offset 0. Without a checkpoint the tailer starts at
+    the end of the file, or at the start with from_start.
+
+    Lines are streamed a chunk at a time and the checkpoint is saved every
+    CHECKPOINT_BYTES, so catching up after a long outage neither loads the
+    log into memory nor starts over if interrupted. When more than
+    max_backlog bytes are waiting, backlog_policy decides what happens to
+    them: BACKLOG_SKIP jumps to the end of the log, BACKLOG_SUMMARIZE
+    feeds them to the backlog BacklogCounter instead of on_line, and
+    BACKLOG_ALL reads them as usual.
+
+    read_new_lines() reads once and is all the cron monitors need; the
+    monitor daemon awaits run(), which reads whenever the watcher reports
+    a change (or the poll interval passes without inotify). run() reads on
+    a worker thread and hands the lines back to the event loop a chunk at
+    a time, so a long catch-up never blocks the loop; the next chunk isn't
+    read until the loop has handled the last one and awaited throttle().
+
+    Args:
+        path: log file to follow
+        checkpoints: CheckpointStore holding this file's position
+        on_line: called with each line (str, without the newline)
+        throttle: coroutine function run() awaits after each chunk, to hold
+            reading back while whatever the lines led to catches up
+    """
+
+    def __init__(self, path, checkpoints, on_line, watcher=None, from_start=False,
+                 max_backlog=None, backlog_policy=BACKLOG_ALL, backlog=None, throttle=None):
+        self.path = path
+        self.checkpoints = checkpoints
+        self.on_line = on_line
+        self.from_start = from_start
+        self.max_backlog = max_backlog
+        self.backlog_policy = backlog_policy
+        self.backlog = backlog
+        self.throttle = throttle
+        self.wakeup = asyncio.Event()
+        self.watcher = watcher
+        if watcher is not None:
+            watcher.watch(path, self.wakeup.set)
+        self.loop = None  # set while run() reads on the worker thread
+        self.stopped = threading.Event()
+        self.executor = None
+
+    async def run(self, stopping):
+        """Tail until the stopping event is set"""
+        interval = SAFETY_POLL_INTERVAL if self.watcher is not None and self.watcher.available else POLL_INTERVAL
+        self.loop = asyncio.get_running_loop()
+        self.stopped.clear()
+        self.executor = self.executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='discord-logtail')
+        last_save = time.monotonic()
+        reading = None
+        try:
+            while not stopping.is_set():
+                self.wakeup.clear()
+                reading = self.executor.submit(self.read_new_lines)
+                await asyncio.wrap_future(reading)
+                if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+                    self.checkpoints.save()
+                    last_save = time.monotonic()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # A read still going gives up at its next hand-off
+            self.stopped.set()
+            if reading is not None and not reading.done():
+                await asyncio.wait([asyncio.wrap_future(reading)])
+            self.loop = None
+            self.checkpoints.save()
+
+    async def _handle_lines(self, handle, lines):
+        for line in lines:
+            handle(line)
+        if self.throttle is not None:
+            await self.throttle()
+
+    def _hand_on(self, handle, lines):
+        """Handle a chunk's lines: here for read_new_lines(), on the loop when run() reads on its worker thread"""
+        if self.loop is None:
+            for line in lines:
+                handle(line)
+            return
+        handled = asyncio.run_coroutine_threadsafe(self._handle_lines(handle, lines), self.loop)
+        while True:
+            try:
+                return handled.result(HAND_OFF_POLL)
+            except concurrent.futures.TimeoutError:
+                if self.stopped.is_set():
+                    handled.cancel()
+                    raise
+
+    def read_new_lines(self):
+        """Read whatever was written since the checkpoint; returns the number of lines"""
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return 0
+        with f:
+            # Stat what was opened, so a rotation in between can't mix up two files
+            stat = os.fstat(f.fileno())
+            checkpoint = self.checkpoints.get(self.path)
+            if checkpoint is None:
+                if not self.from_start:
+                    self.checkpoints.set(self.path, stat.st_dev, stat.st_ino, stat.st_size)
+                    return 0
+                checkpoint = {'dev': stat.st_dev, 'ino': stat.st_ino, 'offset': 0}
+
+            offset = checkpoint['offset']
+            partial = checkpoint.get('partial', '').encode('utf-8', errors='surrogateescape')
+            old_file = None  # rotated or copied file holding the lines after offset
+            # Checkpoints from before inodes were recorded match whatever file is there now
+            if checkpoint.get('ino') is not None and (checkpoint['dev'], checkpoint['ino']) != (stat.st_dev, stat.st_ino):
+                old_file = self._find_rotated(checkpoint['dev'], checkpoint['ino'])
+                if old_file is None:
+                    logging.writeToFile(f"{self.path} was rotated and the old file wasn't found; its last lines were skipped")
+                    offset, partial = 0, b''
+            elif stat.st_size < offset:
+                copy = f'{self.path}.1'
+                try:
+                    copied = os.path.getsize(copy) >= offset
+                except OSError:
+                    copied = False
+                if copied:
+                    # copytruncate: the lines written since the last read are in the copy
+                    old_file = copy
+                else:
+                    offset, partial = 0, b''
+
+            backlog = stat.st_size - (offset if old_file is None else 0)
+            if old_file is not None:
+                try:
+                    backlog += max(0, os.path.getsize(old_file) - offset)
+                except OSError:
+                    pass
+            policy = BACKLOG_ALL
+            if self.max_backlog is not None and backlog > self.max_backlog:
+                policy = self.backlog_policy
+                if policy == BACKLOG_SUMMARIZE and self.backlog is None:
+                    policy = BACKLOG_SKIP
+
+            if policy == BACKLOG_SKIP:
+                logging.writeToFile(
+                    f"Skipped {backlog / MB:.1f} MB of unread {self.path} (more than {self.max_backlog / MB:.0f} MB backlog)"
+                )
+                self.checkpoints.set(self.path, stat.st_dev, stat.st_ino, self._line_start(f, stat.st_size))
+                return 0
+            if policy == BACKLOG_SUMMARIZE:
+                logging.writeToFile(f"Summarizing {backlog / MB:.1f} MB of unread {self.path}")
+            handle = self.backlog.add if policy == BACKLOG_SUMMARIZE else self.on_line
+
+            count = 0
+            if old_file is not None:
+                count += self._read_file(old_file, offset, partial, handle)
+                offset, partial = 0, b''
+            summarize = policy == BACKLOG_SUMMARIZE
+            offset, partial, read = self._read(f, stat, offset, partial, handle, end=stat.st_size if summarize else None)
+            count += read
+            if summarize:
+                self.backlog.finish(self.path, backlog)
+                # Whatever was written while the backlog was read is handled as usual
+                offset, partial, read = self._read(f, stat, offset, partial, self.on_line)
+                count += read
+            self.checkpoints.set(self.path, stat.st_dev, stat.st_ino, offset, partial)
+        return count
+
+    def _find_rotated(self, dev, ino):
+        for candidate in rotated_candidates(self.path):
+            try:
+                stat = os.stat(candidate)
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) == (dev, ino):
+                return candidate
+        return None
+
+    def _line_start(self, f, size):
+        """Offset of the first line starting at or before size, so a skip doesn't land mid-line"""
+        start = max(0, size - READ_CHUNK)
+        f.seek(start)
+        newline = f.read(size - start).rfind(b'\n')
+        return start + newline + 1 if newline >= 0 else size
+
+    def _read_file(self, path, offset, partial, handle):
+        """Hand on the rest of a rotated file, including an unfinished last line"""
+        try:
+            with open(path, 'rb') as f:
+                _, partial, count = self._read(f, os.fstat(f.fileno()), offset, partial, handle)
+        except OSError as e:
+            logging.writeToFile(f"Error reading {path}: {str(e)}")
+            return 0
+        if partial:
+            # Nothing more will be appended to it
+            count += 1
+            self._hand_on(handle, [partial.decode('utf-8', errors='replace')])
+        return count
+
+    def _read(self, f, stat, offset, partial, handle, end=None):
+        """
+        Hand on the lines in f after offset, a chunk at a time
+
+        Args:
+            stat: f's stat, for the checkpoints saved along the way
+            end: stop reading at this offset rather than the end of the file
+
+        Returns:
+            tuple: (new offset, unfinished line, lines read)
+        """
+        count = 0
+        saved = offset
+        f.seek(offset)
+        while end is None or offset < end:
+            chunk = f.read(READ_CHUNK if end is None else min(READ_CHUNK, end - offset))
+            if not chunk:
+                break
+            offset += len(chunk)
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            if len(partial) > MAX_PARTIAL_LINE:
+                lines.append(partial)
+                partial = b''
+            count += len(lines)
+            self._hand_on(handle, [line.decode('utf-8', errors='replace') for line in lines])
+            if offset - saved >= CHECKPOINT_BYTES:
+                self.checkpoints.set(self.path, stat.st_dev, stat.st_ino, offset, partial)
+                self.checkpoints.save()
+                saved = offset
+        return offset, partial, count
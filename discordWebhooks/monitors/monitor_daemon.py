@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Unified Monitor Daemon for Discord Webhooks Plugin
+Runs the SSH login, security warning and server usage monitors as coroutines
+in one long-lived process, instead of one cron-started interpreter each
+
+Usage (normally from the discord-webhooks-monitor systemd unit):
+    python monitor_daemon.py
+
+Send SIGUSR1 to log the delivery queue and Discord rate limit state.
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path for imports
+sys.path.insert(0, '/usr/local/CyberCP')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CyberCP.settings')
+
+import django
+from django.apps import apps
+if not apps.ready:
+    django.setup()
+
+from django.db import close_old_connections
+from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
+from discordWebhooks.models import DiscordWebhook, WebhookSettings
+from discordWebhooks.signals import SETTINGS_STAMP_FILE
+from discordWebhooks.batching import EventBatcher
+from discordWebhooks.delivery import get_delivery
+from discordWebhooks.utils import (
+    format_server_usage_embed,
+    check_server_usage_thresholds
+)
+from discordWebhooks.monitors import ssh_monitor, security_monitor, server_usage_monitor
+from discordWebhooks.monitors.journal import JournalReader, journal_available
+from discordWebhooks.monitors.logtail import CheckpointStore, DirectoryWatcher, LogTailer, MB
+
+# Full settings reload even without a change notification (e.g. queryset.update())
+SETTINGS_REFRESH_INTERVAL = 60
+# How often server metrics are sampled; notifications still honour check_interval
+USAGE_SAMPLE_INTERVAL = 10
+# How long shutdown waits for queued webhook messages
+SHUTDOWN_FLUSH_TIMEOUT = 10
+# Notifications waiting for the database thread before log reading holds back
+MAX_PENDING_ENQUEUES = 100
+# Pause before restarting a monitor loop that crashed
+RESTART_DELAY = 5
+
+
+class MonitorDaemon:
+    """Host every monitor in one asyncio loop
+
+    Settings and the enabled webhooks are read once and cached; the cache
+    is reloaded when the settings stamp file changes (the plugin's signals
+    write it on every save) and on a timer. Log monitors are woken by
+    inotify as soon as their file grows, so an SSH login or fail2ban ban
+    reaches Discord within the batcher's short batch delay; repeats of an
+    event are summarized once per aggregation window.
+
+    Log reading, database access (including queueing notifications in the
+    outbox) and metric sampling run on worker threads, so the loop itself
+    never blocks; when queueing falls behind, log reading waits for it.
+    """
+
+    def __init__(self):
+        self.settings = None
+        self.webhooks = []
+        self.stopping = None
+        self.settings_changed = None
+        self.watcher = DirectoryWatcher()
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='discord-monitor-db')
+        self.metrics_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='discord-monitor-metrics')
+        self.delivery = get_delivery()
+        self.batcher = EventBatcher(self._send_batch)
+        self.pending = set()
+        self.tailers = {}  # log path -> LogTailer
+        self.batch_due = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.settings_changed = asyncio.Event()
+        self.batch_due = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stopping.set)
+        loop.add_signal_handler(signal.SIGUSR1, self.log_delivery_stats)
+        # Send what earlier runs left in the outbox
+        self.delivery.start()
+
+        await self.refresh_settings()
+        self.watcher.watch(SETTINGS_STAMP_FILE, self.settings_changed.set)
+        self.watcher.start(loop)
+        logging.writeToFile(
+            f"Discord monitor daemon started ({'inotify' if self.watcher.available else 'polling'})"
+        )
+
+        tasks = [
+            asyncio.ensure_future(self.supervise('settings', self.settings_loop)),
+            asyncio.ensure_future(self.supervise('batch', self.batch_loop)),
+            asyncio.ensure_future(self.supervise('ssh', self.ssh_loop)),
+            asyncio.ensure_future(self.supervise('security', self.security_loop)),
+            asyncio.ensure_future(self.supervise('server usage', self.server_usage_loop)),
+        ]
+        await self.stopping.wait()
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.batcher.flush()
+        if self.pending:
+            await asyncio.wait(self.pending)
+        await loop.run_in_executor(None, self.delivery.close, SHUTDOWN_FLUSH_TIMEOUT)
+        self.watcher.close()
+        self.db_executor.shutdown()
+        self.metrics_executor.shutdown()
+        logging.writeToFile("Discord monitor daemon stopped")
+
+    def _db(self, func, *args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    async def refresh_settings(self):
+        def load():
+            return WebhookSettings.get_settings(), list(DiscordWebhook.objects.filter(enabled=True))
+
+        try:
+            self.settings, self.webhooks = await asyncio.get_running_loop().run_in_executor(
+                self.db_executor, self._db, load
+            )
+            self.batcher.window = self.settings.aggregation_window
+            for tailer in self.tailers.values():
+                self._apply_backlog_settings(tailer)
+        except Exception as e:
+            logging.writeToFile(f"Discord monitor daemon settings error: {str(e)}")
+
+    async def settings_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.settings_changed.wait(), SETTINGS_REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.settings_changed.clear()
+            await self.refresh_settings()
+
+    def _enqueue(self, embed, webhooks):
+        try:
+            return self._db(self.delivery.enqueue, embed, webhooks)
+        except Exception as e:
+            logging.writeToFile(f"Discord monitor daemon outbox error: {str(e)}")
+            return 0
+
+    def notify(self, embed, description):
+        """Queue an embed for the cached webhooks; returns a future of how many it was queued for"""
+        loop = asyncio.get_running_loop()
+        webhooks = list(self.webhooks)
+        if not webhooks:
+            future = loop.create_future()
+            future.set_result(0)
+            return future
+        # Queueing writes to the outbox, so it runs on the database thread
+        future = loop.run_in_executor(self.db_executor, self._enqueue, embed, webhooks)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        logging.writeToFile(f"{description} notification queued")
+        return future
+
+    async def wait_for_room(self):
+        """Wait until fewer than MAX_PENDING_ENQUEUES notifications are waiting to be queued"""
+        while len(self.pending) >= MAX_PENDING_ENQUEUES:
+            await asyncio.wait(list(self.pending), return_when=asyncio.FIRST_COMPLETED)
+
+    def queue_event(self, notification):
+        """Hand an event to the batcher (see ssh_monitor.login_notification)"""
+        self.batcher.add(**notification)
+        self.batch_due.set()
+
+    def _send_batch(self, embeds):
+        self.notify({'embeds': embeds}, f"Batch of {len(embeds)}")
+
+    async def batch_loop(self):
+        while True:
+            delay = self.batcher.poll()
+            self.batch_due.clear()
+            try:
+                await asyncio.wait_for(self.batch_due.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def log_delivery_stats(self):
+        logging.writeToFile(f"Discord webhook delivery: {json.dumps(self.delivery.stats())}")
+
+    def _apply_backlog_settings(self, tailer):
+        if self.settings is not None:
+            tailer.max_backlog = self.settings.max_backlog_mb * MB
+            tailer.backlog_policy = self.settings.backlog_policy
+
+    def _guarded(self, source, on_line):
+        def handle(line):
+            try:
+                on_line(line)
+            except Exception as e:
+                logging.writeToFile(f"Discord monitor daemon error on {source}: {str(e)}")
+        return handle
+
+    def _tailer(self, path, monitor, on_line, enabled):
+        """Tailer resuming from the cron monitor's checkpoint; a fresh install starts at the end"""
+        def send_summary(embed):
+            if enabled():
+                self.queue_event({'embed': embed})
+
+        backlog = monitor.backlog_counter(send_summary)
+        tailer = LogTailer(path, CheckpointStore(monitor.STATE_FILE), self._guarded(path, on_line), self.watcher,
+                           backlog=backlog, throttle=self.wait_for_room)
+        self._apply_backlog_settings(tailer)
+        self.tailers[path] = tailer
+        return tailer
+
+    async def supervise(self, name, coroutine_function):
+        """Run a monitor loop, restarting it if it crashes"""
+        while True:
+            try:
+                await coroutine_function()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.writeToFile(f"Discord monitor daemon {name} loop error: {str(e)}")
+                await asyncio.sleep(RESTART_DELAY)
+
+    def _journal_reader(self, matches, cursor_file, on_line):
+        """Journal reader sharing the cron monitor's cursor"""
+        return JournalReader(matches, cursor_file, self._guarded('the journal', on_line))
+
+    async def ssh_loop(self):
+        log_path = ssh_monitor.get_ssh_log_path()
+        while log_path is None and not journal_available():
+            await asyncio.sleep(SETTINGS_REFRESH_INTERVAL)
+            log_path = ssh_monitor.get_ssh_log_path()
+
+        def enabled():
+            return self.settings is not None and self.settings.ssh_logins_enabled
+
+        def on_line(line):
+            if not enabled():
+                return
+            login_info = ssh_monitor.parse_ssh_log_line(line)
+            if login_info:
+                self.queue_event(ssh_monitor.login_notification(login_info))
+
+        if log_path is None:
+            reader = self._journal_reader(ssh_monitor.JOURNAL_MATCHES, ssh_monitor.CURSOR_FILE, on_line)
+            await reader.run(self.stopping)
+            return
+        tailer = self._tailer(log_path, ssh_monitor, on_line, enabled)
+        await tailer.run(self.stopping)
+
+    async def security_loop(self):
+        def enabled():
+            return self.settings is not None and self.settings.security_warnings_enabled
+
+        def on_line(line):
+            if not enabled():
+                return
+            event = security_monitor.parse_fail2ban_line(line)
+            if event:
+                self.queue_event(security_monitor.security_notification(event))
+
+        if not os.path.exists(security_monitor.FAIL2BAN_LOG) and journal_available():
+            reader = self._journal_reader(
+                security_monitor.FAIL2BAN_JOURNAL_MATCHES, security_monitor.CURSOR_FILE, on_line
+            )
+            await reader.run(self.stopping)
+            return
+        tailer = self._tailer(security_monitor.FAIL2BAN_LOG, security_monitor, on_line, enabled)
+        await tailer.run(self.stopping)
+
+    async def server_usage_loop(self):
+        loop = asyncio.get_running_loop()
+        last_notification = server_usage_monitor.get_last_notification_time()
+        # Continue the window the cron monitor (or an earlier daemon) left
+        sampler = await loop.run_in_executor(
+            self.metrics_executor, server_usage_monitor.load_sampler, USAGE_SAMPLE_INTERVAL
+        )
+        try:
+            while True:
+                settings = self.settings
+                if settings is not None and settings.server_usage_enabled:
+                    # Sampling doesn't wait, but psutil still reads /proc; keep it off the loop
+                    await loop.run_in_executor(self.metrics_executor, sampler.sample)
+                if settings is not None and settings.server_usage_enabled and self.webhooks:
+                    filtered_metrics, measured = server_usage_monitor.usage_metrics(sampler, settings)
+                    should_notify = bool(filtered_metrics) and (
+                        not settings.server_usage_threshold_mode or check_server_usage_thresholds(settings, filtered_metrics)
+                    )
+                    if should_notify and time.time() - last_notification >= settings.check_interval * 60:
+                        embed = format_server_usage_embed(
+                            metrics=filtered_metrics,
+                            threshold_mode=settings.server_usage_threshold_mode,
+                            measured=measured
+                        )
+                        if await self.notify(embed, 'Server usage'):
+                            last_notification = time.time()
+                            server_usage_monitor.save_last_notification_time()
+                await asyncio.sleep(USAGE_SAMPLE_INTERVAL)
+        finally:
+            sampler.save()
+
+
+def main():
+    asyncio.run(MonitorDaemon().run())
+
+
+if __name__ == '__main__':
+    main()
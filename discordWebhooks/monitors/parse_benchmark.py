@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+SSH log parsing benchmark for Discord Webhooks Plugin
+Writes a synthetic auth log of a server under SSH brute force and reports
+how many lines a second the SSH monitor reads and parses, next to the
+pattern-by-pattern search it replaced
+
+Usage:
+    python parse_benchmark.py [lines]    (default 10,000,000)
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '/usr/local/CyberCP')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CyberCP.settings')
+
+import django
+django.setup()
+
+from discordWebhooks.monitors.logtail import CheckpointStore, LogTailer
+from discordWebhooks.monitors.ssh_monitor import parse_ssh_log_line
+
+# One brute-force attempt as sshd logs it, plus the noise around it
+ATTEMPT = [
+    'Jan 12 03:14:{second:02d} web1 sshd[{pid}]: Invalid user admin{n} from 203.0.{a}.{b} port {port}',
+    'Jan 12 03:14:{second:02d} web1 sshd[{pid}]: pam_unix(sshd:auth): check pass; user unknown',
+    'Jan 12 03:14:{second:02d} web1 sshd[{pid}]: Failed password for invalid user admin{n} from 203.0.{a}.{b} port {port} ssh2',
+    'Jan 12 03:14:{second:02d} web1 sshd[{pid}]: Received disconnect from 203.0.{a}.{b} port {port}:11: Bye Bye [preauth]',
+    'Jan 12 03:14:{second:02d} web1 sshd[{pid}]: Disconnected from invalid user admin{n} 203.0.{a}.{b} port {port} [preauth]',
+    'Jan 12 03:14:{second:02d} web1 systemd[1]: session-{n}.scope: Deactivated successfully.',
+]
+LOGIN = 'Jan 12 03:14:{second:02d} web1 sshd[{pid}]: Accepted publickey for deploy from 198.51.100.7 port {port} ssh2'
+
+# How the monitor matched lines before: every pattern, uncompiled, on every line
+LEGACY_PATTERNS = [
+    r'Accepted (?:publickey|password|keyboard-interactive) for (\S+) from (\S+) port \d+',
+    r'Failed (?:password|publickey) for (\S+) from (\S+) port \d+',
+]
+
+
+def legacy_parse(line):
+    for pattern in LEGACY_PATTERNS:
+        match = re.search(pattern, line)
+        if match:
+            return match.group(1), match.group(2)
+    return None
+
+
+def write_log(path, lines):
+    with open(path, 'w') as f:
+        written = n = 0
+        while written < lines:
+            values = {'second': n % 60, 'pid': 1000 + n % 30000, 'n': n, 'a': n // 256 % 256, 'b': n % 256,
+                      'port': 1024 + n % 60000}
+            templates = ATTEMPT + [LOGIN] if n % 100 == 0 else ATTEMPT
+            for template in templates[:lines - written]:
+                f.write(template.format(**values) + '\n')
+            written += len(templates[:lines - written])
+            n += 1
+
+
+def run(path, state, parse):
+    matched = [0]
+
+    def on_line(line):
+        if parse(line):
+            matched[0] += 1
+
+    start = time.monotonic()
+    lines = LogTailer(path, CheckpointStore(state), on_line, from_start=True).read_new_lines()
+    return lines, matched[0], time.monotonic() - start
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'secure')
+        print(f"Writing {lines:,} lines...")
+        write_log(path, lines)
+        print(f"{os.path.getsize(path) / (1024 * 1024):.0f} MB")
+        for name, parse in (('parse_ssh_log_line', parse_ssh_log_line), ('per-pattern re.search', legacy_parse)):
+            read, matched, elapsed = run(path, os.path.join(directory, name + '.state'), parse)
+            print(f"{name}: {read:,} lines, {matched:,} logins in {elapsed:.1f}s = {read / elapsed:,.0f} lines/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Log line parsing for the Discord Webhooks monitors
+Matches a line against all of a monitor's patterns with one compiled regex,
+after a substring check that lets most lines skip the regex entirely, and
+reads the line's own timestamp
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+MONTHS = {name: number for number, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1
+)}
+
+# "2026-01-31T23:59:59.123456+01:00" (rsyslog's high precision format) or
+# "2026-01-31 23:59:59,123" (fail2ban)
+ISO_TIMESTAMP = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:[.,](\d{1,6})\d*)?(Z|[+-]\d\d:?\d\d)?'
+)
+
+
+class MultiPattern:
+    """Match a line against several named patterns in one regex search
+
+    The patterns are joined into a single alternation and their named
+    groups renamed so they can't clash; which pattern matched is told by
+    the last group that took part in the match. A line only reaches the
+    regex if it contains one of the prefilter substrings (when any are
+    given); on a busy server almost every line is turned away by that
+    check alone.
+
+    Args:
+        patterns: dict of name -> regex using (?P<group>...) for the values
+            wanted (at least one) and (?:...) for any other grouping
+        prefilter: substrings at least one of which every matching line contains
+    """
+
+    def __init__(self, patterns, prefilter=()):
+        alternatives = []
+        for name, pattern in patterns.items():
+            # No group around each alternative: it would stop re from skipping
+            # ahead to the patterns' first characters
+            alternatives.append(re.sub(r'\(\?P<(\w+)>', lambda m: f'(?P<{name}__{m.group(1)}>', pattern))
+        self.regex = re.compile('|'.join(alternatives))
+        self.groups = {}  # group number -> (pattern name, [(group, number) of that pattern])
+        by_pattern = {}
+        for renamed, number in sorted(self.regex.groupindex.items(), key=lambda item: item[1]):
+            name, group = renamed.split('__', 1)
+            by_pattern.setdefault(name, []).append((group, number))
+        for name, groups in by_pattern.items():
+            for _, number in groups:
+                self.groups[number] = (name, groups)
+        self.prefilter = tuple(prefilter)
+
+    def match(self, line):
+        """
+        Find the first pattern matching in line
+
+        Returns:
+            tuple: (pattern name, dict of its groups), or None
+        """
+        if self.prefilter:
+            for text in self.prefilter:
+                if text in line:
+                    break
+            else:
+                return None
+        match = self.regex.search(line)
+        if match is None or match.lastindex is None:
+            return None
+        name, groups = self.groups[match.lastindex]
+        return name, {group: match.group(number) for group, number in groups}
+
+
+class TimestampParser:
+    """Read the timestamp at the start of a log line
+
+    Understands traditional syslog ("Jan  5 13:45:01", with the year taken
+    from the clock, or last year's for a date in the future) and ISO 8601
+    stamps with an optional fraction and offset. Times come back as naive
+    local datetimes, like datetime.now(). The last stamp is cached, since
+    runs of lines share the same second.
+    """
+
+    def __init__(self, now=datetime.now):
+        self.now = now
+        self.cached_text = None
+        self.cached_value = None
+        self.minute_text = None
+        self.minute_value = None
+
+    def parse(self, line):
+        """The line's timestamp, or None if it doesn't start with one"""
+        if line[:1].isdigit():
+            return self._parse_iso(line)
+        text = line[:15]
+        if text == self.cached_text:
+            return self.cached_value
+        if text[12:13] != ':' or not text[13:15].isdigit():
+            return None
+        if text[:12] != self.minute_text:
+            # Working out the date (and year) is the slow part; do it once a minute
+            minute = self._parse_minute(text[:12])
+            if minute is None:
+                return None
+            self.minute_text, self.minute_value = text[:12], minute
+        try:
+            value = self.minute_value.replace(second=int(text[13:15]))
+        except ValueError:
+            return None
+        self.cached_text, self.cached_value = text, value
+        return value
+
+    def _parse_minute(self, text):
+        month = MONTHS.get(text[:3])
+        if month is None or text[3:4] != ' ' or text[9:10] != ':':
+            return None
+        try:
+            day, hour, minute = int(text[4:6]), int(text[7:9]), int(text[10:12])
+            now = self.now()
+            value = datetime(now.year, month, day, hour, minute)
+            if value - now > timedelta(days=1):
+                # December's lines read in January
+                value = value.replace(year=now.year - 1)
+        except ValueError:
+            return None
+        return value
+
+    def _parse_iso(self, line):
+        match = ISO_TIMESTAMP.match(line)
+        if match is None:
+            return None
+        text = match.group(0)
+        if text == self.cached_text:
+            return self.cached_value
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        try:
+            value = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                             int(fraction.ljust(6, '0')) if fraction else 0)
+            if offset:
+                if offset == 'Z':
+                    offset = '+00:00'
+                offset = offset.replace(':', '')
+                delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+                utc = value - delta if offset[0] == '+' else value + delta
+                value = utc.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        except ValueError:
+            return None
+        self.cached_text, self.cached_value = text, value
+        return value
+
@@ -4,7 +4,6 @@ Security Warning Monitor for Discord Webhooks Plugin
 Monitors security-related logs (fail2ban, firewall, etc.) and sends notifications
 """
 import os
-import re
 import sys
 import time
 from datetime import datetime
@@ -14,118 +13,142 @@ sys.path.insert(0, '/usr/local/CyberCP')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CyberCP.settings')
 
 import django
-django.setup()
+from django.apps import apps
+if not apps.ready:
+    # Also imported by the monitor daemon, which has already set Django up
+    django.setup()
 
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
 from discordWebhooks.models import DiscordWebhook, WebhookSettings
-from discordWebhooks.utils import send_to_all_webhooks, format_security_warning_embed
+from discordWebhooks.batching import EventBatcher
+from discordWebhooks.delivery import get_delivery, EXIT_FLUSH_TIMEOUT
+from discordWebhooks.monitors.journal import JournalReader, journal_available
+from discordWebhooks.monitors.logtail import BacklogCounter, CheckpointStore, LogTailer, MB
+from discordWebhooks.monitors.parsing import MultiPattern, TimestampParser
+from discordWebhooks.utils import format_security_warning_embed, format_security_summary_embed, format_backlog_summary_embed
 
 # Security log file paths
 FAIL2BAN_LOG = '/var/log/fail2ban.log'
 FIREWALL_LOG = '/var/log/messages'  # On RHEL/AlmaLinux, firewall logs may be in messages
 
-# State file to track last read position
+# Checkpoint store tracking how far each log was read
 STATE_FILE = '/tmp/discord_webhooks_security_monitor.state'
 
-# Security event patterns
-FAIL2BAN_BAN_PATTERN = r'\[(?P<jail>\S+)\].*Ban (?P<ip>\S+)'
-FAIL2BAN_UNBAN_PATTERN = r'\[(?P<jail>\S+)\].*Unban (?P<ip>\S+)'
+# fail2ban logging to the journal (logtarget = SYSTEMD-JOURNAL) has no log
+# file; its entries are read from the position kept in CURSOR_FILE
+FAIL2BAN_JOURNAL_MATCHES = ['_SYSTEMD_UNIT=fail2ban.service']
+CURSOR_FILE = '/tmp/discord_webhooks_security_monitor.cursor'
 
-def get_last_position(log_path):
-    """Get the last read position from state file"""
-    try:
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r') as f:
-                lines = f.readlines()
-                for line in lines:
-                    data = line.strip().split(':')
-                    if len(data) == 2 and data[0] == log_path:
-                        return int(data[1])
-    except Exception as e:
-        logging.writeToFile(f"Error reading state file: {str(e)}")
-    return 0
-
-def save_last_position(log_path, position):
-    """Save the last read position to state file"""
-    try:
-        # Read existing positions
-        positions = {}
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r') as f:
-                for line in f:
-                    data = line.strip().split(':')
-                    if len(data) == 2:
-                        positions[data[0]] = data[1]
-        
-        # Update position for this log
-        positions[log_path] = str(position)
-        
-        # Write all positions
-        with open(STATE_FILE, 'w') as f:
-            for path, pos in positions.items():
-                f.write(f"{path}:{pos}\n")
-    except Exception as e:
-        logging.writeToFile(f"Error saving state file: {str(e)}")
+# Security event patterns, matched in one pass. The jail is the bracketed
+# name right before the action, not fail2ban's "[pid]:" earlier in the line
+FAIL2BAN_PATTERNS = {
+    'fail2ban_ban': r'\[(?P<jail>[^\]\s]+)\]\s+(?:Restore )?Ban (?P<ip>\S+)',
+    'fail2ban_unban': r'\[(?P<jail>[^\]\s]+)\]\s+Unban (?P<ip>\S+)',
+}
+FAIL2BAN_MATCHER = MultiPattern(FAIL2BAN_PATTERNS, prefilter=('Ban ', 'Unban '))
+TIMESTAMPS = TimestampParser()
 
 def parse_fail2ban_line(line):
     """Parse a fail2ban log line"""
-    # Check for ban
-    ban_match = re.search(FAIL2BAN_BAN_PATTERN, line)
-    if ban_match:
-        return {
-            'type': 'fail2ban_ban',
-            'jail': ban_match.group('jail'),
-            'ip': ban_match.group('ip'),
-            'severity': 'warning',
-            'message': f"IP {ban_match.group('ip')} banned by fail2ban jail '{ban_match.group('jail')}'"
-        }
-    
-    # Check for unban
-    unban_match = re.search(FAIL2BAN_UNBAN_PATTERN, line)
-    if unban_match:
-        return {
-            'type': 'fail2ban_unban',
-            'jail': unban_match.group('jail'),
-            'ip': unban_match.group('ip'),
-            'severity': 'info',
-            'message': f"IP {unban_match.group('ip')} unbanned from fail2ban jail '{unban_match.group('jail')}'"
-        }
-    
-    return None
-
-def monitor_fail2ban():
+    match = FAIL2BAN_MATCHER.match(line)
+    if match is None:
+        return None
+    event_type, groups = match
+    jail, ip = groups['jail'], groups['ip']
+    if event_type == 'fail2ban_ban':
+        severity, message = 'warning', f"IP {ip} banned by fail2ban jail '{jail}'"
+    else:
+        severity, message = 'info', f"IP {ip} unbanned from fail2ban jail '{jail}'"
+    return {
+        'type': event_type,
+        'jail': jail,
+        'ip': ip,
+        'severity': severity,
+        'message': message,
+        'timestamp': TIMESTAMPS.parse(line) or datetime.now()
+    }
+
+def security_notification(event):
+    """EventBatcher.add() arguments for an event; repeats in the same jail are summarized"""
+    verb = 'unbanned from' if event['type'] == 'fail2ban_unban' else 'banned by'
+
+    def summarize(count, ips, first_seen, last_seen):
+        return format_security_summary_embed(
+            warning_type=event['type'],
+            message=f"{count} more IP{'s' if count != 1 else ''} {verb} fail2ban jail '{event['jail']}'",
+            ips=ips,
+            first_seen=first_seen,
+            last_seen=last_seen,
+            severity=event['severity']
+        )
+
+    return {
+        'embed': format_security_warning_embed(
+            warning_type=event['type'],
+            message=event['message'],
+            severity=event['severity'],
+            source='fail2ban',
+            timestamp=event['timestamp']
+        ),
+        'key': (event['type'], event['jail']),
+        'detail': event['ip'],
+        'summarize': summarize,
+        'timestamp': event['timestamp']
+    }
+
+def backlog_counter(send):
+    """BacklogCounter for a fail2ban log backlog; send is called with the summary embed"""
+    def parse(line):
+        event = parse_fail2ban_line(line)
+        if event is None:
+            return None
+        return ('Unbans' if event['type'] == 'fail2ban_unban' else 'Bans'), event['ip']
+
+    def report(path, size, events, ips):
+        send(format_backlog_summary_embed('fail2ban', path, size, events, ips))
+
+    return BacklogCounter(parse, report)
+
+def monitor_fail2ban(settings):
     """Monitor fail2ban logs"""
     try:
-        if not os.path.exists(FAIL2BAN_LOG):
+        from_journal = not os.path.exists(FAIL2BAN_LOG)
+        if from_journal and not journal_available():
             return
         
-        last_position = get_last_position(FAIL2BAN_LOG)
+        batcher = EventBatcher(
+            lambda embeds: get_delivery().enqueue({'embeds': embeds}),
+            window=settings.aggregation_window
+        )
+        
+        def on_line(line):
+            event = parse_fail2ban_line(line)
+            if event:
+                batcher.add(**security_notification(event))
+                logging.writeToFile(f"Security notification queued: {event['type']} - {event['message']}")
+        
+        if from_journal:
+            try:
+                JournalReader(FAIL2BAN_JOURNAL_MATCHES, CURSOR_FILE, on_line).read_new_entries()
+            except Exception as e:
+                logging.writeToFile(f"Error reading fail2ban journal entries: {str(e)}")
+            batcher.flush()
+            return
         
+        checkpoints = CheckpointStore(STATE_FILE)
         try:
-            with open(FAIL2BAN_LOG, 'r') as f:
-                f.seek(last_position)
-                new_lines = f.readlines()
-                current_position = f.tell()
-                
-                for line in new_lines:
-                    event = parse_fail2ban_line(line)
-                    if event:
-                        embed = format_security_warning_embed(
-                            warning_type=event['type'],
-                            message=event['message'],
-                            severity=event['severity'],
-                            source='fail2ban'
-                        )
-                        send_to_all_webhooks(embed)
-                        logging.writeToFile(f"Security notification sent: {event['type']} - {event['message']}")
-                
-                if current_position > last_position:
-                    save_last_position(FAIL2BAN_LOG, current_position)
-                    
+            LogTailer(
+                FAIL2BAN_LOG, checkpoints, on_line, from_start=True,
+                max_backlog=settings.max_backlog_mb * MB,
+                backlog_policy=settings.backlog_policy,
+                backlog=backlog_counter(batcher.add)
+            ).read_new_lines()
         except PermissionError:
             logging.writeToFile(f"Permission denied reading {FAIL2BAN_LOG}")
         except Exception as e:
             logging.writeToFile(f"Error reading fail2ban log: {str(e)}")
+        batcher.flush()
+        checkpoints.save()
             
     except Exception as e:
         logging.writeToFile(f"Fail2ban monitor error: {str(e)}")
@@ -144,7 +167,7 @@ def monitor_security_warnings():
             return
         
         # Monitor fail2ban
-        monitor_fail2ban()
+        monitor_fail2ban(settings)
         
         # Add more security monitoring sources here as needed
         
@@ -154,3 +177,5 @@ def monitor_security_warnings():
 if __name__ == '__main__':
     # Run once when executed directly
     monitor_security_warnings()
+    # Send what this run (and any earlier one) left in the outbox; the rest waits for the next run
+    get_delivery().drain(EXIT_FLUSH_TIMEOUT)
@@ -12,20 +12,29 @@ sys.path.insert(0, '/usr/local/CyberCP')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CyberCP.settings')
 
 import django
-django.setup()
+from django.apps import apps
+if not apps.ready:
+    # Also imported by the monitor daemon, which has already set Django up
+    django.setup()
 
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
 from discordWebhooks.models import DiscordWebhook, WebhookSettings
+from discordWebhooks.delivery import get_delivery, EXIT_FLUSH_TIMEOUT
+from discordWebhooks.metrics import MetricsSampler, describe_statistic
 from discordWebhooks.utils import (
-    send_to_all_webhooks, 
     format_server_usage_embed, 
-    get_server_metrics, 
     check_server_usage_thresholds
 )
 
 # State file to track last notification timestamp (to avoid duplicates)
 STATE_FILE = '/tmp/discord_webhooks_server_usage_monitor.state'
 
+# Metric samples kept between runs (and shared with the monitor daemon)
+SAMPLES_FILE = '/tmp/discord_webhooks_server_usage_samples.json'
+
+# How often cron runs this monitor, in seconds
+CRON_INTERVAL = 60
+
 # Minimum time between notifications (seconds) - prevents spam
 MIN_NOTIFICATION_INTERVAL = 60  # 1 minute (can be overridden by user settings)
 
@@ -67,6 +76,22 @@ def filter_metrics_by_settings(metrics, settings):
     
     return filtered
 
+def load_sampler(interval=CRON_INTERVAL):
+    """MetricsSampler with the samples earlier runs saved"""
+    sampler = MetricsSampler(interval, SAMPLES_FILE)
+    sampler.load()
+    return sampler
+
+def usage_metrics(sampler, settings):
+    """
+    The metrics to report, measured over the settings' usage window
+    
+    Returns:
+        tuple: (enabled metrics, description of how they were measured)
+    """
+    metrics = sampler.summary(window=settings.usage_window * 60, statistic=settings.usage_statistic)
+    return filter_metrics_by_settings(metrics, settings), describe_statistic(settings.usage_statistic, settings.usage_window)
+
 def monitor_server_usage():
     """Main monitoring function"""
     try:
@@ -80,11 +105,11 @@ def monitor_server_usage():
         if webhook_count == 0:
             return
         
-        # Get server metrics
-        metrics = get_server_metrics()
-        
-        # Filter metrics based on settings
-        filtered_metrics = filter_metrics_by_settings(metrics, settings)
+        # Add this run's sample to the window and measure over it
+        sampler = load_sampler()
+        sampler.sample()
+        sampler.save()
+        filtered_metrics, measured = usage_metrics(sampler, settings)
         
         if not filtered_metrics:
             # No metrics selected, nothing to monitor
@@ -117,17 +142,18 @@ def monitor_server_usage():
         # Create embed with filtered metrics
         embed = format_server_usage_embed(
             metrics=filtered_metrics,
-            threshold_mode=settings.server_usage_threshold_mode
+            threshold_mode=settings.server_usage_threshold_mode,
+            measured=measured
         )
         
-        # Send notification
-        result = send_to_all_webhooks(embed)
+        # Queue notification
+        queued = get_delivery().enqueue(embed)
         
-        if result['success_count'] > 0:
+        if queued > 0:
             save_last_notification_time()
-            logging.writeToFile(f"Server usage notification sent ({result['success_count']} webhooks)")
+            logging.writeToFile(f"Server usage notification queued ({queued} webhooks)")
         else:
-            logging.writeToFile(f"Server usage notification failed ({result.get('error', 'Unknown error')})")
+            logging.writeToFile("Server usage notification not queued (no valid webhooks)")
             
     except Exception as e:
         logging.writeToFile(f"Server usage monitor error: {str(e)}")
@@ -135,3 +161,5 @@ def monitor_server_usage():
 if __name__ == '__main__':
     # Run once when executed directly
     monitor_server_usage()
+    # Send what this run (and any earlier one) left in the outbox; the rest waits for the next run
+    get_delivery().drain(EXIT_FLUSH_TIMEOUT)
@@ -4,7 +4,6 @@ SSH Login Monitor for Discord Webhooks Plugin
 Monitors SSH login attempts and sends notifications to Discord
 """
 import os
-import re
 import sys
 import time
 from datetime import datetime
@@ -14,11 +13,19 @@ sys.path.insert(0, '/usr/local/CyberCP')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CyberCP.settings')
 
 import django
-django.setup()
+from django.apps import apps
+if not apps.ready:
+    # Also imported by the monitor daemon, which has already set Django up
+    django.setup()
 
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
 from discordWebhooks.models import DiscordWebhook, WebhookSettings
-from discordWebhooks.utils import send_to_all_webhooks, format_ssh_login_embed
+from discordWebhooks.batching import EventBatcher
+from discordWebhooks.delivery import get_delivery, EXIT_FLUSH_TIMEOUT
+from discordWebhooks.monitors.journal import JournalReader, journal_available
+from discordWebhooks.monitors.logtail import BacklogCounter, CheckpointStore, LogTailer, MB
+from discordWebhooks.monitors.parsing import MultiPattern, TimestampParser
+from discordWebhooks.utils import format_ssh_login_embed, format_ssh_login_summary_embed, format_backlog_summary_embed
 
 # SSH log file paths (AlmaLinux/RHEL uses /var/log/secure, Debian/Ubuntu uses /var/log/auth.log)
 SSH_LOG_PATHS = [
@@ -26,14 +33,21 @@ SSH_LOG_PATHS = [
     '/var/log/auth.log'
 ]
 
-# State file to track last read position
+# Checkpoint store tracking how far the SSH log was read
 STATE_FILE = '/tmp/discord_webhooks_ssh_monitor.state'
 
-# SSH login patterns
-SSH_LOGIN_PATTERNS = [
-    r'Accepted (?:publickey|password|keyboard-interactive) for (\S+) from (\S+) port \d+',
-    r'Failed (?:password|publickey) for (\S+) from (\S+) port \d+',
-]
+# Without a log file (journald-only systems), sshd's journal entries are
+# read instead, from the position kept in CURSOR_FILE
+JOURNAL_MATCHES = ['SYSLOG_IDENTIFIER=sshd', 'SYSLOG_IDENTIFIER=sshd-session']
+CURSOR_FILE = '/tmp/discord_webhooks_ssh_monitor.cursor'
+
+# SSH login patterns, matched in one pass; lines without a prefilter word are skipped unread
+SSH_LOGIN_PATTERNS = {
+    'accepted': r'Accepted (?:publickey|password|keyboard-interactive) for (?P<username>\S+) from (?P<ip>\S+) port \d+',
+    'failed': r'Failed (?:password|publickey) for (?:invalid user )?(?P<username>\S+) from (?P<ip>\S+) port \d+',
+}
+SSH_LOGIN_MATCHER = MultiPattern(SSH_LOGIN_PATTERNS, prefilter=('Accepted ', 'Failed '))
+TIMESTAMPS = TimestampParser()
 
 def get_ssh_log_path():
     """Determine which SSH log file to use based on OS"""
@@ -42,41 +56,51 @@ def get_ssh_log_path():
             return path
     return None
 
-def get_last_position(log_path):
-    """Get the last read position from state file"""
-    try:
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r') as f:
-                data = f.read().strip().split(':')
-                if len(data) == 2 and data[0] == log_path:
-                    return int(data[1])
-    except Exception as e:
-        logging.writeToFile(f"Error reading state file: {str(e)}")
-    return 0
-
-def save_last_position(log_path, position):
-    """Save the last read position to state file"""
-    try:
-        with open(STATE_FILE, 'w') as f:
-            f.write(f"{log_path}:{position}")
-    except Exception as e:
-        logging.writeToFile(f"Error saving state file: {str(e)}")
-
 def parse_ssh_log_line(line):
     """Parse an SSH log line and extract login information"""
-    for pattern in SSH_LOGIN_PATTERNS:
-        match = re.search(pattern, line)
-        if match:
-            username = match.group(1)
-            ip = match.group(2)
-            success = 'Accepted' in pattern or 'Accepted' in line
-            return {
-                'username': username,
-                'ip': ip,
-                'success': success,
-                'timestamp': datetime.now()
-            }
-    return None
+    match = SSH_LOGIN_MATCHER.match(line)
+    if match is None:
+        return None
+    name, groups = match
+    return {
+        'username': groups['username'],
+        'ip': groups['ip'],
+        'success': name == 'accepted',
+        'timestamp': TIMESTAMPS.parse(line) or datetime.now()
+    }
+
+def login_notification(login_info):
+    """EventBatcher.add() arguments for a login; repeats from the same IP are summarized"""
+    ip, success = login_info['ip'], login_info['success']
+
+    def summarize(count, usernames, first_seen, last_seen):
+        return format_ssh_login_summary_embed(ip, success, count, usernames, first_seen, last_seen)
+
+    return {
+        'embed': format_ssh_login_embed(
+            ip=ip,
+            username=login_info['username'],
+            timestamp=login_info['timestamp'],
+            success=success
+        ),
+        'key': ('ssh_login', ip, success),
+        'detail': login_info['username'],
+        'summarize': summarize,
+        'timestamp': login_info['timestamp']
+    }
+
+def backlog_counter(send):
+    """BacklogCounter for an SSH log backlog; send is called with the summary embed"""
+    def parse(line):
+        login_info = parse_ssh_log_line(line)
+        if login_info is None:
+            return None
+        return ('Successful logins' if login_info['success'] else 'Failed logins'), login_info['ip']
+
+    def report(path, size, events, ips):
+        send(format_backlog_summary_embed('SSH', path, size, events, ips))
+
+    return BacklogCounter(parse, report)
 
 def monitor_ssh_logins():
     """Main monitoring function"""
@@ -93,45 +117,45 @@ def monitor_ssh_logins():
         
         # Get SSH log path
         log_path = get_ssh_log_path()
-        if not log_path:
+        if not log_path and not journal_available():
             logging.writeToFile("SSH log file not found, skipping SSH login monitoring")
             return
         
-        # Get last position
-        last_position = get_last_position(log_path)
+        batcher = EventBatcher(
+            lambda embeds: get_delivery().enqueue({'embeds': embeds}),
+            window=settings.aggregation_window
+        )
+        
+        def on_line(line):
+            login_info = parse_ssh_log_line(line)
+            if login_info:
+                # Queue notification; repeats from the same IP are summarized
+                batcher.add(**login_notification(login_info))
+                logging.writeToFile(f"SSH login notification queued: {login_info['username']} from {login_info['ip']} (success: {login_info['success']})")
+        
+        if not log_path:
+            try:
+                JournalReader(JOURNAL_MATCHES, CURSOR_FILE, on_line).read_new_entries()
+            except Exception as e:
+                logging.writeToFile(f"Error reading SSH journal entries: {str(e)}")
+            batcher.flush()
+            return
         
-        # Read new lines from log file
+        # Read new lines, including the end of the previous file if the log was rotated
+        checkpoints = CheckpointStore(STATE_FILE)
         try:
-            with open(log_path, 'r') as f:
-                # Seek to last position
-                f.seek(last_position)
-                
-                # Read new lines
-                new_lines = f.readlines()
-                current_position = f.tell()
-                
-                # Process each new line
-                for line in new_lines:
-                    login_info = parse_ssh_log_line(line)
-                    if login_info:
-                        # Send notification
-                        embed = format_ssh_login_embed(
-                            ip=login_info['ip'],
-                            username=login_info['username'],
-                            timestamp=login_info['timestamp'],
-                            success=login_info['success']
-                        )
-                        send_to_all_webhooks(embed)
-                        logging.writeToFile(f"SSH login notification sent: {login_info['username']} from {login_info['ip']} (success: {login_info['success']})")
-                
-                # Save new position
-                if current_position > last_position:
-                    save_last_position(log_path, current_position)
-                    
+            LogTailer(
+                log_path, checkpoints, on_line, from_start=True,
+                max_backlog=settings.max_backlog_mb * MB,
+                backlog_policy=settings.backlog_policy,
+                backlog=backlog_counter(batcher.add)
+            ).read_new_lines()
         except PermissionError:
             logging.writeToFile(f"Permission denied reading {log_path}, SSH monitoring may not work correctly")
         except Exception as e:
             logging.writeToFile(f"Error reading SSH log: {str(e)}")
+        batcher.flush()
+        checkpoints.save()
             
     except Exception as e:
         logging.writeToFile(f"SSH monitor error: {str(e)}")
@@ -139,3 +163,5 @@ def monitor_ssh_logins():
 if __name__ == '__main__':
     # Run once when executed directly
     monitor_ssh_logins()
+    # Send what this run (and any earlier one) left in the outbox; the rest waits for the next run
+    get_delivery().drain(EXIT_FLUSH_TIMEOUT)
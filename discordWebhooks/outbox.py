@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Durable outbox for Discord webhook messages
+Every message is stored before it is sent; a delivery process claims rows,
+sends them and records the outcome, so nothing is lost to a restart or a
+Discord outage and nothing is sent twice
+"""
+import json
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import WebhookOutbox
+
+# A claim not refreshed for this long belonged to a process that died
+CLAIM_TIMEOUT = timedelta(minutes=2)
+DELIVERED_RETENTION = timedelta(days=1)
+FAILED_RETENTION = timedelta(days=7)
+PURGE_CHUNK = 500
+
+
+def add_messages(payload, webhooks):
+    """Store payload for each webhook; returns the number of rows added"""
+    body = json.dumps(payload)
+    with transaction.atomic():
+        for webhook in webhooks:
+            WebhookOutbox.objects.create(webhook=webhook, payload=body)
+    return len(webhooks)
+
+
+def claim(token, limit, now=None):
+    """
+    Claim up to limit due messages for the delivery process identified by token
+
+    Returns:
+        list: Claimed WebhookOutbox rows with their webhook, oldest first
+    """
+    now = now or timezone.now()
+    WebhookOutbox.objects.filter(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT).update(
+        status='pending', claimed_by=''
+    )
+    ids = list(
+        WebhookOutbox.objects.filter(status='pending', next_attempt__lte=now)
+        .order_by('id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    # Another process may have claimed some of these in the meantime; the
+    # status condition makes sure each row goes to exactly one of us
+    WebhookOutbox.objects.filter(pk__in=ids, status='pending').update(
+        status='sending', claimed_by=token, claimed_at=now
+    )
+    return list(
+        WebhookOutbox.objects.filter(pk__in=ids, status='sending', claimed_by=token)
+        .select_related('webhook').order_by('id')
+    )
+
+
+def refresh_claims(token, now=None):
+    """Keep this process's claims from being taken over"""
+    WebhookOutbox.objects.filter(status='sending', claimed_by=token).update(claimed_at=now or timezone.now())
+
+
+def release_claims(token, exclude=()):
+    """Hand unsent messages back to the outbox for another process"""
+    WebhookOutbox.objects.filter(status='sending', claimed_by=token).exclude(pk__in=list(exclude)).update(
+        status='pending', claimed_by=''
+    )
+
+
+def record_results(token, delivered=(), retries=(), failed=(), now=None):
+    """
+    Store the outcome of sends
+
+    Args:
+        delivered: (id, attempts) of messages Discord accepted
+        retries: (id, attempts, next_attempt, error) of messages to try again
+        failed: (id, attempts, error) of messages given up on
+    """
+    now = now or timezone.now()
+    mine = WebhookOutbox.objects.filter(claimed_by=token)
+    with transaction.atomic():
+        by_attempts = {}
+        for pk, attempts in delivered:
+            by_attempts.setdefault(attempts, []).append(pk)
+        for attempts, ids in by_attempts.items():
+            mine.filter(pk__in=ids).update(
+                status='delivered', attempts=attempts, delivered_at=now, claimed_by='', last_error=''
+            )
+        for pk, attempts, next_attempt, error in retries:
+            mine.filter(pk=pk).update(attempts=attempts, next_attempt=next_attempt, last_error=error[:255])
+        for pk, attempts, error in failed:
+            mine.filter(pk=pk).update(status='failed', attempts=attempts, last_error=error[:255], claimed_by='')
+
+
+def purge(now=None):
+    """Delete old delivered and failed messages in chunks; returns how many went"""
+    now = now or timezone.now()
+    deleted = 0
+    for status, retention in (('delivered', DELIVERED_RETENTION), ('failed', FAILED_RETENTION)):
+        while True:
+            ids = list(
+                WebhookOutbox.objects.filter(status=status, created_at__lt=now - retention)
+                .values_list('id', flat=True)[:PURGE_CHUNK]
+            )
+            if not ids:
+                break
+            WebhookOutbox.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            if len(ids) < PURGE_CHUNK:
+                break
+    return deleted
+
+
+def replay(ids=None):
+    """Send messages again: those in ids (failed or delivered), or else every failed one; returns the count"""
+    if ids is None:
+        messages = WebhookOutbox.objects.filter(status='failed')
+    else:
+        messages = WebhookOutbox.objects.filter(pk__in=ids, status__in=('failed', 'delivered'))
+    return messages.update(
+        status='pending', attempts=0, next_attempt=timezone.now(), last_error='', delivered_at=None
+    )
+
+
+def message_summary(payload):
+    """One line describing a stored payload, for the outbox view"""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return ''
+    embeds = data.get('embeds') or []
+    if not embeds:
+        return str(data.get('content', ''))[:100]
+    titles = [embed.get('title', '') for embed in embeds]
+    summary = titles[0] if len(titles) == 1 else f"{titles[0]} (+{len(titles) - 1} more)"
+    return summary[:100]
+
+
+def outbox_data(status=None, limit=50):
+    """Counts by status and the latest messages, as returned by the outbox view"""
+    counts = {value: 0 for value, _ in WebhookOutbox.STATUS_CHOICES}
+    for row in WebhookOutbox.objects.order_by().values('status').annotate(count=Count('id')):
+        counts[row['status']] = row['count']
+
+    messages = WebhookOutbox.objects.select_related('webhook')
+    if status:
+        messages = messages.filter(status=status)
+    return {
+        'counts': counts,
+        'messages': [
+            {
+                'id': message.pk,
+                'webhook': message.webhook.name,
+                'status': message.status,
+                'attempts': message.attempts,
+                'summary': message_summary(message.payload),
+                'last_error': message.last_error,
+                'created_at': message.created_at.isoformat(),
+                'next_attempt': message.next_attempt.isoformat() if message.status in ('pending', 'sending') else None,
+                'delivered_at': message.delivered_at.isoformat() if message.delivered_at else None,
+            }
+            for message in messages[:limit]
+        ],
+    }
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Discord rate limit tracking for the webhook delivery queue
+Learns each webhook's bucket from the X-RateLimit headers and says how long
+a send has to wait, so bursts are spread out instead of answered with 429s
+"""
+import collections
+import threading
+import time
+
+from .utils import webhook_label
+
+# Discord allows 50 requests a second per client across all routes
+GLOBAL_RATE_LIMIT = 50
+# Wait after a 429 that came without any timing hint
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class RateLimiter:
+    """Per-bucket and global Discord rate limits
+
+    Discord reports a bucket for every webhook response: how many requests
+    it allows (X-RateLimit-Limit), how many are left (-Remaining) and when
+    it refills (-Reset-After). Webhooks in the same bucket (X-RateLimit-Bucket)
+    share one count. acquire() reserves a request from the bucket, or
+    returns how long to wait for it to refill; a 429 blocks the bucket, or
+    every webhook if Discord says the limit is global, for Retry-After.
+    """
+
+    def __init__(self, global_limit=GLOBAL_RATE_LIMIT):
+        self.global_limit = global_limit
+        self.lock = threading.Lock()
+        self.buckets = {}  # bucket key -> {'limit', 'remaining', 'reset_at'}
+        self.url_buckets = {}  # webhook url -> Discord's bucket id, once known
+        self.global_until = 0
+        self.recent = collections.deque()  # monotonic times of requests in the last second
+
+    def _key(self, url):
+        return self.url_buckets.get(url, url)
+
+    def acquire(self, url, now=None):
+        """Reserve a request to url; 0 if it may go now, else seconds to wait (nothing reserved)"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            while self.recent and self.recent[0] <= now - 1:
+                self.recent.popleft()
+            delay = self.global_until - now
+            if len(self.recent) >= self.global_limit:
+                delay = max(delay, self.recent[0] + 1 - now)
+
+            bucket = self.buckets.get(self._key(url))
+            if bucket is not None:
+                if bucket['reset_at'] <= now:
+                    bucket['remaining'] = bucket['limit']
+                elif bucket['remaining'] <= 0:
+                    delay = max(delay, bucket['reset_at'] - now)
+            if delay > 0:
+                return delay
+
+            if bucket is not None:
+                bucket['remaining'] -= 1
+            self.recent.append(now)
+            return 0
+
+    def update(self, url, status_code, rate_limit, now=None):
+        """Record a response's rate limit info (send_discord_webhook()'s 'rate_limit')"""
+        now = time.monotonic() if now is None else now
+        rate_limit = rate_limit or {}
+        with self.lock:
+            if rate_limit.get('bucket'):
+                self.url_buckets[url] = rate_limit['bucket']
+                self.buckets.pop(url, None)
+            key = self._key(url)
+            if None not in (rate_limit.get('limit'), rate_limit.get('remaining'), rate_limit.get('reset_after')):
+                self.buckets[key] = {
+                    'limit': int(rate_limit['limit']),
+                    'remaining': int(rate_limit['remaining']),
+                    'reset_at': now + rate_limit['reset_after'],
+                }
+
+            if status_code == 429:
+                retry_after = rate_limit.get('retry_after') or DEFAULT_RETRY_AFTER
+                if rate_limit.get('global'):
+                    self.global_until = max(self.global_until, now + retry_after)
+                else:
+                    bucket = self.buckets.setdefault(key, {'limit': 1, 'remaining': 0, 'reset_at': now})
+                    bucket['remaining'] = 0
+                    bucket['reset_at'] = max(bucket['reset_at'], now + retry_after)
+
+    def state(self, now=None):
+        """Current buckets and global limit, for debugging"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            shared = collections.defaultdict(list)
+            for url, key in self.url_buckets.items():
+                shared[key].append(webhook_label(url))
+            return {
+                'global': {
+                    'limit_per_second': self.global_limit,
+                    'sent_last_second': sum(1 for sent in self.recent if sent > now - 1),
+                    'blocked_for': round(max(0, self.global_until - now), 3),
+                },
+                'buckets': [
+                    {
+                        # Buckets Discord hasn't named yet are keyed by webhook url
+                        'bucket': key if key in shared else None,
+                        'webhooks': sorted(shared[key]) if key in shared else [webhook_label(key)],
+                        'limit': bucket['limit'],
+                        'remaining': bucket['remaining'] if bucket['reset_at'] > now else bucket['limit'],
+                        'reset_in': round(max(0, bucket['reset_at'] - now), 3),
+                    }
+                    for key, bucket in self.buckets.items()
+                ],
+            }
@@ -1,2 +1,22 @@
 # Signals for Discord Webhooks plugin
-# Currently no signals needed, but file is kept for future use
+import time
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import DiscordWebhook, WebhookSettings
+
+# Touched whenever settings or webhooks change; the monitor daemon watches it to refresh its cache
+SETTINGS_STAMP_FILE = '/tmp/discord_webhooks_settings.stamp'
+
+
+@receiver(post_save, sender=WebhookSettings)
+@receiver(post_delete, sender=WebhookSettings)
+@receiver(post_save, sender=DiscordWebhook)
+@receiver(post_delete, sender=DiscordWebhook)
+def touch_settings_stamp(sender, **kwargs):
+    """Tell the monitor daemon that settings or webhooks changed"""
+    try:
+        with open(SETTINGS_STAMP_FILE, 'w') as f:
+            f.write(str(time.time()))
+    except OSError:
+        # The daemon also refreshes on a timer
+        pass
@@ -18,4 +18,8 @@ urlpatterns = [
     
     # Settings management
     re_path(r'^settings/save/$', views.save_settings, name='save_settings'),
+    
+    # Outbox
+    re_path(r'^outbox/$', views.outbox_view, name='outbox'),
+    re_path(r'^outbox/replay/$', views.replay_outbox, name='replay_outbox'),
 ]
@@ -1,14 +1,87 @@
 # -*- coding: utf-8 -*-
 import requests
-import json
-import psutil
-import subprocess
 from datetime import datetime
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
-from .models import DiscordWebhook, WebhookSettings
+from .metrics import get_sampler
 
+DISCORD_WEBHOOK_PREFIX = 'https://discord.com/api/webhooks/'
 
-def send_discord_webhook(url, embed_data, timeout=10):
+
+def is_discord_webhook_url(url):
+    """Whether url looks like a Discord webhook URL"""
+    return bool(url) and url.startswith(DISCORD_WEBHOOK_PREFIX)
+
+
+def webhook_label(url):
+    """Webhook id from its URL, for logs and debugging output (the token stays out)"""
+    parts = url.rstrip('/').split('/')
+    return parts[-2] if len(parts) >= 2 and parts[-2] != 'webhooks' else parts[-1]
+
+
+def parse_rate_limit_headers(response):
+    """
+    Read Discord's rate limit headers from a webhook response
+    
+    Args:
+        response: requests.Response
+        
+    Returns:
+        dict: {'bucket': str or None, 'limit', 'remaining', 'reset_after',
+            'retry_after': float or None, 'global': bool}
+    """
+    headers = response.headers
+
+    def number(name):
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    info = {
+        'bucket': headers.get('X-RateLimit-Bucket'),
+        'limit': number('X-RateLimit-Limit'),
+        'remaining': number('X-RateLimit-Remaining'),
+        'reset_after': number('X-RateLimit-Reset-After'),
+        'retry_after': None,
+        'global': headers.get('X-RateLimit-Global', '').lower() == 'true'
+                  or headers.get('X-RateLimit-Scope') == 'global',
+    }
+    if response.status_code == 429:
+        # Reset-After has millisecond precision; Retry-After is whole seconds but
+        # is the only hint on global and Cloudflare limits. The body's retry_after
+        # is skipped: its unit depends on the API version in the webhook URL.
+        info['retry_after'] = info['reset_after'] if info['reset_after'] is not None and not info['global'] \
+            else number('Retry-After')
+        if not info['global']:
+            try:
+                info['global'] = bool(response.json().get('global'))
+            except (ValueError, AttributeError):
+                pass
+    return info
+
+
+def build_webhook_payload(embed_data):
+    """
+    Turn an embed, a message dict or plain text into a webhook payload
+    
+    Args:
+        embed_data: Dictionary containing embed data or message content
+        
+    Returns:
+        dict: JSON payload for the Discord webhook API
+    """
+    if isinstance(embed_data, dict) and ('embeds' in embed_data or 'content' in embed_data):
+        # Already a message payload
+        return embed_data
+    elif isinstance(embed_data, dict):
+        # If it's a single embed dict, wrap it
+        return {'embeds': [embed_data]}
+    else:
+        # Plain text message
+        return {'content': str(embed_data)}
+
+
+def send_discord_webhook(url, embed_data, timeout=10, session=None):
     """
     Send a Discord webhook with error handling
     
@@ -16,51 +89,54 @@ def send_discord_webhook(url, embed_data, timeout=10):
         url: Discord webhook URL
         embed_data: Dictionary containing embed data or message content
         timeout: Request timeout in seconds
+        session: requests.Session to send with (keeps the connection alive
+            between sends); defaults to a one-off connection
         
     Returns:
-        dict: {'success': bool, 'message': str, 'status_code': int}
+        dict: {'success': bool, 'message': str, 'status_code': int}, plus
+            'rate_limit' (see parse_rate_limit_headers) once Discord answered,
+            and 'retry_after' (seconds) when it rate limited the request
     """
     try:
         # Validate URL
-        if not url or not url.startswith('https://discord.com/api/webhooks/'):
+        if not is_discord_webhook_url(url):
             return {
                 'success': False,
                 'message': 'Invalid Discord webhook URL',
                 'status_code': 0
             }
         
-        # Prepare payload
-        if isinstance(embed_data, dict) and 'embeds' in embed_data:
-            payload = embed_data
-        elif isinstance(embed_data, dict):
-            # If it's a single embed dict, wrap it
-            payload = {'embeds': [embed_data]}
-        else:
-            # Plain text message
-            payload = {'content': str(embed_data)}
+        payload = build_webhook_payload(embed_data)
         
         # Send request
-        response = requests.post(
+        response = (session or requests).post(
             url,
             json=payload,
             timeout=timeout,
             headers={'Content-Type': 'application/json'}
         )
         
+        rate_limit = parse_rate_limit_headers(response)
+        
         # Check response
         if response.status_code in [200, 204]:
             return {
                 'success': True,
                 'message': 'Webhook sent successfully',
-                'status_code': response.status_code
+                'status_code': response.status_code,
+                'rate_limit': rate_limit
             }
         else:
-            return {
+            result = {
                 'success': False,
                 'message': f'Discord API error: {response.status_code}',
                 'status_code': response.status_code,
-                'response': response.text[:200]  # First 200 chars of response
+                'response': response.text[:200],  # First 200 chars of response
+                'rate_limit': rate_limit
             }
+            if response.status_code == 429:
+                result['retry_after'] = rate_limit['retry_after'] or 0
+            return result
             
     except requests.exceptions.Timeout:
         return {
@@ -84,6 +160,11 @@ def send_discord_webhook(url, embed_data, timeout=10):
         }
 
 
+def _embed_timestamp(value=None):
+    """Aware ISO 8601 time for an embed; naive datetimes (log times, datetime.now()) are local time"""
+    return (value or datetime.now()).astimezone().isoformat()
+
+
 def format_ssh_login_embed(ip, username, timestamp, success=True):
     """
     Format SSH login notification embed
@@ -119,7 +200,7 @@ def format_ssh_login_embed(ip, username, timestamp, success=True):
             },
             {
                 'name': 'Timestamp',
-                'value': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC') if isinstance(timestamp, datetime) else str(timestamp),
+                'value': timestamp.astimezone().strftime('%Y-%m-%d %H:%M:%S %Z') if isinstance(timestamp, datetime) else str(timestamp),
                 'inline': False
             }
         ],
@@ -134,13 +215,13 @@ def format_ssh_login_embed(ip, username, timestamp, success=True):
             'name': 'CyberPanel Discord Webhooks',
             'icon_url': LOGO_URL
         },
-        'timestamp': timestamp.isoformat() if isinstance(timestamp, datetime) else datetime.now().isoformat()
+        'timestamp': _embed_timestamp(timestamp if isinstance(timestamp, datetime) else None)
     }
     
     return embed
 
 
-def format_security_warning_embed(warning_type, message, severity='warning', source='System'):
+def format_security_warning_embed(warning_type, message, severity='warning', source='System', timestamp=None):
     """
     Format security warning embed
     
@@ -149,6 +230,7 @@ def format_security_warning_embed(warning_type, message, severity='warning', sou
         message: Warning message
         severity: Severity level ('info', 'warning', 'error', 'critical')
         source: Source of the warning
+        timestamp: When it happened; defaults to now
         
     Returns:
         dict: Discord embed dictionary
@@ -192,19 +274,180 @@ def format_security_warning_embed(warning_type, message, severity='warning', sou
             'name': 'CyberPanel Discord Webhooks',
             'icon_url': LOGO_URL
         },
-        'timestamp': datetime.now().isoformat()
+        'timestamp': _embed_timestamp(timestamp)
     }
     
     return embed
 
 
-def format_server_usage_embed(metrics, threshold_mode=True):
+def _summary_details(details, limit=1024):
+    """'a (40), b (17), ...' by count, cut to fit a Discord field value"""
+    items = sorted(details.items(), key=lambda item: (-item[1], str(item[0])))
+    text = ''
+    for shown, (value, count) in enumerate(items):
+        part = f"{value} ({count})" if count > 1 else str(value)
+        rest = f" and {len(items) - shown} more"
+        if len(text) + len(part) + 2 + len(rest) > limit:
+            return text + rest
+        text = f"{text}, {part}" if text else part
+    return text or 'N/A'
+
+
+def _format_span(first_seen, last_seen):
+    seconds = int((last_seen - first_seen).total_seconds()) if first_seen and last_seen else 0
+    return f"{seconds}s" if seconds < 120 else f"{seconds // 60}m"
+
+
+def _format_summary_embed(title, description, color, details_name, details, first_seen, last_seen):
+    LOGO_URL = 'https://newstargeted.com/hotlink-ok/logo.png'
+    return {
+        'title': title,
+        'description': description,
+        'color': color,
+        'fields': [
+            {
+                'name': details_name,
+                'value': _summary_details(details),
+                'inline': False
+            },
+            {
+                'name': 'First Seen',
+                'value': first_seen.strftime('%Y-%m-%d %H:%M:%S') if first_seen else 'N/A',
+                'inline': True
+            },
+            {
+                'name': 'Last Seen',
+                'value': last_seen.strftime('%Y-%m-%d %H:%M:%S') if last_seen else 'N/A',
+                'inline': True
+            }
+        ],
+        'footer': {
+            'text': 'Powered by newstargeted.com',
+            'icon_url': LOGO_URL
+        },
+        'author': {
+            'name': 'CyberPanel Discord Webhooks',
+            'icon_url': LOGO_URL
+        },
+        'timestamp': _embed_timestamp(last_seen)
+    }
+
+
+def format_ssh_login_summary_embed(ip, success, count, usernames, first_seen, last_seen):
+    """
+    Format the summary of repeated SSH logins from one IP
+    
+    Args:
+        ip: IP address the logins came from
+        success: Whether the logins succeeded
+        count: Number of repeated logins being summarized
+        usernames: Dictionary of username -> times seen
+        first_seen: datetime of the first repeat
+        last_seen: datetime of the last repeat
+        
+    Returns:
+        dict: Discord embed dictionary
+    """
+    action = 'logged in' if success else 'failed to log in'
+    return _format_summary_embed(
+        title="SSH Logins Successful (repeated)" if success else "SSH Logins Failed (repeated)",
+        description=f"IP {ip} {action} {count} more time{'s' if count != 1 else ''} in "
+                    f"{_format_span(first_seen, last_seen)} for {len(usernames)} user{'s' if len(usernames) != 1 else ''}",
+        color=3066993 if success else 15158332,
+        details_name='Usernames',
+        details=usernames,
+        first_seen=first_seen,
+        last_seen=last_seen
+    )
+
+
+def format_security_summary_embed(warning_type, message, ips, first_seen, last_seen, severity='warning'):
+    """
+    Format the summary of repeated security events
+    
+    Args:
+        warning_type: Type of warning (e.g., 'fail2ban_ban')
+        message: What happened, e.g. "12 more IPs banned by fail2ban jail 'sshd'"
+        ips: Dictionary of IP address -> times seen
+        first_seen: datetime of the first repeat
+        last_seen: datetime of the last repeat
+        severity: Severity level ('info', 'warning', 'error', 'critical')
+        
+    Returns:
+        dict: Discord embed dictionary
+    """
+    color_map = {
+        'info': 3447003,
+        'warning': 15844367,
+        'error': 15158332,
+        'critical': 10038562
+    }
+    return _format_summary_embed(
+        title=f'Security Warning: {warning_type} (repeated)',
+        description=f"{message} in {_format_span(first_seen, last_seen)}",
+        color=color_map.get(severity.lower(), 15844367),
+        details_name='IP Addresses',
+        details=ips,
+        first_seen=first_seen,
+        last_seen=last_seen
+    )
+
+
+def format_backlog_summary_embed(source, log_path, size, events, ips):
+    """
+    Format the summary of a log backlog too large to send event by event
+    
+    Args:
+        source: What was monitored (e.g., 'SSH', 'fail2ban')
+        log_path: Log file the backlog was read from
+        size: Bytes of unread log
+        events: Dictionary of event label -> count
+        ips: Dictionary of IP address -> count
+        
+    Returns:
+        dict: Discord embed dictionary
+    """
+    LOGO_URL = 'https://newstargeted.com/hotlink-ok/logo.png'
+    total = sum(events.values())
+    return {
+        'title': f'{source} Backlog Summary',
+        'description': (
+            f"{size / (1024 * 1024):.1f} MB of {log_path} built up while monitoring was down; "
+            f"its {total} event{'s' if total != 1 else ''} are summarized here instead of sent one by one"
+        ),
+        'color': 15844367,  # Yellow
+        'fields': [
+            {
+                'name': 'Events',
+                'value': _summary_details(events),
+                'inline': False
+            },
+            {
+                'name': 'IP Addresses',
+                'value': _summary_details(ips),
+                'inline': False
+            }
+        ],
+        'footer': {
+            'text': 'Powered by newstargeted.com',
+            'icon_url': LOGO_URL
+        },
+        'author': {
+            'name': 'CyberPanel Discord Webhooks',
+            'icon_url': LOGO_URL
+        },
+        'timestamp': _embed_timestamp()
+    }
+
+
+def format_server_usage_embed(metrics, threshold_mode=True, measured=None):
     """
     Format server usage metrics embed
     
     Args:
         metrics: Dictionary with CPU, memory, disk, network metrics
         threshold_mode: Whether thresholds were exceeded (affects color)
+        measured: How the values were measured (e.g. "5-minute average"), shown under the title
         
     Returns:
         dict: Discord embed dictionary
@@ -272,61 +515,33 @@ def format_server_usage_embed(metrics, threshold_mode=True):
             'icon_url': LOGO_URL,
             'url': 'https://newstargeted.com'
         },
-        'timestamp': datetime.now().isoformat()
+        'timestamp': _embed_timestamp()
     }
+    if measured:
+        embed['description'] = f"Measured as the {measured}"
     
     return embed
 
 
 def get_server_metrics():
     """
-    Get current server metrics (CPU, memory, disk, network)
+    Get current server metrics (CPU, memory, disk, network) without waiting
+    
+    CPU usage and network throughput are measured since the previous call in
+    this process; the first call falls back to the load average for CPU and
+    has no network rate yet.
     
     Returns:
         dict: Dictionary with metrics
     """
     try:
-        metrics = {}
-        
-        # CPU usage
-        try:
-            metrics['cpu_percent'] = psutil.cpu_percent(interval=1)
-        except:
-            # Fallback to load average
-            try:
-                with open('/proc/loadavg', 'r') as f:
-                    load_avg = float(f.read().split()[0])
-                    metrics['cpu_percent'] = min(load_avg * 100, 100)
-            except:
-                metrics['cpu_percent'] = 0
-        
-        # Memory usage
-        try:
-            mem = psutil.virtual_memory()
-            metrics['memory_percent'] = mem.percent
-            metrics['memory_total'] = mem.total
-            metrics['memory_used'] = mem.used
-            metrics['memory_available'] = mem.available
-        except:
-            metrics['memory_percent'] = 0
-        
-        # Disk usage (root partition)
-        try:
-            disk = psutil.disk_usage('/')
-            metrics['disk_percent'] = disk.percent
-            metrics['disk_total'] = disk.total
-            metrics['disk_used'] = disk.used
-            metrics['disk_free'] = disk.free
-        except:
-            metrics['disk_percent'] = 0
-        
-        # Network usage (simplified)
-        try:
-            net_io = psutil.net_io_counters()
-            metrics['network'] = f"Sent: {net_io.bytes_sent / 1024 / 1024 / 1024:.2f} GB, Recv: {net_io.bytes_recv / 1024 / 1024 / 1024:.2f} GB"
-        except:
-            metrics['network'] = "N/A"
-        
+        sampler = get_sampler()
+        sampler.sample()
+        metrics = sampler.summary(window=0, statistic='latest')
+        metrics.setdefault('cpu_percent', 0)
+        metrics.setdefault('memory_percent', 0)
+        metrics.setdefault('disk_percent', 0)
+        metrics.setdefault('network', 'N/A')
         return metrics
         
     except Exception as e:
@@ -368,50 +583,3 @@ def check_server_usage_thresholds(settings, metrics):
     except Exception as e:
         logging.writeToFile(f"Error checking thresholds: {str(e)}")
         return False
-
-
-def send_to_all_webhooks(embed_data):
-    """
-    Send embed data to all enabled webhooks
-    
-    Args:
-        embed_data: Dictionary containing embed data
-        
-    Returns:
-        dict: Summary of sends {'success_count': int, 'fail_count': int, 'results': list}
-    """
-    try:
-        webhooks = DiscordWebhook.objects.filter(enabled=True)
-        results = []
-        success_count = 0
-        fail_count = 0
-        
-        for webhook in webhooks:
-            result = send_discord_webhook(webhook.url, embed_data)
-            results.append({
-                'webhook_id': webhook.id,
-                'webhook_name': webhook.name,
-                'success': result['success'],
-                'message': result['message']
-            })
-            
-            if result['success']:
-                success_count += 1
-            else:
-                fail_count += 1
-                logging.writeToFile(f"Failed to send webhook to {webhook.name}: {result['message']}")
-        
-        return {
-            'success_count': success_count,
-            'fail_count': fail_count,
-            'results': results
-        }
-        
-    except Exception as e:
-        logging.writeToFile(f"Error sending to all webhooks: {str(e)}")
-        return {
-            'success_count': 0,
-            'fail_count': 0,
-            'results': [],
-            'error': str(e)
-        }
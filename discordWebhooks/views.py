@@ -7,9 +7,10 @@ from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from functools import wraps
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
-from .models import DiscordWebhook, WebhookSettings
+from .models import DiscordWebhook, WebhookSettings, WebhookOutbox
 from .forms import DiscordWebhookForm, WebhookSettingsForm
-from .utils import send_discord_webhook, format_server_usage_embed, get_server_metrics
+from .utils import send_discord_webhook
+from .outbox import outbox_data, replay
 
 
 def cyberpanel_login_required(view_func):
@@ -226,3 +227,38 @@ def save_settings(request):
     except Exception as e:
         logging.writeToFile(f"Error saving settings: {str(e)}")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def outbox_view(request):
+    """Outbox counts and latest messages, optionally filtered by status"""
+    try:
+        status = request.GET.get('status', '')
+        if status and status not in dict(WebhookOutbox.STATUS_CHOICES):
+            return JsonResponse({'success': False, 'error': f'Unknown status: {status}'}, status=400)
+        return JsonResponse({'success': True, 'outbox': outbox_data(status or None)})
+
+    except Exception as e:
+        logging.writeToFile(f"Error loading webhook outbox: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@cyberpanel_login_required
+@require_http_methods(["POST"])
+def replay_outbox(request):
+    """Queue messages again: the posted ids, or every failed message"""
+    try:
+        ids = request.POST.getlist('ids')
+        if ids:
+            if not all(pk.isdigit() for pk in ids):
+                return JsonResponse({'success': False, 'error': 'Invalid message id'}, status=400)
+            count = replay([int(pk) for pk in ids])
+        else:
+            count = replay()
+        logging.writeToFile(f"Discord Webhooks outbox: {count} message(s) queued for replay")
+        return JsonResponse({'success': True, 'message': f'{count} message(s) queued for replay', 'count': count})
+
+    except Exception as e:
+        logging.writeToFile(f"Error replaying webhook outbox: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Fail2banSettings, SecurityEvent, BannedIP, WhitelistIP, BlacklistIP
+from .models import (
+    Fail2banSettings, SecurityEvent, BannedIP, WhitelistIP, BlacklistIP, LogCheckpoint, SecurityEventDailyRollup,
+    SecurityEventHourlyRollup, SecurityEventDailyPrefixRollup, OffenderStats, BanEscalation,
+    BanDelta, FederationPeer, CommandTask
+)
 
 @admin.register(Fail2banSettings)
 class Fail2banSettingsAdmin(admin.ModelAdmin):
@@ -22,6 +26,26 @@ class SecurityEventAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
     date_hierarchy = 'created_at'
 
+@admin.register(SecurityEventDailyRollup)
+class SecurityEventDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'event_type', 'count']
+    list_filter = ['event_type']
+    date_hierarchy = 'day'
+
+@admin.register(SecurityEventHourlyRollup)
+class SecurityEventHourlyRollupAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'event_type', 'jail_name', 'source_prefix', 'count']
+    list_filter = ['event_type', 'jail_name']
+    search_fields = ['source_prefix']
+    date_hierarchy = 'hour'
+
+@admin.register(SecurityEventDailyPrefixRollup)
+class SecurityEventDailyPrefixRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'event_type', 'jail_name', 'source_prefix', 'count']
+    list_filter = ['event_type', 'jail_name']
+    search_fields = ['source_prefix']
+    date_hierarchy = 'day'
+
 @admin.register(BannedIP)
 class BannedIPAdmin(admin.ModelAdmin):
     list_display = ['ip_address', 'jail_name', 'is_active', 'banned_at', 'expires_at']
@@ -29,6 +53,18 @@ class BannedIPAdmin(admin.ModelAdmin):
     search_fields = ['ip_address', 'jail_name']
     readonly_fields = ['banned_at']
 
+@admin.register(BanEscalation)
+class BanEscalationAdmin(admin.ModelAdmin):
+    list_display = ['ip_address', 'level', 'ban_count', 'last_jail', 'last_banned_at', 'ban_duration']
+    search_fields = ['ip_address']
+    ordering = ['-last_banned_at']
+
+@admin.register(OffenderStats)
+class OffenderStatsAdmin(admin.ModelAdmin):
+    list_display = ['ip_address', 'source_prefix', 'attack_count', 'ban_count', 'last_banned_at', 'last_seen']
+    search_fields = ['ip_address', 'source_prefix', 'jails']
+    date_hierarchy = 'last_seen'
+
 @admin.register(WhitelistIP)
 class WhitelistIPAdmin(admin.ModelAdmin):
     list_display = ['ip_address', 'is_active', 'added_at', 'description']
@@ -42,3 +78,26 @@ class BlacklistIPAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'added_at']
     search_fields = ['ip_address', 'description']
     readonly_fields = ['added_at']
+
+@admin.register(LogCheckpoint)
+class LogCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['path', 'inode', 'offset', 'updated_at']
+    readonly_fields = ['updated_at']
+
+@admin.register(BanDelta)
+class BanDeltaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'action', 'ip_address', 'jail_name', 'duration', 'origin', 'created_at']
+    list_filter = ['action', 'origin']
+    search_fields = ['ip_address']
+
+@admin.register(FederationPeer)
+class FederationPeerAdmin(admin.ModelAdmin):
+    list_display = ['name', 'url', 'jail_name', 'is_active', 'last_seq', 'remote_seq', 'last_pulled_at', 'last_error']
+    list_filter = ['is_active']
+    readonly_fields = ['last_seq', 'remote_seq', 'last_delta_at', 'last_lag_seconds', 'last_pulled_at', 'last_error', 'applied_count', 'conflict_count']
+
+@admin.register(CommandTask)
+class CommandTaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['result', 'created_at', 'started_at', 'finished_at']
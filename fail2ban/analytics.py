@@ -0,0 +1,308 @@
+import ipaddress
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import OffenderStats, BlacklistIP
+from .ipindex import IPIntervalIndex, source_prefix
+from .stats import WINDOWS, DEFAULT_WINDOW, local_now, rollup_querysets, sum_rollups
+
+# Offender scores halve every week without new activity
+SCORE_HALF_LIFE = timedelta(days=7)
+SCORE_LANDMARK = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+EVENT_WEIGHTS = {
+    'attack': 1.0,
+    'ban': 10.0,
+}
+
+TOP_LIMIT = 20
+# Escalation thresholds
+RANGE_BAN_MIN_HOSTS = 3       # distinct banned hosts in one /24 (/48)
+REPEAT_OFFENDER_MIN_BANS = 3  # bans of one address
+CLUSTER_MIN_PREFIXES = 4      # range-ban candidates in one /16 (/32)
+ESCALATION_WINDOW = '7d'
+
+# Broader prefix each /24 (IPv4) or /48 (IPv6) rolls up into
+SUPERNET_PREFIX = {4: 16, 6: 32}
+
+
+def _time_key(when):
+    """Position of a datetime on the decay scale, in half-lives since the landmark"""
+    landmark = SCORE_LANDMARK if timezone.is_aware(when) else SCORE_LANDMARK.replace(tzinfo=None)
+    return (when - landmark) / SCORE_HALF_LIFE
+
+
+def log2_add(a, b):
+    """log2(2^a + 2^b) without overflow"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def event_score_key(event_type, when, count=1):
+    """Forward-decay contribution of count events at one time, as a log2 weight"""
+    return math.log2(EVENT_WEIGHTS[event_type] * count) + _time_key(when)
+
+
+def decayed_score(score_key, now=None):
+    """Current offender score from a stored score_key"""
+    if score_key is None:
+        return 0.0
+    return 2 ** (score_key - _time_key(now or timezone.now()))
+
+
+def supernet(prefix):
+    """/16 (IPv4) or /32 (IPv6) network enclosing a /24 or /48 prefix string"""
+    network = ipaddress.ip_network(prefix)
+    return str(network.supernet(new_prefix=SUPERNET_PREFIX[network.version]))
+
+
+def record_offenders(events):
+    """Fold events into the per-address counters
+
+    Args:
+        events: iterable of (ip_address, event_type, jail_name, created_at)
+    """
+    updates = {}
+    for ip, event_type, jail, created_at in events:
+        if not ip or event_type not in EVENT_WEIGHTS:
+            continue
+        try:
+            ip = str(ipaddress.ip_address(ip))
+        except ValueError:
+            continue
+        entry = updates.get(ip)
+        if entry is None:
+            entry = updates[ip] = {
+                'attacks': 0, 'bans': 0, 'jails': set(),
+                'first': created_at, 'last': created_at, 'last_ban': None, 'score_key': None,
+            }
+        if event_type == 'ban':
+            entry['bans'] += 1
+            entry['last_ban'] = max(entry['last_ban'] or created_at, created_at)
+        else:
+            entry['attacks'] += 1
+        if jail:
+            entry['jails'].add(jail)
+        entry['first'] = min(entry['first'], created_at)
+        entry['last'] = max(entry['last'], created_at)
+        entry['score_key'] = log2_add(entry['score_key'], event_score_key(event_type, created_at))
+
+    if not updates:
+        return
+
+    with transaction.atomic():
+        existing = OffenderStats.objects.select_for_update().in_bulk(list(updates), field_name='ip_address')
+        to_create = []
+        to_update = []
+        for ip, entry in updates.items():
+            row = existing.get(ip)
+            if row is None:
+                row = OffenderStats(ip_address=ip, source_prefix=source_prefix(ip), first_seen=entry['first'], last_seen=entry['last'])
+                to_create.append(row)
+            else:
+                row.first_seen = min(row.first_seen, entry['first'])
+                row.last_seen = max(row.last_seen, entry['last'])
+                to_update.append(row)
+            row.attack_count += entry['attacks']
+            row.ban_count += entry['bans']
+            if entry['last_ban'] is not None:
+                row.last_banned_at = max(row.last_banned_at or entry['last_ban'], entry['last_ban'])
+            jails = set(filter(None, row.jails.split(','))) | entry['jails']
+            row.jails = ','.join(sorted(jails))[:255]
+            row.score_key = log2_add(row.score_key, entry['score_key'])
+
+        if to_create:
+            OffenderStats.objects.bulk_create(to_create, batch_size=1000)
+        if to_update:
+            OffenderStats.objects.bulk_update(
+                to_update,
+                ['attack_count', 'ban_count', 'jails', 'first_seen', 'last_seen', 'last_banned_at', 'score_key'],
+                batch_size=1000
+            )
+
+
+def _window_start(window):
+    if window not in WINDOWS:
+        raise ValueError(f'Unknown analytics window: {window}')
+    span, bucket = WINDOWS[window]
+    return local_now() - span, bucket, span
+
+
+def top_offenders(window=DEFAULT_WINDOW, limit=TOP_LIMIT):
+    """Addresses active in the window, ranked by decayed offender score"""
+    since, _, _ = _window_start(window)
+    now = timezone.now()
+    rows = (
+        OffenderStats.objects.filter(last_seen__gte=since, score_key__isnull=False)
+        .order_by(F('score_key').desc())[:limit]
+    )
+    return [
+        {
+            'ip': row.ip_address,
+            'prefix': row.source_prefix,
+            'score': round(decayed_score(row.score_key, now), 2),
+            'attacks': row.attack_count,
+            'bans': row.ban_count,
+            'jails': [jail for jail in row.jails.split(',') if jail],
+            'first_seen': row.first_seen.isoformat(),
+            'last_seen': row.last_seen.isoformat(),
+        }
+        for row in rows
+    ]
+
+
+def cluster_prefixes(prefix_counts, min_prefixes=2):
+    """Merge adjacent offending /24 (/48) prefixes into contiguous blocks
+
+    An ASN-free stand-in for network ownership: neighbouring prefixes that
+    are all attacking usually belong to the same provider.
+    """
+    index = IPIntervalIndex(prefix_counts)
+    members = defaultdict(list)
+    for prefix in prefix_counts:
+        members[index.lookup(prefix)].append(prefix)
+
+    clusters = [
+        {
+            'network': str(block),
+            'prefixes': len(prefixes),
+            'count': sum(prefix_counts[prefix] for prefix in prefixes),
+        }
+        for block, prefixes in members.items()
+        if block is not None and len(prefixes) >= min_prefixes
+    ]
+    clusters.sort(key=lambda cluster: cluster['count'], reverse=True)
+    return clusters
+
+
+def get_analytics(window=DEFAULT_WINDOW, limit=TOP_LIMIT):
+    """Top offenders, prefix aggregation, clusters and per-jail rates for a window
+
+    Prefix and jail figures come from the hourly/daily rollups and offender
+    ranking from the incremental OffenderStats counters, so nothing here
+    scans SecurityEvent.
+    """
+    since, bucket, span = _window_start(window)
+    querysets = rollup_querysets(bucket, since)
+    hours = span.total_seconds() / 3600
+
+    by_jail = sum_rollups(querysets, 'jail_name', 'event_type')
+    jails = defaultdict(Counter)
+    for (jail, event_type), count in by_jail.items():
+        jails[jail or 'unknown'][event_type] += count
+    jail_rates = sorted(
+        (
+            {
+                'jail': jail,
+                'attacks': counts['attack'],
+                'bans': counts['ban'],
+                'attacks_per_hour': round(counts['attack'] / hours, 2),
+                'bans_per_hour': round(counts['ban'] / hours, 2),
+            }
+            for jail, counts in jails.items()
+        ),
+        key=lambda rate: rate['attacks'] + rate['bans'],
+        reverse=True
+    )
+
+    prefixes = sum_rollups(
+        [queryset.filter(event_type__in=list(EVENT_WEIGHTS)).exclude(source_prefix='') for queryset in querysets],
+        'source_prefix'
+    )
+    supernets = Counter()
+    for prefix, count in prefixes.items():
+        supernets[supernet(prefix)] += count
+
+    return {
+        'window': window,
+        'top_offenders': top_offenders(window, limit),
+        'top_prefixes': [{'prefix': prefix, 'count': count} for prefix, count in prefixes.most_common(limit)],
+        'top_supernets': [{'prefix': prefix, 'count': count} for prefix, count in supernets.most_common(limit)],
+        'clusters': cluster_prefixes(prefixes)[:limit],
+        'jail_rates': jail_rates,
+    }
+
+
+def _overlaps(network, networks):
+    return any(network.version == other.version and network.overlaps(other) for other in networks)
+
+
+def get_recommendations(window=ESCALATION_WINDOW, min_hosts=RANGE_BAN_MIN_HOSTS, min_bans=REPEAT_OFFENDER_MIN_BANS, whitelist=None):
+    """Recommended escalations based on recent bans
+
+    - range_ban a /24 (/48) once min_hosts distinct addresses in it were banned
+    - range_ban the enclosing /16 (/32) when CLUSTER_MIN_PREFIXES of its /24s qualify
+    - blacklist an address banned min_bans times
+
+    Targets already blacklisted, or overlapping the whitelist, are skipped.
+
+    Args:
+        whitelist: whitelisted networks; defaults to Fail2banManager's whitelist
+    """
+    since, _, _ = _window_start(window)
+    if whitelist is None:
+        from .utils import Fail2banManager
+        whitelist = Fail2banManager().get_whitelist_index().networks
+    blacklist = IPIntervalIndex(BlacklistIP.objects.filter(is_active=True).values_list('ip_address', flat=True))
+
+    recommendations = []
+    recent = OffenderStats.objects.filter(last_banned_at__gte=since)
+
+    candidates = (
+        recent.exclude(source_prefix='')
+        .order_by()
+        .values('source_prefix')
+        .annotate(hosts=Count('id'))
+        .filter(hosts__gte=min_hosts)
+    )
+    prefix_hosts = {row['source_prefix']: row['hosts'] for row in candidates}
+    by_supernet = defaultdict(list)
+    for prefix in prefix_hosts:
+        by_supernet[supernet(prefix)].append(prefix)
+
+    for network_value, members in by_supernet.items():
+        if len(members) < CLUSTER_MIN_PREFIXES:
+            continue
+        network = ipaddress.ip_network(network_value)
+        if network in blacklist or _overlaps(network, whitelist):
+            continue
+        recommendations.append({
+            'action': 'range_ban',
+            'scope': 'cluster',
+            'target': network_value,
+            'hosts': sum(prefix_hosts[prefix] for prefix in members),
+            'reason': f'{len(members)} prefixes in {network_value} each had at least {min_hosts} banned hosts',
+        })
+
+    for prefix, hosts in sorted(prefix_hosts.items(), key=lambda item: item[1], reverse=True):
+        network = ipaddress.ip_network(prefix)
+        if network in blacklist or _overlaps(network, whitelist):
+            continue
+        recommendations.append({
+            'action': 'range_ban',
+            'scope': 'prefix',
+            'target': prefix,
+            'hosts': hosts,
+            'reason': f'{hosts} distinct hosts in {prefix} banned in the last {window}',
+        })
+
+    repeat = recent.filter(ban_count__gte=min_bans).order_by('-ban_count')[:TOP_LIMIT * 5]
+    for row in repeat:
+        network = ipaddress.ip_network(row.ip_address)
+        if network in blacklist or _overlaps(network, whitelist):
+            continue
+        recommendations.append({
+            'action': 'blacklist',
+            'scope': 'host',
+            'target': row.ip_address,
+            'hosts': 1,
+            'reason': f'Banned {row.ban_count} times, last at {row.last_banned_at.isoformat()}',
+        })
+
+    return recommendations
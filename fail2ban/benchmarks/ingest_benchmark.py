@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Synthetic fail2ban.log generator and parser benchmark
+
+Generates a log of the requested size with a realistic mix of Found/Ban/
+Unban and noise lines, then times the same read loop the ingester uses,
+and a full Fail2banLogIngester run over the file: bulk SecurityEvent
+inserts, BannedIP upserts and the rollup and offender counters. The
+ingest run writes to the panel database inside a transaction that is
+rolled back afterwards, so it leaves no rows behind. The file can also be
+replayed for good with:
+
+    python3 manage.py fail2ban_ingest --path /tmp/fail2ban-synthetic.log --reset
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logparse import iter_action_lines
+
+CYBERPANEL_ROOT = '/usr/local/CyberCP'
+JAILS = ['sshd', 'openlitespeed', 'cyberpanel', 'postfix', 'dovecot']
+NOISE = [
+    'fail2ban.filter         [{pid}]: INFO    [{jail}] Found {ip} - {stamp}',
+    'fail2ban.actions        [{pid}]: NOTICE  [{jail}] Ban {ip}',
+    'fail2ban.actions        [{pid}]: NOTICE  [{jail}] Unban {ip}',
+    'fail2ban.filter         [{pid}]: INFO    [{jail}] Ignore {ip} by ip',
+    'fail2ban.utils          [{pid}]: ERROR   7f3a2c1b9e80 -- returned 1',
+    'fail2ban.jail           [{pid}]: INFO    Jail \'{jail}\' started',
+    'fail2ban.filtersystemd  [{pid}]: INFO    [{jail}] Jail is in operation now (process new journal entries)',
+]
+WEIGHTS = [70, 8, 6, 4, 4, 4, 4]
+
+
+def generate(path, size_mb, seed=1):
+    """Write a synthetic fail2ban log of roughly size_mb megabytes"""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    stamp = datetime(2026, 1, 1)
+    written = 0
+    lines = 0
+    with open(path, 'w') as f:
+        while written < target:
+            chunk = []
+            for _ in range(10000):
+                stamp += timedelta(milliseconds=rng.randint(1, 400))
+                ip = f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+                template = rng.choices(NOISE, WEIGHTS)[0]
+                chunk.append(
+                    stamp.strftime('%Y-%m-%d %H:%M:%S,') + f'{stamp.microsecond // 1000:03d} '
+                    + template.format(pid=4321, jail=rng.choice(JAILS), ip=ip, stamp=stamp.strftime('%Y-%m-%d %H:%M:%S'))
+                    + '\n'
+                )
+            data = ''.join(chunk)
+            f.write(data)
+            written += len(data)
+            lines += len(chunk)
+    return lines
+
+
+def benchmark(path):
+    """Time the ingester's read and parse loop (no database writes)"""
+    counts = {'ban': 0, 'unban': 0, 'attack': 0}
+    lines = 0
+    started = time.monotonic()
+    with open(path, 'rb') as f:
+        for _, event in iter_action_lines(f):
+            lines += 1
+            if event is not None:
+                counts[event['event_type']] += 1
+    elapsed = time.monotonic() - started
+    return lines, counts, elapsed
+
+
+class _Rollback(Exception):
+    pass
+
+
+def benchmark_ingest(path):
+    """Time a Fail2banLogIngester run over the file, rolled back afterwards"""
+    sys.path.insert(0, CYBERPANEL_ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CyberCP.settings')
+    import django
+    django.setup()
+    from django.db import transaction
+    from fail2ban.ingest import Fail2banLogIngester
+    from fail2ban.models import LogCheckpoint
+
+    try:
+        with transaction.atomic():
+            LogCheckpoint.objects.filter(path=path).delete()
+            # Escalation would run firewall-cmd for the synthetic offenders
+            ingester = Fail2banLogIngester(log_path=path, enforce_escalation=False)
+            started = time.monotonic()
+            stats = ingester.ingest()
+            elapsed = time.monotonic() - started
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='/tmp/fail2ban-synthetic.log')
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--skip-generate', action='store_true', help='Benchmark an existing file')
+    parser.add_argument('--parse-only', action='store_true', help='Skip the database ingest run')
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        started = time.monotonic()
+        lines = generate(args.output, args.size_mb)
+        print(f'Generated {lines:,} lines ({args.size_mb} MB) in {time.monotonic() - started:.1f}s')
+
+    size = os.path.getsize(args.output)
+    lines, counts, elapsed = benchmark(args.output)
+    print(f'Parsed {lines:,} lines in {elapsed:.1f}s: {lines / elapsed:,.0f} lines/s, {size / elapsed / 1024 / 1024:.1f} MB/s')
+    print(f'Events: {counts}')
+
+    if not args.parse_only:
+        stats, elapsed = benchmark_ingest(args.output)
+        print(
+            f'Ingested {stats["events"]:,} events from {stats["lines"]:,} lines in {elapsed:.1f}s: '
+            f'{stats["lines"] / elapsed:,.0f} lines/s, {stats["events"] / elapsed:,.0f} events/s, '
+            f'{size / elapsed / 1024 / 1024:.1f} MB/s'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import time
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import CharField, Count, Max, Q, Value
+from .models import Fail2banSettings, SecurityEvent, BannedIP, WhitelistIP, BlacklistIP
+from .logparse import FAIL2BAN_LOG
+from .stats import get_statistics, DEFAULT_WINDOW
+from .utils import Fail2banManager
+
+# How long a built dashboard is served while its change markers stay put;
+# past this it's rebuilt anyway, for firewall-only changes and statistics
+# windows moving on
+DASHBOARD_TTL = 10
+
+# window -> (change marker, built at, data, etag)
+_dashboards = {}
+
+
+def settings_data(settings):
+    """Settings as returned by the settings API"""
+    return {
+        'email_notifications': settings.email_notifications,
+        'auto_ban_threshold': settings.auto_ban_threshold,
+        'ban_duration': settings.ban_duration,
+        'enabled_jails': settings.enabled_jails or 'sshd,openlitespeed,cyberpanel',
+        'event_retention_days': settings.event_retention_days,
+        'archive_pruned_events': settings.archive_pruned_events,
+        'escalation_enabled': settings.escalation_enabled,
+        'escalation_steps': settings.escalation_steps,
+        'escalation_reset_days': settings.escalation_reset_days,
+        'federation_enabled': settings.federation_enabled,
+        'federation_token_set': bool(settings.federation_token)
+    }
+
+
+def _list_entries():
+    """Active whitelist and blacklist rows in a single UNION ALL query"""
+    def rows(model, kind):
+        return (
+            model.objects.filter(is_active=True)
+            .order_by()
+            .annotate(kind=Value(kind, output_field=CharField()))
+            .values_list('kind', 'ip_address', 'description', 'added_at')
+        )
+
+    entries = {'whitelist': [], 'blacklist': []}
+    for kind, ip, description, added_at in rows(WhitelistIP, 'whitelist').union(
+        rows(BlacklistIP, 'blacklist'), all=True
+    ):
+        entries[kind].append({'ip_address': ip, 'description': description, 'added_at': added_at})
+    for kind in entries:
+        entries[kind].sort(key=lambda entry: entry['added_at'])
+    return entries
+
+
+def get_dashboard(manager=None, window=DEFAULT_WINDOW):
+    """Everything the dashboard tabs show, from one fail2ban snapshot
+
+    The service state, jails, bans and firewall rules come from a single
+    Fail2banManager.get_snapshot() call; the database side is read in one
+    transaction so every section reflects the same moment. Nothing in the
+    model changes unless the underlying state does (uptime is reported as
+    a start time), so it can be fingerprinted with dashboard_etag().
+    """
+    manager = manager or Fail2banManager()
+    snapshot = manager.get_snapshot()
+    whitelist = manager.get_whitelist()
+
+    with transaction.atomic():
+        settings = Fail2banSettings.get_settings()
+        entries = _list_entries()
+        ban_rows = {
+            ip: (banned_at, expires_at)
+            for ip, banned_at, expires_at in BannedIP.objects.filter(is_active=True)
+            .values_list('ip_address', 'banned_at', 'expires_at')
+            .iterator(chunk_size=10000)
+        }
+        statistics = get_statistics(window)
+
+    banned_ips = []
+    for jail in snapshot['jails']:
+        for ip in jail['banned_ip_list']:
+            banned_at, expires_at = ban_rows.get(ip, (None, None))
+            banned_ips.append({'ip': ip, 'jail': jail['name'], 'banned_at': banned_at, 'expires_at': expires_at})
+
+    jail_names = [jail['name'] for jail in snapshot['jails']]
+    return {
+        'status': {
+            'running': snapshot['running'],
+            'jails': jail_names,
+            'total_jails': len(jail_names),
+            'active_jails': len(jail_names),
+            'banned_ips': len(banned_ips),
+            'started_at': snapshot['started_at'],
+            'status': 'Active' if snapshot['running'] else 'Inactive'
+        },
+        'jails': snapshot['jails'],
+        'banned_ips': banned_ips,
+        'whitelist': {'config_ips': whitelist, 'db_ips': entries['whitelist']},
+        'blacklist': {'config_ips': snapshot['blacklist'], 'db_ips': entries['blacklist']},
+        'statistics': statistics,
+        'settings': settings_data(settings),
+    }
+
+
+def dashboard_etag(data):
+    """Strong ETag over the serialized dashboard model"""
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return '"%s"' % hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def change_marker(log_path=FAIL2BAN_LOG):
+    """Cheap fingerprint of what the dashboard is built from
+
+    fail2ban logs every ban and unban, so its log's size and modification
+    time move whenever the jails do; the database side is covered by the
+    newest ids and active row counts. None of it needs fail2ban-client.
+    """
+    try:
+        stat = os.stat(log_path)
+        log = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        log = None
+    active = Q(is_active=True)
+    rows = tuple(
+        tuple(model.objects.aggregate(last=Max('id'), active=Count('id', filter=active)).values())
+        for model in (BannedIP, WhitelistIP, BlacklistIP)
+    )
+    return (
+        log,
+        rows,
+        SecurityEvent.objects.aggregate(last=Max('id'))['last'],
+        Fail2banSettings.objects.aggregate(updated=Max('updated_at'))['updated'],
+    )
+
+
+def cached_dashboard(window=DEFAULT_WINDOW, manager=None, clock=time.monotonic):
+    """get_dashboard() and its ETag, rebuilt only once the change markers move or DASHBOARD_TTL passes
+
+    Returns:
+        tuple: (data, etag)
+    """
+    marker = change_marker()
+    cached = _dashboards.get(window)
+    now = clock()
+    if cached and cached[0] == marker and now - cached[1] < DASHBOARD_TTL:
+        return cached[2], cached[3]
+    data = get_dashboard(manager, window=window)
+    etag = dashboard_etag(data)
+    _dashboards[window] = (marker, now, data, etag)
+    return data, etag
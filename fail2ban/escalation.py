@@ -0,0 +1,154 @@
+import configparser
+import ipaddress
+import re
+from datetime import timedelta
+from django.db import transaction
+from .models import Fail2banSettings, BanEscalation
+from .jailconfig import JailConfig, JAIL_CONFIG
+from .logparse import parse_duration
+
+PERMANENT = -1
+# BannedIP.expires_at can't be null, so permanent bans expire in a century
+PERMANENT_BAN = timedelta(days=36500)
+# A ban of the same address by the same jail this soon after the last one is
+# the same ban seen twice (e.g. a manual ban, then its line in fail2ban.log)
+DUPLICATE_BAN_WINDOW = timedelta(minutes=2)
+DEFAULT_STEPS = '1h 1d 1w permanent'
+PERMANENT_WORDS = ('permanent', 'perm', 'forever')
+
+
+def parse_steps(value):
+    """Parse an escalation ladder such as "1h 1d 1w permanent" into seconds (-1 = permanent)"""
+    steps = []
+    for token in re.split(r'[\s,]+', str(value or '').strip()):
+        if not token:
+            continue
+        if token.lower() in PERMANENT_WORDS:
+            steps.append(PERMANENT)
+            continue
+        seconds = parse_duration(token)
+        if not seconds:
+            raise ValueError(f'Invalid ban duration: {token}')
+        steps.append(seconds)
+    if not steps:
+        raise ValueError('At least one escalation step is required')
+    return steps
+
+
+def load_jail_bantimes(config_file=JAIL_CONFIG, default=3600):
+    """Read bantime per jail from jail.local
+
+    Returns:
+        tuple: ({jail: seconds}, default seconds)
+    """
+    bantimes = {}
+    try:
+        config = JailConfig(config_file)
+    except (OSError, configparser.Error):
+        return bantimes, default
+    default = parse_duration(config.get('DEFAULT', 'bantime'), default)
+    for jail in config.sections():
+        bantimes[jail] = parse_duration(config.get(jail, 'bantime'), default)
+    return bantimes, default
+
+
+class EscalationPolicy:
+    """Progressive ban durations for repeat offenders
+
+    An address banned again within reset_after of its previous ban moves one
+    step up the ladder; the last step repeats. A jail's own bantime acts as
+    a floor, so escalation only ever lengthens bans. Ban history lives in
+    BanEscalation, keyed by address, so each ban costs one indexed lookup.
+    """
+
+    def __init__(self, steps, reset_after, jail_bantimes=None, default_bantime=3600, enabled=True):
+        self.steps = steps
+        self.reset_after = reset_after
+        self.jail_bantimes = jail_bantimes or {}
+        self.default_bantime = default_bantime
+        self.enabled = enabled
+
+    @classmethod
+    def from_settings(cls, config_file=JAIL_CONFIG):
+        settings = Fail2banSettings.get_settings()
+        try:
+            steps = parse_steps(settings.escalation_steps)
+        except ValueError:
+            steps = parse_steps(DEFAULT_STEPS)
+        jail_bantimes, default_bantime = load_jail_bantimes(config_file, settings.ban_duration)
+        return cls(
+            steps,
+            timedelta(days=settings.escalation_reset_days),
+            jail_bantimes,
+            default_bantime,
+            settings.escalation_enabled
+        )
+
+    def bantime(self, jail):
+        """The jail's configured bantime in seconds (-1 for permanent)"""
+        return self.jail_bantimes.get(jail, self.default_bantime)
+
+    def duration(self, level, jail):
+        """Ban duration in seconds for the given escalation level (-1 for permanent)"""
+        base = self.bantime(jail)
+        if not self.enabled or base < 0:
+            return base
+        step = self.steps[min(level, len(self.steps) - 1)]
+        if step < 0:
+            return PERMANENT
+        return max(step, base)
+
+    def next_level(self, row, banned_at):
+        if row is None or not self.enabled or banned_at - row.last_banned_at > self.reset_after:
+            return 0
+        return row.level + 1
+
+    def record_bans(self, bans):
+        """Record bans and work out each address's escalated duration
+
+        Args:
+            bans: iterable of (ip_address, jail, banned_at), oldest first
+
+        Returns:
+            dict: {ip: (level, duration)} for the latest ban of each address
+        """
+        bans = [(str(ipaddress.ip_address(ip)), jail, banned_at) for ip, jail, banned_at in bans]
+        if not bans:
+            return {}
+
+        results = {}
+        with transaction.atomic():
+            rows = BanEscalation.objects.select_for_update().in_bulk({ip for ip, _, _ in bans}, field_name='ip_address')
+            created = {}
+            changed = set()
+            for ip, jail, banned_at in bans:
+                row = rows.get(ip)
+                if row is not None and row.last_jail == jail and abs(banned_at - row.last_banned_at) < DUPLICATE_BAN_WINDOW:
+                    results[ip] = (row.level, row.ban_duration)
+                    continue
+                level = self.next_level(row, banned_at)
+                duration = self.duration(level, jail)
+                if row is None:
+                    row = rows[ip] = created[ip] = BanEscalation(ip_address=ip)
+                row.level = level
+                row.ban_count += 1
+                row.last_jail = jail
+                row.last_banned_at = banned_at
+                row.ban_duration = duration
+                changed.add(ip)
+                results[ip] = (level, duration)
+
+            if created:
+                BanEscalation.objects.bulk_create(created.values(), batch_size=1000)
+            updated = [rows[ip] for ip in changed if ip not in created]
+            if updated:
+                BanEscalation.objects.bulk_update(
+                    updated,
+                    ['level', 'ban_count', 'last_jail', 'last_banned_at', 'ban_duration'],
+                    batch_size=1000
+                )
+        return results
+
+    def record_ban(self, ip, jail, banned_at):
+        """Record one ban; returns (level, duration)"""
+        return self.record_bans([(ip, jail, banned_at)])[str(ipaddress.ip_address(ip))]
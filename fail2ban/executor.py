@@ -0,0 +1,111 @@
+import asyncio
+import os
+import signal
+import threading
+
+# Privileged commands (fail2ban-client, firewall-cmd, systemctl) running at once per process
+MAX_CONCURRENT_COMMANDS = 4
+# A command waiting longer than this for a slot fails rather than holding its worker
+QUEUE_TIMEOUT = 15
+DEFAULT_TIMEOUT = 30
+
+
+def command_result(success, stdout='', stderr='', returncode=-1):
+    return {
+        'success': success,
+        'stdout': stdout,
+        'stderr': stderr,
+        'returncode': returncode
+    }
+
+
+class CommandExecutor:
+    """Run shell commands as asyncio subprocesses on a private event loop
+
+    The loop runs in a daemon thread started on first use (and again after
+    a fork). A semaphore caps how many commands run at once, so a burst of
+    slow firewall-cmd reloads queues up behind MAX_CONCURRENT_COMMANDS
+    instead of each pinning a Django worker; a command that can't get a
+    slot within queue_timeout gives up. A command that outlives its
+    timeout is killed together with everything it spawned.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_COMMANDS, queue_timeout=QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.pid = None
+        self.semaphore = None
+        self.running = 0
+
+    def _get_loop(self):
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.loop = asyncio.new_event_loop()
+                self.pid = os.getpid()
+                self.semaphore = None
+                self.running = 0
+                self.thread = threading.Thread(
+                    target=self.loop.run_forever, name='fail2ban-command-executor', daemon=True
+                )
+                self.thread.start()
+            return self.loop
+
+    async def run_async(self, command, timeout=DEFAULT_TIMEOUT):
+        """Run a shell command on the executor loop; returns the run_command() dict"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return command_result(False, stderr='Too many commands running, try again shortly')
+
+        self.running += 1
+        try:
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                # The shell's children share its session; take them all down
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+                return command_result(False, stderr='Command timed out')
+            return command_result(
+                process.returncode == 0,
+                stdout.decode('utf-8', errors='replace').strip(),
+                stderr.decode('utf-8', errors='replace').strip(),
+                process.returncode
+            )
+        except Exception as e:
+            return command_result(False, stderr=str(e))
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+    def run(self, command, timeout=DEFAULT_TIMEOUT):
+        """Run a command from synchronous code and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(self.run_async(command, timeout), self._get_loop())
+        return future.result()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide executor shared by every Fail2banManager"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = CommandExecutor()
+        return _executor
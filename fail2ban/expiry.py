@@ -0,0 +1,87 @@
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import BannedIP
+from .escalation import EscalationPolicy, PERMANENT_BAN
+from .utils import Fail2banManager
+
+EXPIRY_BATCH_SIZE = 1000
+# At most this many batches per tick; the rest waits for the next one
+MAX_BATCHES_PER_TICK = 10
+TICK_INTERVAL = 60
+
+
+def expire_bans(now=None, live_bans=None, policy=None, batch_size=EXPIRY_BATCH_SIZE, max_batches=MAX_BATCHES_PER_TICK):
+    """Deactivate BannedIP rows whose expires_at has passed
+
+    Due rows are read oldest first through the (is_active, expires_at)
+    index, one batch at a time, and switched off with a single UPDATE per
+    batch. A due row that fail2ban still has banned (a longer jail bantime,
+    a ban we never saw the end of) gets a fresh expiry instead.
+
+    Args:
+        live_bans: {jail: set of IPs} from Fail2banManager.get_live_bans(),
+            or None to expire on time alone
+
+    Returns:
+        dict: counts of expired and renewed rows, and whether due rows remain
+    """
+    now = now or timezone.now()
+    live = set()
+    if live_bans:
+        live = {(jail, ip) for jail, ips in live_bans.items() for ip in ips}
+        policy = policy or EscalationPolicy.from_settings()
+
+    expired = renewed = 0
+    has_more = False
+    for _ in range(max_batches):
+        due = list(
+            BannedIP.objects.filter(is_active=True, expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('id', 'ip_address', 'jail_name')[:batch_size]
+        )
+        if not due:
+            break
+
+        still_banned = [pk for pk, ip, jail in due if (jail, ip) in live]
+        with transaction.atomic():
+            if still_banned:
+                renewed += _renew(still_banned, now, policy)
+            expired += (
+                BannedIP.objects.filter(pk__in=[pk for pk, _, _ in due], is_active=True, expires_at__lte=now)
+                .update(is_active=False)
+            )
+        if len(due) < batch_size:
+            break
+    else:
+        has_more = BannedIP.objects.filter(is_active=True, expires_at__lte=now).exists()
+
+    return {'expired': expired, 'renewed': renewed, 'has_more': has_more}
+
+
+def _renew(pks, now, policy):
+    rows = list(BannedIP.objects.filter(pk__in=pks))
+    for row in rows:
+        bantime = policy.bantime(row.jail_name)
+        row.expires_at = now + (PERMANENT_BAN if bantime < 0 else timedelta(seconds=bantime))
+    BannedIP.objects.bulk_update(rows, ['expires_at'])
+    return len(rows)
+
+
+def run_expiry(interval=TICK_INTERVAL, loop=False, reconcile=True, manager=None, **kwargs):
+    """Run one expiry tick, or keep ticking every interval seconds
+
+    A tick that hits its batch limit is followed immediately by another
+    rather than waiting out the interval.
+    """
+    if reconcile and manager is None:
+        manager = Fail2banManager()
+
+    while True:
+        live_bans = manager.get_live_bans() if reconcile else None
+        summary = expire_bans(live_bans=live_bans, **kwargs)
+        if not loop:
+            return summary
+        if not summary['has_more']:
+            time.sleep(interval)
@@ -0,0 +1,286 @@
+import hmac
+import ipaddress
+import json
+import socket
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Fail2banSettings, BanDelta, FederationPeer
+from .escalation import PERMANENT_BAN, DUPLICATE_BAN_WINDOW
+from .utils import Fail2banManager
+
+PULL_BATCH_SIZE = 1000
+MAX_PULL_BATCHES = 20
+MAX_PULL_LIMIT = 5000
+FETCH_TIMEOUT = 10
+
+
+def node_name():
+    return socket.gethostname()
+
+
+def delta_expiry(created_at, duration):
+    return created_at + (PERMANENT_BAN if duration < 0 else timedelta(seconds=duration))
+
+
+def check_token(token):
+    """Whether token is this node's federation token (and federation is on)"""
+    settings = Fail2banSettings.get_settings()
+    if not settings.federation_enabled or not settings.federation_token or not token:
+        return False
+    return hmac.compare_digest(token.encode(), settings.federation_token.encode())
+
+
+def publish_deltas(changes):
+    """Append local ban/unban deltas for peers to pull
+
+    Bans and unbans caused by applying a peer's ban (fail2ban logs those
+    too) are left out, so deltas never echo between nodes.
+
+    Args:
+        changes: iterable of (action, ip_address, jail, duration, created_at)
+    """
+    changes = list(changes)
+    if not changes or not Fail2banSettings.get_settings().federation_enabled:
+        return 0
+
+    earliest = min(created_at for _, _, _, _, created_at in changes)
+    remote = defaultdict(list)
+    rows = (
+        BanDelta.objects.filter(
+            action='ban',
+            ip_address__in={ip for _, ip, _, _, _ in changes},
+            expires_at__gte=earliest - DUPLICATE_BAN_WINDOW
+        )
+        .exclude(origin='')
+        .values_list('ip_address', 'created_at', 'expires_at')
+    )
+    for ip, applied_at, expires_at in rows:
+        remote[ip].append((applied_at - DUPLICATE_BAN_WINDOW, expires_at + DUPLICATE_BAN_WINDOW))
+
+    deltas = [
+        BanDelta(
+            action=action,
+            ip_address=ip,
+            jail_name=jail,
+            duration=duration if action == 'ban' else 0,
+            expires_at=delta_expiry(created_at, duration) if action == 'ban' else None,
+            created_at=created_at
+        )
+        for action, ip, jail, duration, created_at in changes
+        if not any(start <= created_at <= end for start, end in remote.get(ip, ()))
+    ]
+    BanDelta.objects.bulk_create(deltas, batch_size=1000)
+    return len(deltas)
+
+
+def get_deltas(since=0, limit=PULL_BATCH_SIZE):
+    """Local deltas after sequence number since, oldest first
+
+    Returns:
+        dict: node, deltas, head (newest local sequence) and has_more
+    """
+    limit = max(1, min(int(limit), MAX_PULL_LIMIT))
+    local = BanDelta.objects.filter(origin='')
+    rows = list(
+        local.filter(id__gt=since)
+        .order_by('id')
+        .values('id', 'action', 'ip_address', 'jail_name', 'duration', 'created_at')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    head = local.aggregate(head=Max('id'))['head'] or 0
+    return {
+        'node': node_name(),
+        'deltas': [
+            {
+                'seq': row['id'],
+                'action': row['action'],
+                'ip': row['ip_address'],
+                'jail': row['jail_name'],
+                'duration': row['duration'],
+                'created_at': row['created_at'].isoformat(),
+            }
+            for row in rows
+        ],
+        'head': head,
+        'has_more': has_more,
+    }
+
+
+def http_fetch(peer, since, limit):
+    """Pull one batch of deltas from a peer's deltas endpoint"""
+    query = urllib.parse.urlencode({'since': since, 'limit': limit})
+    separator = '&' if '?' in peer.url else '?'
+    request = urllib.request.Request(
+        f'{peer.url}{separator}{query}',
+        headers={'Authorization': f'Bearer {peer.token}', 'Accept': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+        payload = json.loads(response.read().decode('utf-8'))
+    if not payload.get('success'):
+        raise ValueError(payload.get('error') or 'Peer refused the request')
+    return payload['data']
+
+
+def _parse_time(value):
+    when = datetime.fromisoformat(value)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def apply_deltas(peer, deltas, manager):
+    """Apply one batch of a peer's deltas through the bulk ban path
+
+    Only the last delta per address counts. Bans of whitelisted addresses
+    are skipped as conflicts. An unban only lifts a ban that came from the
+    same peer, never a local one.
+
+    Returns:
+        dict: applied and conflicts counts
+    """
+    latest = {}
+    for delta in deltas:
+        try:
+            ip = str(ipaddress.ip_address(delta['ip']))
+        except ValueError:
+            continue
+        latest.pop(ip, None)
+        latest[ip] = delta
+
+    whitelist = manager.get_whitelist_index()
+    bans = defaultdict(list)
+    unbans = []
+    conflicts = 0
+    for ip, delta in latest.items():
+        if delta['action'] == 'ban':
+            if ip in whitelist:
+                conflicts += 1
+            else:
+                bans[int(delta['duration'])].append(ip)
+        elif delta['action'] == 'unban':
+            unbans.append(ip)
+
+    if unbans:
+        # Most recent ban delta per address, local or from any peer
+        origins = {}
+        for ip, origin in (
+            BanDelta.objects.filter(ip_address__in=unbans, action='ban')
+            .order_by('ip_address', '-id')
+            .values_list('ip_address', 'origin')
+        ):
+            origins.setdefault(ip, origin)
+        unbans = [ip for ip in unbans if origins.get(ip) == peer.name]
+
+    now = timezone.now()
+    applied = []
+    for duration, ips in bans.items():
+        result = manager.ban_ips(ips, peer.jail_name, duration, reason=f'Federated ban from {peer.name}')
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        applied.extend(
+            BanDelta(
+                action='ban', ip_address=ip, jail_name=peer.jail_name, duration=duration,
+                expires_at=delta_expiry(now, duration), origin=peer.name, created_at=now
+            )
+            for ip in result['banned']
+        )
+    if unbans:
+        result = manager.unban_ips(unbans, peer.jail_name)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        applied.extend(
+            BanDelta(action='unban', ip_address=ip, jail_name=peer.jail_name, origin=peer.name, created_at=now)
+            for ip in unbans
+        )
+
+    BanDelta.objects.bulk_create(applied, batch_size=1000)
+    return {'applied': len(applied), 'conflicts': conflicts}
+
+
+def pull_peer(peer, fetch=http_fetch, manager=None, batch_size=PULL_BATCH_SIZE, max_batches=MAX_PULL_BATCHES):
+    """Pull and apply a peer's deltas after the last applied sequence number
+
+    fetch(peer, since, limit) returns the peer's get_deltas() payload; the
+    default pulls it over HTTP. Progress is saved after every batch, so a
+    failure resumes where it stopped.
+
+    Returns:
+        dict: applied, conflicts and seq_lag
+    """
+    manager = manager or Fail2banManager()
+    summary = {'applied': 0, 'conflicts': 0, 'seq_lag': 0}
+    try:
+        for _ in range(max_batches):
+            page = fetch(peer, peer.last_seq, batch_size)
+            if page['head'] < peer.last_seq:
+                # The peer's delta log was reset; start over
+                peer.last_seq = 0
+                continue
+
+            deltas = page['deltas']
+            with transaction.atomic():
+                if deltas:
+                    result = apply_deltas(peer, deltas, manager)
+                    summary['applied'] += result['applied']
+                    summary['conflicts'] += result['conflicts']
+                    peer.applied_count += result['applied']
+                    peer.conflict_count += result['conflicts']
+                    peer.last_seq = deltas[-1]['seq']
+                    peer.last_delta_at = _parse_time(deltas[-1]['created_at'])
+                    peer.last_lag_seconds = (timezone.now() - peer.last_delta_at).total_seconds()
+                peer.remote_seq = page['head']
+                peer.last_pulled_at = timezone.now()
+                peer.last_error = ''
+                peer.save()
+            if not page['has_more']:
+                break
+    except Exception as e:
+        peer.last_error = str(e)[:1000]
+        peer.last_pulled_at = timezone.now()
+        peer.save(update_fields=['last_seq', 'last_error', 'last_pulled_at'])
+        summary['error'] = str(e)
+
+    summary['seq_lag'] = max(0, peer.remote_seq - peer.last_seq)
+    return summary
+
+
+def pull_peers(fetch=http_fetch, manager=None):
+    """Pull every active peer; returns {peer name: summary}"""
+    manager = manager or Fail2banManager()
+    return {peer.name: pull_peer(peer, fetch, manager) for peer in FederationPeer.objects.filter(is_active=True)}
+
+
+def federation_status():
+    """Local delta head and per-peer lag metrics"""
+    settings = Fail2banSettings.get_settings()
+    now = timezone.now()
+    peers = []
+    for peer in FederationPeer.objects.all():
+        peers.append({
+            'name': peer.name,
+            'url': peer.url,
+            'jail': peer.jail_name,
+            'active': peer.is_active,
+            'last_seq': peer.last_seq,
+            'remote_seq': peer.remote_seq,
+            'seq_lag': max(0, peer.remote_seq - peer.last_seq),
+            'delivery_lag_seconds': peer.last_lag_seconds,
+            'last_delta_at': peer.last_delta_at.isoformat() if peer.last_delta_at else None,
+            'last_pulled_at': peer.last_pulled_at.isoformat() if peer.last_pulled_at else None,
+            'seconds_since_pull': (now - peer.last_pulled_at).total_seconds() if peer.last_pulled_at else None,
+            'applied': peer.applied_count,
+            'conflicts': peer.conflict_count,
+            'last_error': peer.last_error,
+        })
+    return {
+        'enabled': settings.federation_enabled,
+        'node': node_name(),
+        'head': BanDelta.objects.filter(origin='').aggregate(head=Max('id'))['head'] or 0,
+        'peers': peers,
+    }
@@ -0,0 +1,450 @@
+import configparser
+import glob
+import multiprocessing
+import os
+import re
+import subprocess
+import time
+from .jailconfig import JAIL_CONFIG
+
+FAIL2BAN_DIR = '/etc/fail2ban'
+FILTER_DIR = os.path.join(FAIL2BAN_DIR, 'filter.d')
+
+SAMPLE_LINES = 2000
+MAX_SAMPLE_LINES = 20000
+MAX_SAMPLE_BYTES = 4 * 1024 * 1024
+MAX_CANDIDATES = 10
+# Wall-clock budget for one regex over the whole sample; a regex that
+# needs more is reported as backtracking catastrophically
+REGEX_TIMEOUT = 5.0
+# Wall-clock budget for a whole filter test; regexes left when it runs
+# out are skipped rather than given their own REGEX_TIMEOUT each
+TEST_TIMEOUT = 30.0
+SLOW_LINE_US = 1000
+# A line four times longer taking this many times longer means the
+# regex is worse than quadratic on it
+SCALING_LIMIT = 16
+MATCH_EXAMPLES = 5
+
+# fail2ban's own definitions of the host tags (fail2ban/server/failregex.py)
+ADDR_RE = (
+    r'(?:(?P<ip4>(?:\d{1,3}\.){3}\d{1,3})|'
+    r'\[?(?P<ip6>(?:[0-9a-fA-F]{1,4}::?|::){1,7}(?:[0-9a-fA-F]{1,4}|(?<=:):))\]?)'
+)
+HOST_TAGS = {
+    'ADDR': ADDR_RE,
+    'HOST': r'(?:' + ADDR_RE + r'|(?P<dns>[\w\-.^_]*\w))',
+    'IP4': r'(?P<ip4>(?:\d{1,3}\.){3}\d{1,3})',
+    'IP6': r'\[?(?P<ip6>(?:[0-9a-fA-F]{1,4}::?|::){1,7}(?:[0-9a-fA-F]{1,4}|(?<=:):))\]?',
+    'DNS': r'(?P<dns>[\w\-.^_]*\w)',
+    'CIDR': r'(?P<cidr>\d+)',
+    'SUBNET': ADDR_RE + r'(?:/(?P<cidr>\d+))?',
+}
+TAG_RE = re.compile(r'<([\w\-]+)>')
+FIELD_TAG_RE = re.compile(r'<F-([\w\-]+)/?>')
+FIELD_END_RE = re.compile(r'</F-[\w\-]+>')
+
+# Dates fail2ban's default detector recognises, cut from the line before matching
+DATE_RE = re.compile(
+    r'\[?\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|\s?[+-]\d{2}:?\d{2})?\]?'
+    r'|\[?\d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}:\d{2}(?:\s[+-]\d{4})?\]?'
+    r'|(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)?\s?(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}(?:\s\d{4})?'
+    r'|^\d{10}(?:\.\d+)?'
+)
+
+NESTED_QUANTIFIER_RE = re.compile(r'\((?:\?:)?[^()]*(?:[*+]|\{\d*,\d*\})[^()]*\)(?:[*+]|\{\d*,\d*\})')
+WILDCARD_RE = re.compile(r'(?<!\\)\.[*+]')
+
+
+def strip_date(line):
+    """The line as fail2ban matches it: first recognised date cut out"""
+    match = DATE_RE.search(line)
+    if match is None:
+        return line
+    return (line[:match.start()] + line[match.end():]).strip()
+
+
+class FilterDefinition:
+    """A filter.d file with its includes, as fail2ban reads it
+
+    ``%(name)s`` references are resolved by configparser; ``<name>`` tags
+    naming an option of the filter (e.g. ``<mdre-<mode>>``) are substituted
+    afterwards, innermost first.
+    """
+
+    def __init__(self, name, filter_dir=FILTER_DIR, options=None):
+        self.name = name
+        self.filter_dir = filter_dir
+        self.parser = configparser.ConfigParser(strict=False, inline_comment_prefixes=None)
+        self.parser.optionxform = str
+        self._read(name, set())
+        if not self.parser.has_section('Definition'):
+            self.parser.add_section('Definition')
+        for key, value in (options or {}).items():
+            self.parser.set('Definition', key, value)
+
+    def _read(self, name, seen):
+        path = os.path.join(self.filter_dir, name if name.endswith('.conf') else f'{name}.conf')
+        if path in seen:
+            return
+        seen.add(path)
+        if not os.path.exists(path):
+            raise ValueError(f'Filter not found: {path}')
+
+        includes = configparser.RawConfigParser(strict=False)
+        includes.read(path)
+        for include in includes.get('INCLUDES', 'before', fallback='').split():
+            self._read(include, seen)
+        self.parser.read(path)
+        local = path[:-len('.conf')] + '.local'
+        if os.path.exists(local):
+            self.parser.read(local)
+        for include in includes.get('INCLUDES', 'after', fallback='').split():
+            self._read(include, seen)
+
+    def option(self, key):
+        try:
+            value = self.parser.get('Definition', key, fallback='')
+        except configparser.Error as e:
+            raise ValueError(f'Cannot resolve {key}: {e}')
+        return self._substitute(value)
+
+    def _substitute(self, value, depth=0):
+        def replace(match):
+            name = match.group(1)
+            if name in HOST_TAGS or name.startswith('F-') or not self.parser.has_option('Definition', name):
+                return match.group(0)
+            return self.option(name) if depth < 10 else match.group(0)
+
+        previous = None
+        while previous != value and depth < 10:
+            previous, value = value, TAG_RE.sub(replace, value)
+            depth += 1
+        return value
+
+    def regexes(self, key):
+        return [line.strip() for line in self.option(key).splitlines() if line.strip()]
+
+    @property
+    def failregex(self):
+        return self.regexes('failregex')
+
+    @property
+    def ignoreregex(self):
+        return self.regexes('ignoreregex')
+
+    @property
+    def prefregex(self):
+        return self.option('prefregex').strip()
+
+    @property
+    def journalmatch(self):
+        return self.option('journalmatch').split()
+
+
+def expand_regex(regex):
+    """Translate a fail2ban failregex into a Python regex"""
+    regex = FIELD_END_RE.sub(')', FIELD_TAG_RE.sub(lambda m: f'(?P<F_{m.group(1).replace("-", "_")}>', regex))
+    regex = regex.replace('<SKIPLINES>', '')
+    seen = set()
+
+    def replace(match):
+        name = match.group(1)
+        pattern = HOST_TAGS.get(name)
+        if pattern is None:
+            return match.group(0)
+        # A tag used twice can't repeat its group names
+        if name in seen:
+            pattern = re.sub(r'\(\?P<\w+>', '(?:', pattern)
+        seen.add(name)
+        return pattern
+
+    return TAG_RE.sub(replace, regex)
+
+
+def static_warnings(regex):
+    """Pattern shapes known to backtrack badly"""
+    warnings = []
+    if NESTED_QUANTIFIER_RE.search(regex):
+        warnings.append('Nested quantifier, e.g. (a+)+: can backtrack exponentially on a near miss')
+    wildcards = len(WILDCARD_RE.findall(regex))
+    if wildcards >= 3:
+        warnings.append(f'{wildcards} unbounded wildcards (.* or .+): a failed match retries every way of splitting the line')
+    if not regex.lstrip().startswith('^'):
+        warnings.append('Not anchored with ^: tried at every position of every line')
+    return warnings
+
+
+def _measure(compiled, lines, ignore, examples):
+    matches = ignored = 0
+    total = slowest = 0.0
+    slowest_line = None
+    matched = []
+    perf_counter = time.perf_counter
+    for line in lines:
+        start = perf_counter()
+        match = compiled.search(line)
+        elapsed = perf_counter() - start
+        total += elapsed
+        if elapsed > slowest:
+            slowest, slowest_line = elapsed, line
+        if match is None:
+            continue
+        if any(pattern.search(line) for pattern in ignore):
+            ignored += 1
+            continue
+        matches += 1
+        if len(matched) < examples:
+            host = match.groupdict().get('ip4') or match.groupdict().get('ip6') or match.groupdict().get('dns')
+            matched.append({'line': line, 'host': host})
+
+    scaling = None
+    if slowest_line:
+        longer = ' '.join([slowest_line] * 4)
+        start = perf_counter()
+        compiled.search(longer)
+        scaling = (perf_counter() - start) / max(slowest, 1e-7)
+
+    return {
+        'matches': matches,
+        'ignored': ignored,
+        'examples': matched,
+        'total_ms': round(total * 1000, 3),
+        'us_per_line': round(total * 1e6 / len(lines), 3) if lines else 0,
+        'max_line_us': round(slowest * 1e6, 3),
+        'slowest_line': slowest_line,
+        'scaling': round(scaling, 1) if scaling is not None else None,
+    }
+
+
+def _measure_child(connection, regex, lines, ignore, examples):
+    try:
+        compiled = re.compile(regex)
+        connection.send(_measure(compiled, lines, [re.compile(pattern) for pattern in ignore], examples))
+    except Exception as e:
+        connection.send({'error': str(e)})
+    finally:
+        connection.close()
+
+
+def _measure_isolated(regex, lines, ignore, timeout, examples):
+    """Run _measure in a forked child so a runaway regex can be killed"""
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_child, args=(sender, regex, lines, ignore, examples), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout):
+            try:
+                return receiver.recv()
+            except EOFError:
+                # The child died (e.g. killed for memory) without replying
+                return {'error': f'Matching process exited with code {process.exitcode} without a result'}
+        return None
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
+
+def benchmark_regex(regex, lines, ignoreregex=(), timeout=REGEX_TIMEOUT, isolate=True, examples=MATCH_EXAMPLES):
+    """Match one fail2ban failregex against sample lines and time it
+
+    Returns:
+        dict: regex, matches, ignored, examples, total_ms, us_per_line,
+        max_line_us, slowest_line, scaling, warnings and error
+    """
+    result = {'regex': regex, 'warnings': static_warnings(regex), 'error': None}
+    expanded = expand_regex(regex)
+    ignore = [expand_regex(pattern) for pattern in ignoreregex]
+    try:
+        re.compile(expanded)
+        for pattern in ignore:
+            re.compile(pattern)
+    except re.error as e:
+        result['error'] = f'Invalid regex: {e}'
+        return result
+
+    if timeout <= 0:
+        result['error'] = 'Skipped: the filter test ran out of time'
+        return result
+
+    if isolate:
+        measured = _measure_isolated(expanded, lines, ignore, timeout, examples)
+    else:
+        measured = _measure(re.compile(expanded), lines, [re.compile(pattern) for pattern in ignore], examples)
+    if measured is None:
+        result['error'] = f'Timed out after {timeout:g}s: catastrophic backtracking'
+        result['warnings'].append('Catastrophic backtracking: the sample could not be matched in time')
+        return result
+    if measured.get('error'):
+        result['error'] = measured['error']
+        return result
+
+    result.update(measured)
+    if result['max_line_us'] > SLOW_LINE_US:
+        result['warnings'].append(f'A single line took {result["max_line_us"] / 1000:.1f} ms')
+    if result['scaling'] and result['scaling'] > SCALING_LIMIT:
+        result['warnings'].append(
+            f'A 4x longer line took {result["scaling"]:.0f}x longer: worse than quadratic backtracking'
+        )
+    return result
+
+
+def read_sample(path, lines=SAMPLE_LINES):
+    """Last lines of a log file, bounded by MAX_SAMPLE_BYTES"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - MAX_SAMPLE_BYTES))
+        data = f.read()
+    sample = data.decode('utf-8', 'replace').splitlines()
+    if size > MAX_SAMPLE_BYTES:
+        sample = sample[1:]  # first line is probably cut
+    return sample[-lines:]
+
+
+def read_journal_sample(matches, lines=SAMPLE_LINES):
+    """Recent journal lines for a filter's journalmatch"""
+    command = ['journalctl', '--no-pager', '-o', 'short', '-n', str(lines)] + list(matches)
+    result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise ValueError(f'journalctl failed: {result.stderr.strip()}')
+    return [line for line in result.stdout.splitlines() if not line.startswith('-- ')]
+
+
+def resolve_jail(jail, config_file=JAIL_CONFIG):
+    """Filter name, filter options and log paths of a jail
+
+    jail.local is read on top of jail.conf and the paths-*.conf files so
+    logpath references such as %(sshd_log)s resolve.
+    """
+    parser = configparser.ConfigParser(strict=False, inline_comment_prefixes=('#',))
+    parser.optionxform = str
+    base = os.path.dirname(config_file)
+    parser.read(sorted(glob.glob(os.path.join(base, 'paths-*.conf'))))
+    parser.read([os.path.join(base, 'jail.conf'), config_file])
+    if not parser.has_section(jail):
+        raise ValueError(f'Unknown jail: {jail}')
+
+    raw = parser.get(jail, 'filter', raw=True, fallback=jail).strip()
+    filter_value = raw.split('\n')[0]
+    match = re.match(r'^(?P<name>[^\[\s]+)(?:\[(?P<options>.*)\])?', filter_value)
+    name = match.group('name') if match else jail
+    if '%(' in name:
+        name = jail
+    options = {}
+    if match and match.group('options'):
+        for item in match.group('options').split(','):
+            if '=' in item:
+                key, value = item.split('=', 1)
+                options[key.strip()] = value.strip().strip('"\'')
+
+    try:
+        logpath = parser.get(jail, 'logpath', fallback='')
+    except configparser.Error:
+        logpath = parser.get(jail, 'logpath', raw=True, fallback='')
+    try:
+        backend = parser.get(jail, 'backend', fallback='auto')
+    except configparser.Error:
+        backend = 'auto'
+    paths = []
+    for pattern in logpath.split():
+        if pattern in ('head', 'tail'):
+            continue
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return {'filter': name, 'options': options, 'logpaths': paths, 'backend': backend.strip()}
+
+
+def run_filter_test(jail=None, filter_name=None, log_path=None, sample=None, lines=SAMPLE_LINES, candidates=(),
+                config_file=JAIL_CONFIG, filter_dir=FILTER_DIR, timeout=REGEX_TIMEOUT, isolate=True,
+                budget=TEST_TIMEOUT):
+    """Benchmark a jail's filter, and candidate regexes, on a log sample
+
+    The sample is, in order of preference: the given lines, the given log
+    file, the jail's logpath, or the journal for systemd jails. Dates are
+    cut from each line as fail2ban does before matching.
+
+    Each regex gets at most timeout seconds and the whole run at most
+    budget seconds; regexes reached after that are reported as skipped.
+
+    Returns:
+        dict: filter, source, line counts, the prefregex result, jail and
+        candidate results (one entry per regex) and total_us_per_line
+    """
+    lines = max(1, min(int(lines), MAX_SAMPLE_LINES))
+    options = {}
+    jail_info = None
+    if jail:
+        jail_info = resolve_jail(jail, config_file)
+        filter_name = filter_name or jail_info['filter']
+        options = jail_info['options']
+
+    definition = FilterDefinition(filter_name, filter_dir, options) if filter_name else None
+
+    if sample is not None:
+        raw_lines = sample.splitlines()[-lines:] if isinstance(sample, str) else list(sample)[-lines:]
+        source = 'sample'
+    elif log_path:
+        raw_lines, source = read_sample(log_path, lines), log_path
+    elif jail_info and jail_info['logpaths'] and jail_info['backend'] != 'systemd':
+        path = next((path for path in jail_info['logpaths'] if os.path.exists(path)), None)
+        if path is None:
+            raise ValueError(f'No log file found for jail {jail}: {", ".join(jail_info["logpaths"])}')
+        raw_lines, source = read_sample(path, lines), path
+    elif definition is not None and definition.journalmatch:
+        raw_lines, source = read_journal_sample(definition.journalmatch, lines), 'journal'
+    else:
+        raise ValueError('No log sample: give a log path or sample lines')
+
+    deadline = time.monotonic() + budget
+
+    def benchmark(regex, sample_lines, ignore):
+        remaining = min(timeout, deadline - time.monotonic())
+        return benchmark_regex(regex, sample_lines, ignore, max(remaining, 0), isolate)
+
+    stripped = [strip_date(line) for line in raw_lines if line.strip()]
+    ignoreregex = definition.ignoreregex if definition else []
+
+    # With a prefregex, fail2ban matches failregex/ignoreregex only against
+    # the <F-CONTENT> part of lines the prefregex accepts
+    prefregex = definition.prefregex if definition else ''
+    prefix_result = None
+    content = stripped
+    if prefregex:
+        prefix_result = benchmark(prefregex, stripped, ())
+        if prefix_result['error'] is None:
+            compiled = re.compile(expand_regex(prefregex))
+            content = []
+            for line in stripped:
+                match = compiled.search(line)
+                if match is not None:
+                    content.append(match.groupdict().get('F_CONTENT') or line)
+
+    jail_results = [
+        benchmark(regex, content, ignoreregex)
+        for regex in (definition.failregex if definition else [])
+    ]
+    candidate_results = [
+        benchmark(regex, content, ignoreregex)
+        for regex in list(candidates)[:MAX_CANDIDATES] if regex.strip()
+    ]
+
+    # fail2ban's cost per sample line: the prefregex on every line, then
+    # each failregex on every line the prefregex let through
+    total_ms = sum(result.get('total_ms', 0) for result in jail_results)
+    if prefix_result is not None:
+        total_ms += prefix_result.get('total_ms', 0)
+    return {
+        'filter': filter_name,
+        'source': source,
+        'lines': len(stripped),
+        'content_lines': len(content),
+        'ignoreregex': ignoreregex,
+        'prefregex': prefix_result,
+        'jail': jail_results,
+        'candidates': candidate_results,
+        'total_us_per_line': round(total_ms * 1000 / len(stripped), 3) if stripped else 0,
+    }
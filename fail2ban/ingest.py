@@ -0,0 +1,290 @@
+import ipaddress
+import os
+import time
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings as django_settings
+from django.db import transaction
+from .models import SecurityEvent, BannedIP, LogCheckpoint
+from .jailconfig import JAIL_CONFIG
+from .logparse import FAIL2BAN_LOG, iter_action_lines
+from .escalation import EscalationPolicy, PERMANENT_BAN, DUPLICATE_BAN_WINDOW
+from .stats import record_events
+from .analytics import record_offenders
+from .federation import publish_deltas
+from .utils import Fail2banManager
+
+DEFAULT_BATCH_SIZE = 1000
+# How often a long-running ingester picks up escalation settings and jail bantimes
+POLICY_REFRESH_INTERVAL = 60
+
+EVENT_SEVERITY = {
+    'ban': 'medium',
+    'unban': 'low',
+    'attack': 'low',
+}
+EVENT_DESCRIPTIONS = {
+    'ban': 'IP {ip} banned by fail2ban jail {jail}',
+    'unban': 'IP {ip} unbanned by fail2ban jail {jail}',
+    'attack': 'Failure from {ip} found by fail2ban jail {jail}',
+}
+
+
+def to_db_datetime(value):
+    """Convert a naive local log timestamp into what the database expects"""
+    if django_settings.USE_TZ:
+        return value.astimezone(dt_timezone.utc)
+    return value
+
+
+class Fail2banLogIngester:
+    """Incrementally ingest fail2ban.log into SecurityEvent and BannedIP
+
+    The read offset is checkpointed in LogCheckpoint inside the same
+    transaction as the inserted rows, so a crash never duplicates or drops
+    events. Rotation is detected by inode: the remainder of the old file is
+    read from its ``.1`` name before starting the new file at offset 0.
+
+    Rows are written with bulk_create/bulk_update, which skip the post_save
+    signals, so ingested events don't flood the CyberPanel log.
+    """
+
+    def __init__(self, log_path=FAIL2BAN_LOG, batch_size=DEFAULT_BATCH_SIZE, config_file=JAIL_CONFIG, enforce_escalation=True):
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.config_file = config_file
+        self.policy = EscalationPolicy.from_settings(config_file)
+        self.policy_loaded = time.monotonic()
+        self.enforce_escalation = enforce_escalation
+        self.pending_escalations = {}
+
+    def ingest(self):
+        """Ingest every complete line appended since the last checkpoint
+
+        Returns:
+            dict: {'lines': int, 'events': int, 'rotated': bool}
+        """
+        stats = {'lines': 0, 'events': 0, 'rotated': False}
+        if time.monotonic() - self.policy_loaded >= POLICY_REFRESH_INTERVAL:
+            # --follow keeps one ingester for good; settings and jail.local change under it
+            self.policy = EscalationPolicy.from_settings(self.config_file)
+            self.policy_loaded = time.monotonic()
+        checkpoint, _ = LogCheckpoint.objects.get_or_create(path=self.log_path)
+
+        try:
+            current = os.stat(self.log_path)
+        except FileNotFoundError:
+            return stats
+
+        if checkpoint.inode and checkpoint.inode != current.st_ino:
+            # Rotated: finish the old file if logrotate kept it as .1
+            stats['rotated'] = True
+            try:
+                if os.stat(self.log_path + '.1').st_ino == checkpoint.inode:
+                    self._ingest_file(self.log_path + '.1', checkpoint, stats)
+            except FileNotFoundError:
+                pass
+            checkpoint.offset = 0
+        elif current.st_size < checkpoint.offset:
+            # Truncated in place (copytruncate)
+            stats['rotated'] = True
+            checkpoint.offset = 0
+
+        checkpoint.inode = current.st_ino
+        self._ingest_file(self.log_path, checkpoint, stats)
+        return stats
+
+    def _ingest_file(self, path, checkpoint, stats):
+        batch = []
+        offset = checkpoint.offset
+        with open(path, 'rb') as f:
+            for offset, event in iter_action_lines(f, checkpoint.offset):
+                stats['lines'] += 1
+                if event is None:
+                    continue
+                batch.append(event)
+                if len(batch) >= self.batch_size:
+                    stats['events'] += self._flush(batch, checkpoint, offset)
+                    batch = []
+        stats['events'] += self._flush(batch, checkpoint, offset)
+
+    def _flush(self, events, checkpoint, offset):
+        with transaction.atomic():
+            events, recorded = self._without_recorded_bans(events)
+            # The panel recorded these bans itself, but only the log says
+            # fail2ban applied them; peers still hear about them from here
+            self._publish_recorded_bans(recorded)
+            if events:
+                SecurityEvent.objects.bulk_create([
+                    SecurityEvent(
+                        event_type=event['event_type'],
+                        ip_address=event['ip'],
+                        jail_name=event['jail'],
+                        description=EVENT_DESCRIPTIONS[event['event_type']].format(ip=event['ip'], jail=event['jail']),
+                        severity=EVENT_SEVERITY[event['event_type']],
+                        created_at=to_db_datetime(event['timestamp'])
+                    )
+                    for event in events
+                ], batch_size=self.batch_size)
+                # bulk_create skips post_save, so update the rollup and offender counters here
+                record_events((to_db_datetime(event['timestamp']), event['event_type']) for event in events)
+                record_offenders(
+                    (event['ip'], event['event_type'], event['jail'], to_db_datetime(event['timestamp'])) for event in events
+                )
+                self._upsert_banned_ips(events)
+            checkpoint.offset = offset
+            checkpoint.save()
+        self._enforce_escalations()
+        return len(events)
+
+    def _without_recorded_bans(self, events):
+        """Drop Ban lines for bans the panel already recorded
+
+        A manual or federated ban writes its SecurityEvent and BannedIP row
+        (and bumps the offender counters) itself; fail2ban then logs the same
+        ban moments later. Like escalation, a ban by the same jail within
+        DUPLICATE_BAN_WINDOW of the recorded one is that ban seen twice.
+
+        Returns:
+            tuple: (events to ingest, [(dropped ban event, its BannedIP row)])
+        """
+        ips = {event['ip'] for event in events if event['event_type'] == 'ban'}
+        if not ips:
+            return events, []
+        recorded = BannedIP.objects.filter(is_active=True).in_bulk(list(ips), field_name='ip_address')
+        if not recorded:
+            return events, []
+        kept, dropped = [], []
+        for event in events:
+            row = recorded.get(event['ip'])
+            if (event['event_type'] == 'ban' and row is not None and row.jail_name == event['jail']
+                    and abs(to_db_datetime(event['timestamp']) - row.banned_at) < DUPLICATE_BAN_WINDOW):
+                dropped.append((event, row))
+                continue
+            kept.append(event)
+        return kept, dropped
+
+    def _publish_recorded_bans(self, recorded):
+        """Publish the deltas for bans _without_recorded_bans() dropped
+
+        publish_deltas() leaves out the ones applied from a peer.
+        """
+        changes = []
+        for event, row in recorded:
+            if event['action'] == 'Restore Ban':
+                continue
+            held = row.expires_at - row.banned_at
+            duration = -1 if held >= PERMANENT_BAN else int(held.total_seconds())
+            changes.append(('ban', row.ip_address, event['jail'], duration, to_db_datetime(event['timestamp'])))
+        publish_deltas(changes)
+
+    def _record_escalations(self, events):
+        """Escalate repeat bans; returns {ip: duration}
+
+        Restored bans after a fail2ban restart aren't new offences.
+        """
+        bans = []
+        jails = {}
+        for event in events:
+            if event['event_type'] != 'ban' or event['action'] == 'Restore Ban':
+                continue
+            try:
+                ip = str(ipaddress.ip_address(event['ip']))
+            except ValueError:
+                continue
+            bans.append((ip, event['jail'], to_db_datetime(event['timestamp'])))
+            jails[ip] = event['jail']
+
+        durations = {}
+        for ip, (level, duration) in self.policy.record_bans(bans).items():
+            durations[ip] = duration
+            bantime = self.policy.bantime(jails[ip])
+            if bantime >= 0 and (duration < 0 or duration > bantime):
+                # Longer than fail2ban will hold it; enforced after commit
+                self.pending_escalations[ip] = duration
+        return durations
+
+    def _enforce_escalations(self):
+        if not self.pending_escalations:
+            return
+        pending, self.pending_escalations = self.pending_escalations, {}
+        if not self.enforce_escalation:
+            return
+        # One firewall-cmd per chunk of addresses sharing a duration, not one per address
+        Fail2banManager().extend_bans(pending)
+
+    def _upsert_banned_ips(self, events):
+        # Only the last ban/unban per address in the batch matters
+        latest = {}
+        for event in events:
+            if event['event_type'] not in ('ban', 'unban'):
+                continue
+            try:
+                ip = str(ipaddress.ip_address(event['ip']))
+            except ValueError:
+                continue
+            latest[ip] = event
+
+        if not latest:
+            return
+
+        durations = self._record_escalations(events)
+        existing = BannedIP.objects.in_bulk(list(latest), field_name='ip_address')
+        to_create = []
+        to_update = []
+        held = set()
+
+        for ip, event in latest.items():
+            row = existing.get(ip)
+            if event['event_type'] == 'unban':
+                if row is not None and row.is_active and row.jail_name == event['jail']:
+                    # An escalated ban outlives the jail's own unban
+                    if row.expires_at <= to_db_datetime(event['timestamp']) + DUPLICATE_BAN_WINDOW:
+                        row.is_active = False
+                        to_update.append(row)
+                    else:
+                        held.add(ip)
+                continue
+
+            banned_at = to_db_datetime(event['timestamp'])
+            bantime = durations.get(ip, self.policy.bantime(event['jail']))
+            expires_at = banned_at + (PERMANENT_BAN if bantime < 0 else timedelta(seconds=bantime))
+            if row is not None and event['action'] == 'Restore Ban' and row.is_active:
+                # Keep an escalated expiry across fail2ban restarts
+                expires_at = max(expires_at, row.expires_at)
+            if row is None:
+                to_create.append(BannedIP(
+                    ip_address=ip,
+                    jail_name=event['jail'],
+                    ban_reason=f'Banned by fail2ban jail {event["jail"]}',
+                    banned_at=banned_at,
+                    expires_at=expires_at,
+                    is_active=True
+                ))
+            else:
+                row.jail_name = event['jail']
+                row.ban_reason = f'Banned by fail2ban jail {event["jail"]}'
+                row.banned_at = banned_at
+                row.expires_at = expires_at
+                row.is_active = True
+                to_update.append(row)
+
+        if to_create:
+            BannedIP.objects.bulk_create(to_create, batch_size=self.batch_size, ignore_conflicts=True)
+        if to_update:
+            BannedIP.objects.bulk_update(
+                to_update,
+                ['jail_name', 'ban_reason', 'banned_at', 'expires_at', 'is_active'],
+                batch_size=self.batch_size
+            )
+
+        publish_deltas(
+            (
+                event['event_type'],
+                ip,
+                event['jail'],
+                durations.get(ip, self.policy.bantime(event['jail'])),
+                to_db_datetime(event['timestamp'])
+            )
+            for ip, event in latest.items()
+            if event['action'] != 'Restore Ban' and ip not in held
+        )
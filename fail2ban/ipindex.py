@@ -0,0 +1,104 @@
+import bisect
+import ipaddress
+
+
+def parse_network(value):
+    """Parse an IP address or CIDR range into an ip_network, or None if invalid"""
+    try:
+        return ipaddress.ip_network(str(value).strip(), strict=False)
+    except ValueError:
+        return None
+
+
+def format_network(network):
+    """Format a network, using the bare address for single hosts"""
+    if network.num_addresses == 1:
+        return str(network.network_address)
+    return str(network)
+
+
+def source_prefix(ip, ipv4_prefix=24, ipv6_prefix=48):
+    """Return the enclosing /24 (IPv4) or /48 (IPv6) network of an address as a string"""
+    try:
+        address = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return ''
+    prefix = ipv4_prefix if address.version == 4 else ipv6_prefix
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def collapse_networks(values):
+    """Collapse IPs/CIDR ranges into the smallest equivalent list of networks
+
+    Invalid entries are dropped. IPv4 networks are returned before IPv6 ones.
+    """
+    by_version = {4: [], 6: []}
+    for value in values:
+        network = value if isinstance(value, (ipaddress.IPv4Network, ipaddress.IPv6Network)) else parse_network(value)
+        if network is not None:
+            by_version[network.version].append(network)
+
+    collapsed = []
+    for version in (4, 6):
+        collapsed.extend(ipaddress.collapse_addresses(by_version[version]))
+    return collapsed
+
+
+class IPIntervalIndex:
+    """Sorted interval index over IP networks for O(log n) membership checks
+
+    Networks are collapsed first so the intervals never overlap, which lets a
+    single bisect on the interval starts find the only candidate range.
+    """
+
+    def __init__(self, values=()):
+        self.networks = collapse_networks(values)
+        self._networks = {4: [], 6: []}
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        for network in self.networks:
+            self._networks[network.version].append(network)
+            self._starts[network.version].append(int(network.network_address))
+            self._ends[network.version].append(int(network.broadcast_address))
+
+    def __len__(self):
+        return len(self.networks)
+
+    def __contains__(self, value):
+        return self.lookup(value) is not None
+
+    def lookup(self, value):
+        """Return the network covering an IP or CIDR range, or None"""
+        network = parse_network(value)
+        if network is None:
+            return None
+
+        starts = self._starts[network.version]
+        position = bisect.bisect_right(starts, int(network.network_address)) - 1
+        if position < 0:
+            return None
+        if int(network.broadcast_address) > self._ends[network.version][position]:
+            return None
+        return self._networks[network.version][position]
+
+    def to_list(self):
+        """Return the collapsed networks as strings"""
+        return [format_network(network) for network in self.networks]
+
+
+def merge_ip_entries(entries):
+    """Merge whitespace-separated ignoreip style entries
+
+    Hostnames and other non-IP tokens are kept in their original order, while
+    IPs and CIDR ranges are collapsed into the minimal set of networks.
+    """
+    others = []
+    networks = []
+    for entry in entries:
+        network = entry if isinstance(entry, (ipaddress.IPv4Network, ipaddress.IPv6Network)) else parse_network(entry)
+        if network is None:
+            if entry not in others:
+                others.append(entry)
+        else:
+            networks.append(network)
+    return others + [format_network(network) for network in collapse_networks(networks)]
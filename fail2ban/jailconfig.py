@@ -0,0 +1,136 @@
+import configparser
+import os
+import re
+import tempfile
+
+JAIL_CONFIG = '/etc/fail2ban/jail.local'
+
+SECTION_RE = re.compile(r'^\[(?P<name>[^\]]+)\]\s*$')
+OPTION_RE = re.compile(r'^(?P<key>[^\s=:#;\[][^=:]*?)\s*[=:]')
+LIST_SPLIT_RE = re.compile(r'[\s,]+')
+
+
+class JailConfig:
+    """Structured model of jail.local for targeted per-section edits
+
+    Values are read through configparser so DEFAULT inheritance and multi-line
+    values behave like fail2ban itself. Writes only patch the lines of the
+    option being changed, so comments and layout elsewhere are preserved, and
+    the file is replaced atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = []
+        self.parser = None
+        self.load()
+
+    def load(self):
+        """Read the configuration file from disk"""
+        with open(self.path, 'r') as f:
+            self.lines = f.read().splitlines(keepends=True)
+        if self.lines and not self.lines[-1].endswith('\n'):
+            self.lines[-1] += '\n'
+        self._parse()
+
+    def _parse(self):
+        parser = configparser.RawConfigParser(
+            strict=False,
+            interpolation=None,
+            inline_comment_prefixes=('#',)
+        )
+        parser.optionxform = str
+        parser.read_string(''.join(self.lines), source=self.path)
+        self.parser = parser
+
+    def sections(self):
+        """Return jail sections (DEFAULT excluded)"""
+        return self.parser.sections()
+
+    def get(self, section, key, fallback=''):
+        """Get an option value, honouring DEFAULT inheritance"""
+        if section == configparser.DEFAULTSECT:
+            return self.parser.defaults().get(key, fallback)
+        return self.parser.get(section, key, fallback=fallback)
+
+    def get_list(self, section, key):
+        """Get a whitespace or comma separated option as a list"""
+        value = self.get(section, key)
+        return [item for item in LIST_SPLIT_RE.split(value.strip()) if item]
+
+    def has_own_option(self, section, key):
+        """Check whether a section sets an option itself rather than inheriting it"""
+        return self._option_span(section, key) is not None
+
+    def set(self, section, key, value):
+        """Set an option in a section, adding the option or section if needed"""
+        new_line = f'{key} = {value}\n'
+        span = self._option_span(section, key)
+        if span is not None:
+            self.lines[span[0]:span[1]] = [new_line]
+        else:
+            header = self._section_line(section)
+            if header is None and section == configparser.DEFAULTSECT:
+                self.lines[0:0] = [f'[{section}]\n', new_line, '\n']
+            elif header is None:
+                self.lines.extend(['\n', f'[{section}]\n', new_line])
+            else:
+                self.lines.insert(header + 1, new_line)
+        self._parse()
+
+    def set_list(self, section, key, values):
+        """Set a list option, space separated"""
+        self.set(section, key, ' '.join(values))
+
+    def ignoreip_sections(self):
+        """Sections whose ignoreip is effective: DEFAULT plus jails overriding it"""
+        sections = [configparser.DEFAULTSECT]
+        sections.extend(section for section in self.sections() if self.has_own_option(section, 'ignoreip'))
+        return sections
+
+    def save(self):
+        """Write the configuration atomically (temp file + rename)"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.jail.local.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(self.lines)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.path):
+                os.chmod(temp_path, os.stat(self.path).st_mode & 0o7777)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _section_line(self, section):
+        for index, line in enumerate(self.lines):
+            header = SECTION_RE.match(line.strip())
+            if header and header.group('name') == section:
+                return index
+        return None
+
+    def _option_span(self, section, key):
+        """Return the (start, end) line range of an option, including continuation lines"""
+        current = None
+        start = None
+        for index, line in enumerate(self.lines):
+            stripped = line.strip()
+            if start is not None:
+                # Indented non-empty lines continue a multi-line value
+                if line[:1] in (' ', '\t') and stripped and not stripped.startswith(('#', ';')):
+                    continue
+                return start, index
+            header = SECTION_RE.match(stripped)
+            if header:
+                current = header.group('name')
+                continue
+            if current == section:
+                option = OPTION_RE.match(line)
+                if option and option.group('key').strip() == key:
+                    start = index
+        if start is not None:
+            return start, len(self.lines)
+        return None
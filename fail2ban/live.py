@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from .logparse import FAIL2BAN_LOG, iter_action_lines
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+# Streams end after this long; EventSource reconnects with Last-Event-ID,
+# so a worker thread is never held by one dashboard indefinitely
+STREAM_MAX_SECONDS = 300
+RETRY_MS = 3000
+BUFFER_SIZE = 1000
+# Every open stream holds a worker thread; past this many per process,
+# dashboards are turned away (503) and poll the dashboard API instead
+MAX_STREAMS = 4
+# How long a turned away dashboard polls before trying to stream again
+STREAM_RETRY_AFTER = 60
+
+
+class EventBroadcaster:
+    """Tail fail2ban.log once per process and fan Ban/Unban/Found events out to SSE clients
+
+    Each event is formatted as an SSE frame exactly once and appended to a
+    bounded ring shared by every client; clients only keep the id of the
+    last frame they sent. The tailer's work per event is therefore
+    independent of the number of open dashboards, and a client that falls
+    more than BUFFER_SIZE events behind is told to resync instead of
+    growing a private queue.
+    """
+
+    def __init__(self, log_path=FAIL2BAN_LOG, buffer_size=BUFFER_SIZE, poll_interval=POLL_INTERVAL,
+                 max_streams=MAX_STREAMS):
+        self.log_path = log_path
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self.buffer = deque(maxlen=buffer_size)
+        self.last_id = 0
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        self.thread = None
+        self.inode = None
+        self.offset = None
+
+    def subscribe(self):
+        """Take a stream slot; False if max_streams are already open"""
+        with self.condition:
+            if self.subscribers >= self.max_streams:
+                return False
+            self.subscribers += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='fail2ban-event-tailer', daemon=True)
+                self.thread.start()
+            return True
+
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def publish(self, event):
+        """Format an event once and wake every waiting client"""
+        with self.condition:
+            self.last_id += 1
+            payload = {
+                'type': event['event_type'],
+                'jail': event['jail'],
+                'ip': event['ip'],
+                'timestamp': event['timestamp'].isoformat(),
+            }
+            frame = f'id: {self.last_id}\nevent: {event["event_type"]}\ndata: {json.dumps(payload)}\n\n'
+            self.buffer.append((self.last_id, frame))
+            self.condition.notify_all()
+
+    def frames_after(self, last_id):
+        """Frames newer than last_id, or None if some were already dropped from the ring"""
+        if not self.buffer or last_id >= self.last_id:
+            return []
+        if last_id < self.buffer[0][0] - 1:
+            return None
+        return [frame for event_id, frame in self.buffer if event_id > last_id]
+
+    def stream(self, last_event_id=None, max_seconds=STREAM_MAX_SECONDS, heartbeat=HEARTBEAT_INTERVAL):
+        """Iterator of SSE frames for one client, or None if max_streams are already open"""
+        if not self.subscribe():
+            return None
+        return _Stream(self, self._frames(last_event_id, max_seconds, heartbeat))
+
+    def _frames(self, last_event_id, max_seconds, heartbeat):
+        with self.condition:
+            if last_event_id is None or last_event_id > self.last_id:
+                last_event_id = self.last_id
+        yield f'retry: {RETRY_MS}\n\n'
+
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            with self.condition:
+                if last_event_id >= self.last_id:
+                    self.condition.wait(min(heartbeat, max(0, deadline - time.monotonic())))
+                frames = self.frames_after(last_event_id)
+                current_id = self.last_id
+
+            if frames is None:
+                # Too slow to keep up; the dashboard reloads its data
+                yield f'id: {current_id}\nevent: resync\ndata: {{}}\n\n'
+            elif frames:
+                yield ''.join(frames)
+            else:
+                yield ': heartbeat\n\n'
+            last_event_id = current_id
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if self.subscribers <= 0:
+                    # Start again from the end of the log for the next dashboard
+                    self.thread = None
+                    self.offset = None
+                    return
+            try:
+                self._poll()
+            except OSError:
+                pass
+            time.sleep(self.poll_interval)
+
+    def _poll(self):
+        stat = os.stat(self.log_path)
+        if self.offset is None:
+            # Only events written after the first dashboard connected
+            self.inode, self.offset = stat.st_ino, stat.st_size
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode, self.offset = stat.st_ino, 0
+
+        with open(self.log_path, 'rb') as f:
+            for offset, event in iter_action_lines(f, self.offset):
+                self.offset = offset
+                if event is not None:
+                    self.publish(event)
+
+
+class _Stream:
+    """One client's frames; close() gives its slot back, even if the response was never iterated"""
+
+    def __init__(self, broadcaster, frames):
+        self.broadcaster = broadcaster
+        self.frames = frames
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.frames)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.frames.close()
+            self.broadcaster.unsubscribe()
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    """Process-wide broadcaster shared by all SSE connections"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = EventBroadcaster()
+        return _broadcaster
@@ -0,0 +1,130 @@
+import re
+from datetime import datetime
+
+FAIL2BAN_LOG = '/var/log/fail2ban.log'
+
+TIMESTAMP_PATTERN = (
+    r'(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2}) '
+    r'(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})(?:,(?P<msec>\d{1,6}))?'
+)
+
+# 2024-01-15 10:23:45,123 fail2ban.actions        [1234]: NOTICE  [sshd] Ban 203.0.113.7
+LOG_LINE_RE = re.compile(
+    r'^' + TIMESTAMP_PATTERN + r'\s+'
+    r'(?P<logger>fail2ban\.\S+)\s*(?:\[\d+\])?:\s+'
+    r'(?P<level>[A-Z]+)\s+'
+    r'(?P<message>.*)$'
+)
+ACTION_LINE_RE = re.compile(
+    r'^' + TIMESTAMP_PATTERN + r'\s+'
+    r'fail2ban\.\S+\s*(?:\[\d+\])?:\s+'
+    r'(?P<level>[A-Z]+)\s+'
+    r'\[(?P<jail>[^\]]+)\]\s+(?P<action>Restore Ban|Ban|Unban|Found)\s+(?P<ip>[0-9A-Fa-f:.]+)'
+)
+
+# Cheap substring check that rules out most lines before the full regex runs
+ACTION_MARKER_RE = re.compile(r' (?:Ban|Unban|Found) ')
+ACTION_MARKER_BYTES_RE = re.compile(rb' (?:Ban|Unban|Found) ')
+
+ACTION_EVENT_TYPES = {
+    'Ban': 'ban',
+    'Restore Ban': 'ban',
+    'Unban': 'unban',
+    'Found': 'attack',
+}
+
+
+def timestamp_from_match(match):
+    """Build a naive local datetime from TIMESTAMP_PATTERN groups
+
+    Cheaper than strptime, which dominates the cost of parsing large logs.
+    """
+    msec = match.group('msec')
+    return datetime(
+        int(match.group('year')), int(match.group('month')), int(match.group('day')),
+        int(match.group('hour')), int(match.group('minute')), int(match.group('second')),
+        int(msec.ljust(6, '0')) if msec else 0
+    )
+
+
+def parse_log_line(line):
+    """Parse any fail2ban.log line into timestamp, logger, level and message
+
+    Returns None for lines that aren't fail2ban log records (tracebacks,
+    continuation lines, etc).
+    """
+    match = LOG_LINE_RE.match(line.rstrip('\r\n'))
+    if not match:
+        return None
+    return {
+        'timestamp': timestamp_from_match(match),
+        'logger': match.group('logger'),
+        'level': match.group('level'),
+        'message': match.group('message').strip(),
+    }
+
+
+def parse_action_line(line):
+    """Parse a Ban/Unban/Found line from fail2ban.log
+
+    Returns:
+        dict with timestamp, level, jail, action, event_type and ip, or None
+    """
+    if not ACTION_MARKER_RE.search(line):
+        return None
+
+    match = ACTION_LINE_RE.match(line)
+    if not match:
+        return None
+
+    return {
+        'timestamp': timestamp_from_match(match),
+        'level': match.group('level'),
+        'jail': match.group('jail'),
+        'action': match.group('action'),
+        'event_type': ACTION_EVENT_TYPES[match.group('action')],
+        'ip': match.group('ip'),
+    }
+
+
+def iter_action_lines(f, offset=0):
+    """Yield (end_offset, event) for complete lines of a binary file from offset
+
+    event is None for lines that aren't Ban/Unban/Found records. A trailing
+    line without a newline is still being written and is left for the next
+    read, so end_offset always points just past a complete line.
+    """
+    f.seek(offset)
+    for raw in f:
+        if not raw.endswith(b'\n'):
+            break
+        offset += len(raw)
+        if ACTION_MARKER_BYTES_RE.search(raw):
+            yield offset, parse_action_line(raw.decode('utf-8', 'replace'))
+        else:
+            yield offset, None
+
+
+def parse_duration(value, default=None):
+    """Parse a fail2ban time value (e.g. "3600", "10m", "1h 30m", "1w") into seconds
+
+    Negative values mean a permanent ban and are returned as -1.
+    """
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    value = str(value or '').strip().lower()
+    if not value:
+        return default
+    try:
+        seconds = int(float(value))
+        return -1 if seconds < 0 else seconds
+    except ValueError:
+        pass
+
+    total = 0
+    matched = False
+    for amount, unit in re.findall(r'(-?\d+(?:\.\d+)?)\s*(w|d|h|m|s)[a-z]*', value):
+        total += float(amount) * units[unit]
+        matched = True
+    if not matched:
+        return default
+    return -1 if total < 0 else int(total)
@@ -0,0 +1,331 @@
+import ipaddress
+import json
+import os
+import re
+import subprocess
+from datetime import datetime
+from .ipindex import parse_network
+from .logparse import ACTION_EVENT_TYPES, FAIL2BAN_LOG, parse_log_line
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Upper bound on bytes (or journal records) examined per request, so a
+# filter that matches nothing can't make one poll scan the whole log
+MAX_SCAN_BYTES = 8 * 1024 * 1024
+MAX_SCAN_RECORDS = 50000
+BLOCK_SIZE = 64 * 1024
+
+FILE_CURSOR_PREFIX = 'file:'
+JOURNAL_CURSOR_PREFIX = 'journal:'
+
+# Journal records carry the message without fail2ban's own timestamp
+JOURNAL_RECORD_RE = re.compile(
+    r'^(?P<logger>fail2ban\.\S+)\s*(?:\[\d+\])?:\s+(?P<level>[A-Z]+)\s+(?P<message>.*)$',
+    re.DOTALL
+)
+MESSAGE_RE = re.compile(
+    r'^\[(?P<jail>[^\]]+)\]\s+(?:(?P<action>Restore Ban|Ban|Unban|Found)\s+(?P<ip>[0-9A-Fa-f:.]+))?'
+)
+IP_TOKEN_RE = re.compile(r'(?<![\w:.])(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9A-Fa-f]{0,4}(?::[0-9A-Fa-f]{0,4}){2,7})(?![\w:.])')
+
+# syslog PRIORITY -> fail2ban level
+JOURNAL_PRIORITIES = {
+    0: 'critical', 1: 'critical', 2: 'critical', 3: 'error',
+    4: 'warning', 5: 'notice', 6: 'info', 7: 'debug',
+}
+LEVEL_ALIASES = {'warn': 'warning', 'err': 'error', 'crit': 'critical', 'fatal': 'critical'}
+
+
+def make_entry(timestamp, level, message, logger=''):
+    """Build an API log entry, pulling jail, action and IP out of the message"""
+    entry = {
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'level': (level or 'info').lower(),
+        'logger': logger,
+        'message': message,
+        'jail': None,
+        'event_type': None,
+        'ip': None,
+    }
+    match = MESSAGE_RE.match(message)
+    if match:
+        entry['jail'] = match.group('jail')
+        if match.group('action'):
+            entry['event_type'] = ACTION_EVENT_TYPES[match.group('action')]
+            entry['ip'] = match.group('ip')
+    return entry
+
+
+class LogFilter:
+    """Server-side filter on jail, IP (or CIDR range) and level"""
+
+    def __init__(self, jail=None, ip=None, level=None):
+        self.jail = jail or None
+        self.network = None
+        if ip:
+            self.network = parse_network(ip)
+            if self.network is None:
+                raise ValueError(f'Invalid IP address or CIDR range: {ip}')
+        self.levels = None
+        if level:
+            levels = [item.strip().lower() for item in str(level).split(',') if item.strip()]
+            self.levels = {LEVEL_ALIASES.get(item, item) for item in levels}
+
+    def max_priority(self):
+        """Loosest syslog priority that can match the level filter, for journalctl -p"""
+        if not self.levels:
+            return None
+        priorities = [priority for priority, level in JOURNAL_PRIORITIES.items() if level in self.levels]
+        return max(priorities) if priorities else None
+
+    def matches(self, entry):
+        if self.jail and entry['jail'] != self.jail:
+            return False
+        if self.levels and entry['level'] not in self.levels:
+            return False
+        if self.network is not None:
+            candidates = [entry['ip']] if entry['ip'] else IP_TOKEN_RE.findall(entry['message'])
+            return any(self._in_network(candidate) for candidate in candidates)
+        return True
+
+    def _in_network(self, value):
+        try:
+            return ipaddress.ip_address(value) in self.network
+        except ValueError:
+            return False
+
+
+class FileLogReader:
+    """Read fail2ban.log by byte offset
+
+    The cursor is ``file:<inode>:<offset>``. With no cursor, the newest
+    matching entries are found by reading backwards from the end of the
+    file. With a cursor, only the bytes appended since are read. A cursor
+    from a rotated or truncated file starts over from the tail.
+    """
+
+    def __init__(self, path=FAIL2BAN_LOG):
+        self.path = path
+
+    def read(self, cursor=None, limit=DEFAULT_LIMIT, log_filter=None):
+        log_filter = log_filter or LogFilter()
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            position = self._parse_cursor(cursor)
+            reset = False
+            if position is not None:
+                inode, offset = position
+                if inode != stat.st_ino or offset > stat.st_size:
+                    position = None
+                    reset = True
+
+            if position is None:
+                entries, offset = self._tail(f, stat.st_size, limit, log_filter)
+                has_more = False
+            else:
+                entries, offset, has_more = self._forward(f, position[1], limit, log_filter)
+
+        return {
+            'entries': entries,
+            'cursor': f'{FILE_CURSOR_PREFIX}{stat.st_ino}:{offset}',
+            'has_more': has_more,
+            'reset': reset,
+            'source': 'file',
+        }
+
+    def _parse_cursor(self, cursor):
+        if not cursor or not cursor.startswith(FILE_CURSOR_PREFIX):
+            return None
+        try:
+            inode, offset = cursor[len(FILE_CURSOR_PREFIX):].split(':')
+            return int(inode), int(offset)
+        except ValueError:
+            return None
+
+    def _tail(self, f, size, limit, log_filter):
+        """Newest matching entries, oldest first, and the offset after the last complete line"""
+        entries = []
+        continuation = []
+        remainder = b''
+        position = end = size
+        partial = True  # until the newline ending the last complete line is seen
+        while position > 0 and len(entries) < limit and size - position < MAX_SCAN_BYTES:
+            start = max(0, position - BLOCK_SIZE)
+            f.seek(start)
+            block = f.read(position - start) + remainder
+            lines = block.split(b'\n')
+            if partial:
+                # Ignore a last line that is still being written
+                tail = lines.pop()
+                if not lines:
+                    position = end = start
+                    continue
+                end = position - len(tail)
+                partial = False
+            position = start
+            # First piece may be the end of an earlier line, unless at file start
+            remainder = lines.pop(0) if position > 0 else b''
+            for raw in reversed(lines):
+                line = raw.decode('utf-8', 'replace').rstrip('\r')
+                record = parse_log_line(line)
+                if record is None:
+                    continuation.insert(0, line)
+                    continue
+                entry = self._record_entry(record, continuation)
+                continuation = []
+                if log_filter.matches(entry):
+                    entries.append(entry)
+                    if len(entries) >= limit:
+                        break
+
+        entries.reverse()
+        return entries, end
+
+    def _forward(self, f, offset, limit, log_filter):
+        """Matching entries appended after offset, oldest first"""
+        f.seek(offset)
+        start = consumed = offset
+        entries = []
+        pending = None
+        has_more = False
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            record = parse_log_line(line)
+            if record is None:
+                # Traceback or other continuation of the previous record
+                if pending is not None:
+                    pending['message'] += '\n' + line
+                offset += len(raw)
+                continue
+
+            if pending is not None and log_filter.matches(pending):
+                entries.append(pending)
+            pending = None
+            consumed = offset
+            if len(entries) >= limit or offset - start >= MAX_SCAN_BYTES:
+                has_more = True
+                break
+            pending = self._record_entry(record, [])
+            offset += len(raw)
+
+        if not has_more:
+            if pending is not None and log_filter.matches(pending):
+                entries.append(pending)
+            consumed = offset
+        return entries, consumed, has_more
+
+    def _record_entry(self, record, continuation):
+        message = '\n'.join([record['message']] + continuation)
+        return make_entry(record['timestamp'], record['level'], message, record['logger'])
+
+
+class JournalLogReader:
+    """Read the fail2ban unit from the systemd journal using journal cursors
+
+    The cursor is ``journal:<journal cursor>``. With no cursor the journal
+    is walked newest first until enough entries match; with one,
+    ``--after-cursor`` streams only newer records.
+    """
+
+    def __init__(self, unit='fail2ban'):
+        self.unit = unit
+
+    def read(self, cursor=None, limit=DEFAULT_LIMIT, log_filter=None):
+        log_filter = log_filter or LogFilter()
+        journal_cursor = None
+        if cursor and cursor.startswith(JOURNAL_CURSOR_PREFIX):
+            journal_cursor = cursor[len(JOURNAL_CURSOR_PREFIX):] or None
+
+        command = ['journalctl', '-u', self.unit, '-o', 'json', '--no-pager']
+        priority = log_filter.max_priority()
+        if priority is not None:
+            command += ['-p', str(priority)]
+        if journal_cursor:
+            command += ['--after-cursor', journal_cursor]
+        else:
+            command += ['-r']
+
+        entries = []
+        last_cursor = journal_cursor
+        has_more = False
+        scanned = 0
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            for line in process.stdout:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                scanned += 1
+                if journal_cursor or last_cursor is None:
+                    # Forward: advance past every record read. Reverse: the newest one.
+                    last_cursor = record.get('__CURSOR', last_cursor)
+                entry = self._record_entry(record)
+                if log_filter.matches(entry):
+                    entries.append(entry)
+                if len(entries) >= limit or scanned >= MAX_SCAN_RECORDS:
+                    has_more = bool(journal_cursor)
+                    break
+        finally:
+            process.kill()
+            process.wait()
+
+        if not journal_cursor:
+            entries.reverse()
+        return {
+            'entries': entries,
+            'cursor': f'{JOURNAL_CURSOR_PREFIX}{last_cursor}' if last_cursor else None,
+            'has_more': has_more,
+            'reset': False,
+            'source': 'journal',
+        }
+
+    def _record_entry(self, record):
+        message = record.get('MESSAGE') or ''
+        if isinstance(message, list):
+            # Non-UTF-8 messages are exported as byte arrays
+            message = bytes(message).decode('utf-8', 'replace')
+        timestamp = None
+        if record.get('__REALTIME_TIMESTAMP'):
+            timestamp = datetime.fromtimestamp(int(record['__REALTIME_TIMESTAMP']) / 1000000)
+
+        parsed = parse_log_line(message)
+        if parsed:
+            return make_entry(parsed['timestamp'], parsed['level'], parsed['message'], parsed['logger'])
+        match = JOURNAL_RECORD_RE.match(message)
+        if match:
+            return make_entry(timestamp, match.group('level'), match.group('message').strip(), match.group('logger'))
+        try:
+            level = JOURNAL_PRIORITIES.get(int(record.get('PRIORITY', 6)), 'info')
+        except ValueError:
+            level = 'info'
+        return make_entry(timestamp, level, message.strip())
+
+
+def read_logs(cursor=None, limit=DEFAULT_LIMIT, jail=None, ip=None, level=None, source='auto', log_path=FAIL2BAN_LOG):
+    """Read fail2ban log entries newer than cursor, filtered server-side
+
+    source is 'file', 'journal' or 'auto' (the log file when it exists,
+    otherwise the journal). A cursor returned by one source keeps using it.
+
+    Returns:
+        dict with entries (oldest first), cursor, has_more, reset and source
+    """
+    log_filter = LogFilter(jail=jail, ip=ip, level=level)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    if cursor and cursor.startswith(JOURNAL_CURSOR_PREFIX):
+        source = 'journal'
+    elif cursor and cursor.startswith(FILE_CURSOR_PREFIX):
+        source = 'file'
+    elif source == 'auto':
+        source = 'file' if os.path.exists(log_path) else 'journal'
+
+    if source == 'file':
+        return FileLogReader(log_path).read(cursor, limit, log_filter)
+    if source == 'journal':
+        return JournalLogReader().read(cursor, limit, log_filter)
+    raise ValueError(f'Unknown log source: {source}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from ...expiry import run_expiry, EXPIRY_BATCH_SIZE, MAX_BATCHES_PER_TICK, TICK_INTERVAL
+
+
+class Command(BaseCommand):
+    help = 'Mark BannedIP rows past their expiry as inactive, checking against live fail2ban bans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE, help='Rows expired per UPDATE')
+        parser.add_argument('--max-batches', type=int, default=MAX_BATCHES_PER_TICK, help='Batches per tick')
+        parser.add_argument('--loop', action='store_true', help='Keep running, one tick per interval')
+        parser.add_argument('--interval', type=int, default=TICK_INTERVAL, help='Seconds between ticks with --loop')
+        parser.add_argument('--no-reconcile', dest='reconcile', action='store_false', help='Expire on time alone, without asking fail2ban')
+
+    def handle(self, *args, **options):
+        summary = run_expiry(
+            interval=options['interval'],
+            loop=options['loop'],
+            reconcile=options['reconcile'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        self.stdout.write(f"Expired {summary['expired']} bans, renewed {summary['renewed']} still active in fail2ban")
+        if summary['has_more']:
+            self.stdout.write('More bans are due; run again')
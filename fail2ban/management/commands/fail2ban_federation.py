@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from ...federation import pull_peers
+
+PULL_INTERVAL = 30
+
+
+class Command(BaseCommand):
+    help = 'Pull ban/unban deltas from federation peers and apply them locally'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep pulling every interval')
+        parser.add_argument('--interval', type=int, default=PULL_INTERVAL, help='Seconds between pulls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            for name, summary in pull_peers().items():
+                line = f"{name}: applied {summary['applied']}, conflicts {summary['conflicts']}, lag {summary['seq_lag']}"
+                if summary.get('error'):
+                    line += f", error: {summary['error']}"
+                self.stdout.write(line)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,55 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from ...filtertest import run_filter_test, SAMPLE_LINES, REGEX_TIMEOUT
+
+
+class Command(BaseCommand):
+    help = "Benchmark a jail's failregex (and candidate regexes) against a sample of its log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('jail', nargs='?', help='Jail whose filter and log to test')
+        parser.add_argument('--filter', dest='filter_name', help='Filter name in filter.d (default: the jail\'s filter)')
+        parser.add_argument('--log', dest='log_path', help='Log file to sample (default: the jail\'s logpath)')
+        parser.add_argument('--lines', type=int, default=SAMPLE_LINES, help='Lines sampled from the end of the log')
+        parser.add_argument('--regex', dest='candidates', action='append', default=[], help='Candidate failregex to compare; repeatable')
+        parser.add_argument('--timeout', type=float, default=REGEX_TIMEOUT, help='Seconds allowed per regex')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        if not options['jail'] and not options['filter_name'] and not options['candidates']:
+            raise CommandError('Give a jail, --filter or at least one --regex')
+        try:
+            report = run_filter_test(
+                jail=options['jail'],
+                filter_name=options['filter_name'],
+                log_path=options['log_path'],
+                lines=options['lines'],
+                candidates=options['candidates'],
+                timeout=options['timeout']
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"Filter {report['filter'] or '-'} on {report['lines']} lines from {report['source']}")
+        self.stdout.write(f"fail2ban cost: {report['total_us_per_line']} us per line")
+        rows = []
+        if report['prefregex']:
+            rows.append(('prefix', report['prefregex']))
+        rows += [('jail', result) for result in report['jail']]
+        rows += [('candidate', result) for result in report['candidates']]
+        for kind, result in rows:
+            self.stdout.write('')
+            self.stdout.write(f"[{kind}] {result['regex']}")
+            if result['error']:
+                self.stdout.write(self.style.ERROR(f"  error: {result['error']}"))
+            else:
+                self.stdout.write(
+                    f"  matches {result['matches']} (ignored {result['ignored']}), "
+                    f"{result['us_per_line']} us/line, slowest line {result['max_line_us']} us"
+                )
+            for warning in result['warnings']:
+                self.stdout.write(self.style.WARNING(f'  warning: {warning}'))
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from ...ingest import Fail2banLogIngester, FAIL2BAN_LOG, DEFAULT_BATCH_SIZE
+from ...models import LogCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Ingest fail2ban.log Ban/Unban/Found records into SecurityEvent and BannedIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=FAIL2BAN_LOG, help='fail2ban log file to ingest')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows per bulk insert')
+        parser.add_argument('--follow', action='store_true', help='Keep tailing the log')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --follow')
+        parser.add_argument('--reset', action='store_true', help='Forget the checkpoint and re-read the whole file')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            LogCheckpoint.objects.filter(path=options['path']).delete()
+
+        ingester = Fail2banLogIngester(log_path=options['path'], batch_size=options['batch_size'])
+
+        while True:
+            started = time.monotonic()
+            stats = ingester.ingest()
+            elapsed = time.monotonic() - started
+
+            if stats['lines'] or not options['follow']:
+                rate = stats['lines'] / elapsed if elapsed > 0 else 0
+                self.stdout.write(
+                    f"Ingested {stats['events']} events from {stats['lines']} lines "
+                    f"in {elapsed:.2f}s ({rate:,.0f} lines/s)"
+                    + (' after rotation' if stats['rotated'] else '')
+                )
+
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...reconcile import run_reconcile
+
+
+class Command(BaseCommand):
+    help = 'Sync BannedIP with the bans fail2ban currently holds'
+
+    def handle(self, *args, **options):
+        summary = run_reconcile()
+        if summary is None:
+            raise CommandError('Could not read ban lists from fail2ban')
+        self.stdout.write(
+            f"Inserted {summary['inserted']}, reactivated {summary['reactivated']}, "
+            f"deactivated {summary['deactivated']}, moved {summary['updated']}, "
+            f"kept {summary['kept']} held by firewalld"
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from ...retention import run_retention, ARCHIVE_DIR, DELETE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Roll up SecurityEvent rows by hour/day and prune raw events past the retention age'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Keep raw events this many days (default: plugin setting)')
+        parser.add_argument('--chunk-size', type=int, default=DELETE_CHUNK_SIZE, help='Rows deleted per statement')
+        parser.add_argument('--archive', dest='archive', action='store_true', default=None, help='Write pruned rows to a gzip JSONL archive')
+        parser.add_argument('--no-archive', dest='archive', action='store_false', help='Delete pruned rows without archiving')
+        parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help='Directory for archives')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the hourly rollup from all raw events')
+
+    def handle(self, *args, **options):
+        summary = run_retention(
+            retention_days=options['days'],
+            archive=options['archive'],
+            archive_dir=options['archive_dir'],
+            chunk_size=options['chunk_size'],
+            rebuild=options['rebuild']
+        )
+        if summary['rolled_up']:
+            self.stdout.write(f"Rolled up {summary['rolled_up'][0]} to {summary['rolled_up'][1]}")
+        self.stdout.write(f"Pruned {summary['pruned_events']} events and {summary['pruned_deltas']} federation deltas")
+        if summary['archive']:
+            self.stdout.write(f"Archived to {summary['archive']}")
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    from django.db.models import Count
+    from django.db.models.functions import TruncDate
+
+    SecurityEvent = apps.get_model('fail2ban', 'SecurityEvent')
+    SecurityEventDailyRollup = apps.get_model('fail2ban', 'SecurityEventDailyRollup')
+    rows = (
+        SecurityEvent.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'event_type')
+        .annotate(count=Count('id'))
+    )
+    SecurityEventDailyRollup.objects.bulk_create(
+        [SecurityEventDailyRollup(day=row['day'], event_type=row['event_type'], count=row['count']) for row in rows],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0002_log_ingest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecurityEventDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event_type', models.CharField(choices=[('ban', 'IP Banned'), ('unban', 'IP Unbanned'), ('attack', 'Attack Detected'), ('whitelist', 'IP Whitelisted'), ('blacklist', 'IP Blacklisted'), ('plugin_toggle', 'Plugin Toggled')], max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'fail2ban_event_daily_rollups',
+                'ordering': ['-day'],
+                'unique_together': {('day', 'event_type')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+EVENT_TYPE_CHOICES = [('ban', 'IP Banned'), ('unban', 'IP Unbanned'), ('attack', 'Attack Detected'), ('whitelist', 'IP Whitelisted'), ('blacklist', 'IP Blacklisted'), ('plugin_toggle', 'Plugin Toggled')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0003_security_event_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='event_retention_days',
+            field=models.IntegerField(default=30),
+        ),
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='archive_pruned_events',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SecurityEventHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('event_type', models.CharField(choices=EVENT_TYPE_CHOICES, max_length=20)),
+                ('jail_name', models.CharField(blank=True, max_length=100)),
+                ('source_prefix', models.CharField(blank=True, max_length=49)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'fail2ban_event_hourly_rollups',
+                'ordering': ['-hour'],
+                'unique_together': {('hour', 'event_type', 'jail_name', 'source_prefix')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SecurityEventDailyPrefixRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event_type', models.CharField(choices=EVENT_TYPE_CHOICES, max_length=20)),
+                ('jail_name', models.CharField(blank=True, max_length=100)),
+                ('source_prefix', models.CharField(blank=True, max_length=49)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'fail2ban_event_daily_prefix_rollups',
+                'ordering': ['-day'],
+                'unique_together': {('day', 'event_type', 'jail_name', 'source_prefix')},
+            },
+        ),
+    ]
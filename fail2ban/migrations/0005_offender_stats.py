@@ -0,0 +1,114 @@
+import ipaddress
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# Frozen copies of the analytics and ipindex helpers as of this migration,
+# so later changes to those modules don't change what it does
+SCORE_HALF_LIFE = timedelta(days=7)
+SCORE_LANDMARK = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+EVENT_WEIGHTS = {
+    'attack': 1.0,
+    'ban': 10.0,
+}
+
+
+def source_prefix(ip):
+    try:
+        address = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return ''
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def log2_add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def event_score_key(event_type, when, count=1):
+    landmark = SCORE_LANDMARK if django.utils.timezone.is_aware(when) else SCORE_LANDMARK.replace(tzinfo=None)
+    return math.log2(EVENT_WEIGHTS[event_type] * count) + (when - landmark) / SCORE_HALF_LIFE
+
+
+def build_offender_stats(apps, schema_editor):
+    from django.db.models import Count, Max, Min
+    from django.db.models.functions import TruncDate
+
+    SecurityEvent = apps.get_model('fail2ban', 'SecurityEvent')
+    OffenderStats = apps.get_model('fail2ban', 'OffenderStats')
+    rows = (
+        SecurityEvent.objects.filter(event_type__in=['attack', 'ban'], ip_address__isnull=False)
+        .order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('ip_address', 'event_type', 'jail_name', 'day')
+        .annotate(count=Count('id'), first=Min('created_at'), last=Max('created_at'))
+    )
+
+    # Events of one day are scored at the day's last event, close enough for history
+    offenders = {}
+    for row in rows.iterator():
+        ip = row['ip_address']
+        offender = offenders.get(ip)
+        if offender is None:
+            offender = offenders[ip] = OffenderStats(
+                ip_address=ip, source_prefix=source_prefix(ip), first_seen=row['first'], last_seen=row['last']
+            )
+            offender.jail_set = set()
+        offender.first_seen = min(offender.first_seen, row['first'])
+        offender.last_seen = max(offender.last_seen, row['last'])
+        if row['event_type'] == 'ban':
+            offender.ban_count += row['count']
+            offender.last_banned_at = max(offender.last_banned_at or row['last'], row['last'])
+        else:
+            offender.attack_count += row['count']
+        if row['jail_name']:
+            offender.jail_set.add(row['jail_name'])
+        offender.score_key = log2_add(offender.score_key, event_score_key(row['event_type'], row['last'], row['count']))
+
+    for offender in offenders.values():
+        offender.jails = ','.join(sorted(offender.jail_set))[:255]
+    OffenderStats.objects.bulk_create(offenders.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0004_event_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OffenderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField(unique=True)),
+                ('source_prefix', models.CharField(blank=True, max_length=49)),
+                ('attack_count', models.BigIntegerField(default=0)),
+                ('ban_count', models.IntegerField(default=0)),
+                ('jails', models.CharField(blank=True, max_length=255)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_banned_at', models.DateTimeField(blank=True, null=True)),
+                ('score_key', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'fail2ban_offender_stats',
+                'ordering': ['-last_seen'],
+                'indexes': [
+                    models.Index(fields=['-score_key'], name='fail2ban_of_score_k_0d3355_idx'),
+                    models.Index(fields=['source_prefix'], name='fail2ban_of_source__1bffa0_idx'),
+                    models.Index(fields=['last_banned_at'], name='fail2ban_of_last_ba_b6ebb5_idx'),
+                    models.Index(fields=['-last_seen'], name='fail2ban_of_last_se_d390cc_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(build_offender_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0005_offender_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='escalation_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='escalation_steps',
+            field=models.CharField(default='1h 1d 1w permanent', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='escalation_reset_days',
+            field=models.IntegerField(default=30),
+        ),
+        migrations.CreateModel(
+            name='BanEscalation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField(unique=True)),
+                ('level', models.IntegerField(default=0)),
+                ('ban_count', models.IntegerField(default=0)),
+                ('last_jail', models.CharField(blank=True, max_length=100)),
+                ('last_banned_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ban_duration', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'fail2ban_ban_escalations',
+            },
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0006_ban_escalation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bannedip',
+            index=models.Index(fields=['is_active', 'expires_at'], name='fail2ban_ba_is_acti_d5e1d6_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0007_bannedip_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='federation_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='fail2bansettings',
+            name='federation_token',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.CreateModel(
+            name='BanDelta',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('ban', 'Ban'), ('unban', 'Unban')], max_length=10)),
+                ('ip_address', models.GenericIPAddressField()),
+                ('jail_name', models.CharField(blank=True, max_length=100)),
+                ('duration', models.IntegerField(default=0)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('origin', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'fail2ban_ban_deltas',
+                'indexes': [
+                    models.Index(fields=['origin', 'id'], name='fail2ban_ba_origin_dccf5f_idx'),
+                    models.Index(fields=['ip_address', '-id'], name='fail2ban_ba_ip_addr_67d56a_idx'),
+                    models.Index(fields=['created_at'], name='fail2ban_ba_created_a47d8f_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='FederationPeer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('url', models.URLField(max_length=255)),
+                ('token', models.CharField(max_length=128)),
+                ('jail_name', models.CharField(default='sshd', max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_seq', models.BigIntegerField(default=0)),
+                ('remote_seq', models.BigIntegerField(default=0)),
+                ('last_delta_at', models.DateTimeField(blank=True, null=True)),
+                ('last_lag_seconds', models.FloatField(blank=True, null=True)),
+                ('last_pulled_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('applied_count', models.BigIntegerField(default=0)),
+                ('conflict_count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'fail2ban_federation_peers',
+                'ordering': ['name'],
+            },
+        ),
+    ]
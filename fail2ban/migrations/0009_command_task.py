@@ -0,0 +1,32 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0008_federation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandTask',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('result', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'fail2ban_command_tasks',
+                'ordering': ['-created_at'],
+                'indexes': [
+                    models.Index(fields=['name', 'status'], name='fail2ban_co_name_9adc45_idx'),
+                    models.Index(fields=['created_at'], name='fail2ban_co_created_f5c895_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fail2ban', '0009_command_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandtask',
+            name='running_name',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
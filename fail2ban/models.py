@@ -10,6 +10,13 @@ class Fail2banSettings(models.Model):
     auto_ban_threshold = models.IntegerField(default=5)
     ban_duration = models.IntegerField(default=3600)  # seconds
     enabled_jails = models.TextField(default='sshd,openlitespeed,cyberpanel', blank=True)
+    event_retention_days = models.IntegerField(default=30)  # raw SecurityEvent rows
+    archive_pruned_events = models.BooleanField(default=False)
+    escalation_enabled = models.BooleanField(default=True)
+    escalation_steps = models.CharField(max_length=255, default='1h 1d 1w permanent')  # ban time per repeat
+    escalation_reset_days = models.IntegerField(default=30)  # forget ban history after this long
+    federation_enabled = models.BooleanField(default=False)
+    federation_token = models.CharField(max_length=128, blank=True)  # peers send it as a Bearer token
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -56,7 +63,7 @@ class SecurityEvent(models.Model):
     jail_name = models.CharField(max_length=100, blank=True)
     description = models.TextField()
     severity = models.CharField(max_length=20, default='medium')
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'fail2ban_security_events'
@@ -70,12 +77,58 @@ class SecurityEvent(models.Model):
     def __str__(self):
         return f"{self.event_type} - {self.ip_address or 'N/A'} - {self.created_at}"
 
+class SecurityEventDailyRollup(models.Model):
+    """Per-day event counts so statistics don't scan SecurityEvent"""
+    day = models.DateField()
+    event_type = models.CharField(max_length=20, choices=SecurityEvent.EVENT_TYPES)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'fail2ban_event_daily_rollups'
+        ordering = ['-day']
+        unique_together = [('day', 'event_type')]
+
+    def __str__(self):
+        return f"{self.day} - {self.event_type}: {self.count}"
+
+class SecurityEventHourlyRollup(models.Model):
+    """Hourly event counts by type, jail and source prefix (/24 or /48)"""
+    hour = models.DateTimeField()
+    event_type = models.CharField(max_length=20, choices=SecurityEvent.EVENT_TYPES)
+    jail_name = models.CharField(max_length=100, blank=True)
+    source_prefix = models.CharField(max_length=49, blank=True)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'fail2ban_event_hourly_rollups'
+        ordering = ['-hour']
+        unique_together = [('hour', 'event_type', 'jail_name', 'source_prefix')]
+
+    def __str__(self):
+        return f"{self.hour} - {self.event_type} - {self.jail_name} - {self.source_prefix}: {self.count}"
+
+class SecurityEventDailyPrefixRollup(models.Model):
+    """Daily event counts by type, jail and source prefix, compacted from the hourly rollup"""
+    day = models.DateField()
+    event_type = models.CharField(max_length=20, choices=SecurityEvent.EVENT_TYPES)
+    jail_name = models.CharField(max_length=100, blank=True)
+    source_prefix = models.CharField(max_length=49, blank=True)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'fail2ban_event_daily_prefix_rollups'
+        ordering = ['-day']
+        unique_together = [('day', 'event_type', 'jail_name', 'source_prefix')]
+
+    def __str__(self):
+        return f"{self.day} - {self.event_type} - {self.jail_name} - {self.source_prefix}: {self.count}"
+
 class BannedIP(models.Model):
     """Track currently banned IPs"""
     ip_address = models.GenericIPAddressField(unique=True)
     jail_name = models.CharField(max_length=100)
     ban_reason = models.TextField(blank=True)
-    banned_at = models.DateTimeField(auto_now_add=True)
+    banned_at = models.DateTimeField(default=timezone.now)
     expires_at = models.DateTimeField()
     is_active = models.BooleanField(default=True)
     
@@ -86,14 +139,60 @@ class BannedIP(models.Model):
             models.Index(fields=['-banned_at']),
             models.Index(fields=['is_active']),
             models.Index(fields=['jail_name']),
+            models.Index(fields=['is_active', 'expires_at']),
         ]
 
     def __str__(self):
         return f"{self.ip_address} - {self.jail_name}"
 
+class BanEscalation(models.Model):
+    """Per-address recidive state: how many times in a row it has been banned"""
+    ip_address = models.GenericIPAddressField(unique=True)
+    level = models.IntegerField(default=0)  # index into the escalation steps
+    ban_count = models.IntegerField(default=0)
+    last_jail = models.CharField(max_length=100, blank=True)
+    last_banned_at = models.DateTimeField(default=timezone.now)
+    ban_duration = models.IntegerField(default=0)  # seconds, -1 for permanent
+    
+    class Meta:
+        db_table = 'fail2ban_ban_escalations'
+
+    def __str__(self):
+        return f"{self.ip_address} - level {self.level}"
+
+class OffenderStats(models.Model):
+    """Incremental per-address counters and a time-decayed offender score
+    
+    score_key is log2 of the forward-decayed weight sum (each event adds
+    weight * 2^(t / half-life)), so ordering by it ranks addresses by their
+    current decayed score without rewriting rows as time passes.
+    """
+    ip_address = models.GenericIPAddressField(unique=True)
+    source_prefix = models.CharField(max_length=49, blank=True)
+    attack_count = models.BigIntegerField(default=0)
+    ban_count = models.IntegerField(default=0)
+    jails = models.CharField(max_length=255, blank=True)  # comma separated
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+    last_banned_at = models.DateTimeField(null=True, blank=True)
+    score_key = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'fail2ban_offender_stats'
+        ordering = ['-last_seen']
+        indexes = [
+            models.Index(fields=['-score_key']),
+            models.Index(fields=['source_prefix']),
+            models.Index(fields=['last_banned_at']),
+            models.Index(fields=['-last_seen']),
+        ]
+
+    def __str__(self):
+        return f"{self.ip_address} - {self.attack_count} attacks, {self.ban_count} bans"
+
 class WhitelistIP(models.Model):
     """Track whitelisted IPs"""
-    ip_address = models.GenericIPAddressField(unique=True)
+    ip_address = models.CharField(max_length=64, unique=True)  # IP or CIDR range
     description = models.TextField(blank=True)
     added_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
@@ -107,7 +206,7 @@ class WhitelistIP(models.Model):
 
 class BlacklistIP(models.Model):
     """Track blacklisted IPs"""
-    ip_address = models.GenericIPAddressField(unique=True)
+    ip_address = models.CharField(max_length=64, unique=True)  # IP or CIDR range
     description = models.TextField(blank=True)
     added_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
@@ -118,3 +217,102 @@ class BlacklistIP(models.Model):
 
     def __str__(self):
         return f"{self.ip_address}"
+
+class LogCheckpoint(models.Model):
+    """Track how far a log file has been ingested"""
+    path = models.CharField(max_length=255, unique=True)
+    inode = models.BigIntegerField(default=0)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'fail2ban_log_checkpoints'
+
+    def __str__(self):
+        return f"{self.path} @ {self.offset}"
+
+class BanDelta(models.Model):
+    """Ban/unban log shared with federation peers
+
+    The id is the sequence number peers pull from. Local deltas have an
+    empty origin; deltas applied from a peer keep its name and are never
+    republished.
+    """
+    ACTIONS = [
+        ('ban', 'Ban'),
+        ('unban', 'Unban'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    ip_address = models.GenericIPAddressField()
+    jail_name = models.CharField(max_length=100, blank=True)
+    duration = models.IntegerField(default=0)  # seconds, -1 for permanent
+    expires_at = models.DateTimeField(null=True, blank=True)
+    origin = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'fail2ban_ban_deltas'
+        indexes = [
+            models.Index(fields=['origin', 'id']),
+            models.Index(fields=['ip_address', '-id']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.ip_address}"
+
+class FederationPeer(models.Model):
+    """A node whose bans are pulled and applied here"""
+    name = models.CharField(max_length=100, unique=True)
+    url = models.URLField(max_length=255)  # the peer's api/federation/deltas/ endpoint
+    token = models.CharField(max_length=128)
+    jail_name = models.CharField(max_length=100, default='sshd')  # local jail its bans go into
+    is_active = models.BooleanField(default=True)
+    last_seq = models.BigIntegerField(default=0)  # last delta applied
+    remote_seq = models.BigIntegerField(default=0)  # peer's newest delta when last pulled
+    last_delta_at = models.DateTimeField(null=True, blank=True)  # when the peer recorded the last applied delta
+    last_lag_seconds = models.FloatField(null=True, blank=True)
+    last_pulled_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    applied_count = models.BigIntegerField(default=0)
+    conflict_count = models.BigIntegerField(default=0)  # bans skipped by the local whitelist
+    
+    class Meta:
+        db_table = 'fail2ban_federation_peers'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class CommandTask(models.Model):
+    """A restart or reload running in the background, polled by task id"""
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.CharField(max_length=32, primary_key=True)
+    name = models.CharField(max_length=100)
+    # The name while pending or running, NULL once finished: unique, so
+    # only one task of a name can be unfinished at a time
+    running_name = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    result = models.TextField(blank=True)  # JSON result dict of the finished operation
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'fail2ban_command_tasks'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['name', 'status']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
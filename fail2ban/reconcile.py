@@ -0,0 +1,132 @@
+import ipaddress
+import re
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import BannedIP
+from .escalation import EscalationPolicy, PERMANENT_BAN, DUPLICATE_BAN_WINDOW
+from .utils import Fail2banManager
+
+# Primary keys per UPDATE ... WHERE id IN (...), inside SQLite's parameter limit
+UPDATE_CHUNK_SIZE = 900
+WRITE_BATCH_SIZE = 1000
+IPV4_RE = re.compile(r'^(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)$')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def reconcile_bans(live_bans, now=None, policy=None):
+    """Bring BannedIP in line with the bans fail2ban actually holds
+
+    The live {jail: set of IPs} snapshot is diffed against the active rows
+    as two sets, and the difference is written in one transaction:
+
+    - banned in fail2ban but not active here: inserted, or reactivated
+    - active here but not banned in fail2ban: deactivated, unless the row
+      is an escalated or federated ban that firewalld holds past the
+      jail's bantime
+    - active in both, but fail2ban has it in other jails only: jail updated
+      (an address banned in several jails matches a row for any of them)
+
+    Returns:
+        dict: inserted, reactivated, deactivated, updated and kept counts
+    """
+    now = now or timezone.now()
+    policy = policy or EscalationPolicy.from_settings()
+
+    live = {}  # ip -> jails holding it, in name order
+    for jail in sorted(live_bans):
+        for ip in live_bans[jail]:
+            ip = _canonical(ip)
+            if ip is not None:
+                live.setdefault(ip, []).append(jail)
+
+    summary = {'inserted': 0, 'reactivated': 0, 'deactivated': 0, 'updated': 0, 'kept': 0}
+    with transaction.atomic():
+        # Only the columns needed for the diff; no per-row datetime conversion
+        active = {
+            ip: (pk, jail)
+            for pk, ip, jail in BannedIP.objects.filter(is_active=True)
+            .values_list('id', 'ip_address', 'jail_name')
+            .iterator(chunk_size=10000)
+        }
+
+        stale = [active[ip][0] for ip in active.keys() - live.keys()]
+        for chunk in _chunks(stale, UPDATE_CHUNK_SIZE):
+            held = {
+                pk for pk, jail, banned_at, expires_at in BannedIP.objects.filter(pk__in=chunk, expires_at__gt=now)
+                .values_list('id', 'jail_name', 'banned_at', 'expires_at')
+                if _held_by_firewall(jail, banned_at, expires_at, policy)
+            }
+            summary['kept'] += len(held)
+            summary['deactivated'] += (
+                BannedIP.objects.filter(pk__in=[pk for pk in chunk if pk not in held]).update(is_active=False)
+            )
+
+        moved = [
+            BannedIP(pk=active[ip][0], jail_name=live[ip][0])
+            for ip in active.keys() & live.keys()
+            if active[ip][1] not in live[ip]
+        ]
+        BannedIP.objects.bulk_update(moved, ['jail_name'], batch_size=WRITE_BATCH_SIZE)
+        summary['updated'] = len(moved)
+
+        missing = list(live.keys() - active.keys())
+        # Inactive rows keep the unique ip_address, so those are switched back on
+        inactive = BannedIP.objects.in_bulk(missing, field_name='ip_address')
+        for row in inactive.values():
+            _fill(row, live[row.ip_address][0], now, policy)
+        BannedIP.objects.bulk_update(
+            list(inactive.values()),
+            ['jail_name', 'ban_reason', 'banned_at', 'expires_at', 'is_active'],
+            batch_size=WRITE_BATCH_SIZE
+        )
+        summary['reactivated'] = len(inactive)
+
+        new_rows = [_fill(BannedIP(ip_address=ip), live[ip][0], now, policy) for ip in missing if ip not in inactive]
+        BannedIP.objects.bulk_create(new_rows, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+        summary['inserted'] = len(new_rows)
+
+    return summary
+
+
+def _canonical(ip):
+    """Canonical form of an address, skipping ipaddress for plain dotted IPv4"""
+    if IPV4_RE.match(ip):
+        return ip
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
+
+
+def _held_by_firewall(jail, banned_at, expires_at, policy):
+    """Whether a ban outlasts its jail's bantime, so firewalld holds it after fail2ban lets go"""
+    bantime = policy.bantime(jail)
+    return bantime >= 0 and expires_at - banned_at > timedelta(seconds=bantime) + DUPLICATE_BAN_WINDOW
+
+
+def _fill(row, jail, now, policy):
+    bantime = policy.bantime(jail)
+    row.jail_name = jail
+    row.ban_reason = f'Found banned in fail2ban jail {jail}'
+    row.banned_at = now
+    row.expires_at = now + (PERMANENT_BAN if bantime < 0 else timedelta(seconds=bantime))
+    row.is_active = True
+    return row
+
+
+def run_reconcile(manager=None):
+    """Reconcile against a fresh snapshot from fail2ban
+
+    Returns:
+        dict: reconcile summary, or None if fail2ban couldn't be queried
+    """
+    manager = manager or Fail2banManager()
+    live_bans = manager.get_live_bans()
+    if live_bans is None:
+        return None
+    return reconcile_bans(live_bans, policy=EscalationPolicy.from_settings(manager.config_file))
@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from .models import (
+    Fail2banSettings, SecurityEvent, SecurityEventHourlyRollup, SecurityEventDailyPrefixRollup, BanDelta
+)
+from .ipindex import source_prefix
+from .stats import local_now, local_day, start_of_day
+
+ARCHIVE_DIR = '/home/cyberpanel/fail2ban_archive'
+DELETE_CHUNK_SIZE = 5000
+HOURLY_ROLLUP_RETENTION_DAYS = 14
+DAILY_ROLLUP_RETENTION_DAYS = 400
+
+# Closed hours are re-aggregated this far back on every run so events that
+# arrive late (e.g. a log backfill) still land in the rollup
+ROLLUP_LOOKBACK = timedelta(hours=6)
+
+ARCHIVE_FIELDS = ['id', 'event_type', 'ip_address', 'jail_name', 'description', 'severity', 'created_at']
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_watermark():
+    """End of the last rolled-up hour; raw events before it are in the hourly rollup"""
+    last_hour = SecurityEventHourlyRollup.objects.aggregate(last=Max('hour'))['last']
+    if last_hour is None:
+        return None
+    return last_hour + timedelta(hours=1)
+
+
+def rollup_hourly(now=None, retention_days=None, rebuild=False):
+    """Aggregate closed hours of raw events into SecurityEventHourlyRollup
+
+    Events are grouped by hour, type, jail and address in SQL, then folded
+    into source prefixes in Python, so the work is proportional to distinct
+    addresses rather than events.
+
+    Returns:
+        tuple: (start, end) of the re-aggregated range, or None
+    """
+    now = now or local_now()
+    end = floor_hour(now)
+    watermark = None if rebuild else rollup_watermark()
+
+    if watermark is None:
+        first = SecurityEvent.objects.aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return None
+        start = floor_hour(first)
+    else:
+        start = watermark - ROLLUP_LOOKBACK
+        if retention_days is not None:
+            # Raw rows before the retention cutoff may already be pruned
+            start = max(start, floor_hour(now - timedelta(days=retention_days)))
+
+    if start >= end:
+        return None
+
+    grouped = (
+        SecurityEvent.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by()
+        .annotate(hour=TruncHour('created_at'))
+        .values_list('hour', 'event_type', 'jail_name', 'ip_address')
+        .annotate(count=Count('id'))
+    )
+    counts = Counter()
+    for hour, event_type, jail_name, ip_address, count in grouped.iterator():
+        counts[(hour, event_type, jail_name or '', source_prefix(ip_address) if ip_address else '')] += count
+
+    with transaction.atomic():
+        SecurityEventHourlyRollup.objects.filter(hour__gte=start, hour__lt=end).delete()
+        SecurityEventHourlyRollup.objects.bulk_create([
+            SecurityEventHourlyRollup(hour=hour, event_type=event_type, jail_name=jail_name, source_prefix=prefix, count=count)
+            for (hour, event_type, jail_name, prefix), count in counts.items()
+        ], batch_size=1000)
+
+    return start, end
+
+
+def rollup_daily(since, now=None):
+    """Compact closed days of the hourly rollup into SecurityEventDailyPrefixRollup"""
+    now = now or local_now()
+    first_day = local_day(since)
+    today = now.date()
+    if first_day >= today:
+        return None
+
+    rows = (
+        SecurityEventHourlyRollup.objects.filter(hour__gte=start_of_day(first_day), hour__lt=start_of_day(today))
+        .order_by()
+        .annotate(day=TruncDate('hour'))
+        .values('day', 'event_type', 'jail_name', 'source_prefix')
+        .annotate(total=Sum('count'))
+    )
+
+    with transaction.atomic():
+        SecurityEventDailyPrefixRollup.objects.filter(day__gte=first_day, day__lt=today).delete()
+        SecurityEventDailyPrefixRollup.objects.bulk_create([
+            SecurityEventDailyPrefixRollup(
+                day=row['day'],
+                event_type=row['event_type'],
+                jail_name=row['jail_name'],
+                source_prefix=row['source_prefix'],
+                count=row['total']
+            )
+            for row in rows.iterator()
+        ], batch_size=1000)
+
+    return first_day, today
+
+
+def prune_events(cutoff, chunk_size=DELETE_CHUNK_SIZE, archive_path=None):
+    """Delete raw events older than cutoff in chunks, optionally archiving them
+
+    Each chunk is written to the gzip JSONL archive before it's deleted, so
+    an archive failure never loses rows.
+
+    Returns:
+        int: number of deleted events
+    """
+    deleted = 0
+    archive = gzip.open(archive_path, 'at', encoding='utf-8') if archive_path else None
+    try:
+        while True:
+            ids = list(
+                SecurityEvent.objects.filter(created_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            if archive is not None:
+                for row in SecurityEvent.objects.filter(id__in=ids).order_by('id').values(*ARCHIVE_FIELDS):
+                    archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+                archive.flush()
+
+            SecurityEvent.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if archive_path and not deleted and os.path.exists(archive_path) and os.path.getsize(archive_path) <= 20:
+        # Nothing was pruned; don't leave an empty archive behind
+        os.unlink(archive_path)
+    return deleted
+
+
+def run_retention(retention_days=None, archive=None, archive_dir=ARCHIVE_DIR, chunk_size=DELETE_CHUNK_SIZE, rebuild=False):
+    """Roll up, then prune raw events and old hourly/daily rollups
+
+    Raw events are only deleted below the rollup watermark, so nothing is
+    pruned before it has been counted.
+
+    Returns:
+        dict: summary of the run
+    """
+    settings = Fail2banSettings.get_settings()
+    if retention_days is None:
+        retention_days = settings.event_retention_days
+    if archive is None:
+        archive = settings.archive_pruned_events
+
+    now = local_now()
+    summary = {'rolled_up': None, 'pruned_events': 0, 'pruned_deltas': 0, 'archive': None}
+
+    rolled = rollup_hourly(now=now, retention_days=retention_days, rebuild=rebuild)
+    if rolled:
+        rollup_daily(rolled[0], now=now)
+        summary['rolled_up'] = [rolled[0].isoformat(), rolled[1].isoformat()]
+
+    watermark = rollup_watermark()
+    if watermark is not None and retention_days > 0:
+        cutoff = min(floor_hour(now - timedelta(days=retention_days)), watermark)
+        archive_path = None
+        if archive:
+            os.makedirs(archive_dir, exist_ok=True)
+            archive_path = os.path.join(archive_dir, f'security-events-{now.strftime("%Y%m%dT%H%M%S")}.jsonl.gz')
+        summary['pruned_events'] = prune_events(cutoff, chunk_size=chunk_size, archive_path=archive_path)
+        if archive_path and os.path.exists(archive_path):
+            summary['archive'] = archive_path
+
+    if retention_days > 0:
+        # Federation deltas past retention; remote bans still in force are
+        # kept because they stop the local ban from being republished
+        cutoff = now - timedelta(days=retention_days)
+        summary['pruned_deltas'], _ = BanDelta.objects.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__lt=now),
+            created_at__lt=cutoff
+        ).delete()
+
+    SecurityEventHourlyRollup.objects.filter(hour__lt=now - timedelta(days=HOURLY_ROLLUP_RETENTION_DAYS)).delete()
+    SecurityEventDailyPrefixRollup.objects.filter(day__lt=now.date() - timedelta(days=DAILY_ROLLUP_RETENTION_DAYS)).delete()
+
+    return summary
@@ -3,6 +3,8 @@ from django.dispatch import receiver
 from django.http import HttpResponse
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
 from .models import SecurityEvent, BannedIP
+from .stats import increment_daily_rollup, local_day
+from .analytics import record_offenders
 
 # Try to import CyberPanel signals (may not be available in all versions)
 try:
@@ -18,6 +20,18 @@ def log_security_event(sender, instance, created, **kwargs):
     if created:
         logging.writeToFile(f"Fail2ban Security Event: {instance.event_type} - {instance.ip_address} - {instance.description}")
 
+@receiver(post_save, sender=SecurityEvent)
+def update_event_rollup(sender, instance, created, **kwargs):
+    """Keep the daily statistics rollup in step with new events"""
+    if created:
+        increment_daily_rollup(local_day(instance.created_at), instance.event_type)
+
+@receiver(post_save, sender=SecurityEvent)
+def update_offender_stats(sender, instance, created, **kwargs):
+    """Keep the per-address offender counters in step with new events"""
+    if created and instance.ip_address:
+        record_offenders([(instance.ip_address, instance.event_type, instance.jail_name, instance.created_at)])
+
 @receiver(post_save, sender=BannedIP)
 def log_banned_ip(sender, instance, created, **kwargs):
     """Log banned IP events"""
@@ -0,0 +1,256 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+from django.conf import settings as django_settings
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, F, Max, Q, Sum, Value
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+from .models import (
+    SecurityEvent, SecurityEventDailyRollup, SecurityEventHourlyRollup, SecurityEventDailyPrefixRollup,
+    BannedIP, WhitelistIP, BlacklistIP
+)
+
+# window -> (span, bucket)
+WINDOWS = {
+    '24h': (timedelta(hours=24), 'hour'),
+    '7d': (timedelta(days=7), 'day'),
+    '30d': (timedelta(days=30), 'day'),
+    '1y': (timedelta(days=365), 'day'),
+}
+DEFAULT_WINDOW = '30d'
+
+# Statistics key -> SecurityEvent.event_type
+EVENT_TOTALS = {
+    'total_bans': 'ban',
+    'total_unbans': 'unban',
+    'total_attacks': 'attack',
+}
+TOP_BREAKDOWN = 10
+
+
+def local_now():
+    """Current time in the active timezone (naive when USE_TZ is off)"""
+    now = timezone.now()
+    return timezone.localtime(now) if timezone.is_aware(now) else now
+
+
+def local_day(value):
+    """Calendar day of a datetime in the active timezone"""
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def start_of_day(day):
+    """First instant of a calendar day in the active timezone"""
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if django_settings.USE_TZ else start
+
+
+def record_events(created_ats_and_types):
+    """Add events to the daily rollup
+
+    Args:
+        created_ats_and_types: iterable of (created_at, event_type) pairs
+    """
+    counts = Counter((local_day(created_at), event_type) for created_at, event_type in created_ats_and_types)
+    for (day, event_type), count in counts.items():
+        increment_daily_rollup(day, event_type, count)
+
+
+def increment_daily_rollup(day, event_type, count=1):
+    """Atomically add count to one (day, event_type) rollup row"""
+    updated = SecurityEventDailyRollup.objects.filter(day=day, event_type=event_type).update(count=F('count') + count)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            SecurityEventDailyRollup.objects.create(day=day, event_type=event_type, count=count)
+    except IntegrityError:
+        # Another writer created the row first
+        SecurityEventDailyRollup.objects.filter(day=day, event_type=event_type).update(count=F('count') + count)
+
+
+def rebuild_daily_rollups():
+    """Recompute the daily rollup from the raw SecurityEvent table"""
+    rows = (
+        SecurityEvent.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'event_type')
+        .annotate(count=Count('id'))
+    )
+    with transaction.atomic():
+        SecurityEventDailyRollup.objects.all().delete()
+        SecurityEventDailyRollup.objects.bulk_create(
+            [SecurityEventDailyRollup(day=row['day'], event_type=row['event_type'], count=row['count']) for row in rows],
+            batch_size=1000
+        )
+
+
+def _current_counts():
+    """Active ban/whitelist/blacklist counts in a single UNION ALL query"""
+    def count(queryset, key):
+        return (
+            queryset.order_by()
+            .annotate(key=Value(key, output_field=CharField()))
+            .values('key')
+            .annotate(count=Count('pk'))
+            .values_list('key', 'count')
+        )
+
+    counts = dict(
+        count(BannedIP.objects.filter(is_active=True, expires_at__gt=timezone.now()), 'currently_banned').union(
+            count(WhitelistIP.objects.filter(is_active=True), 'whitelisted_ips'),
+            count(BlacklistIP.objects.filter(is_active=True), 'blacklisted_ips'),
+            all=True
+        )
+    )
+    return {key: counts.get(key, 0) for key in ('currently_banned', 'whitelisted_ips', 'blacklisted_ips')}
+
+
+def _from_events(since, bucket):
+    """Totals and series straight from SecurityEvent (two queries)"""
+    events = SecurityEvent.objects.filter(created_at__gte=since).order_by()
+
+    aggregates = {'total_events': Count('id')}
+    for key, event_type in EVENT_TOTALS.items():
+        aggregates[key] = Count('id', filter=Q(event_type=event_type))
+    totals = events.aggregate(**aggregates)
+
+    trunc = TruncHour('created_at') if bucket == 'hour' else TruncDate('created_at')
+    series = dict(
+        events.annotate(period=trunc)
+        .values('period')
+        .annotate(count=Count('id'))
+        .values_list('period', 'count')
+    )
+    return totals, series
+
+
+def _from_daily_rollup(first_day):
+    """Totals and series from the daily rollup (one query, at most days x event types rows)"""
+    rows = SecurityEventDailyRollup.objects.filter(day__gte=first_day).values_list('day', 'event_type', 'count')
+    totals = {key: 0 for key in ['total_events'] + list(EVENT_TOTALS)}
+    series = Counter()
+    for day, event_type, count in rows:
+        totals['total_events'] += count
+        for key, total_type in EVENT_TOTALS.items():
+            if event_type == total_type:
+                totals[key] += count
+        series[day] += count
+    return totals, series
+
+
+def _from_hourly_rollup(since):
+    """Totals and series from the hourly rollup, topped up with raw events newer than it"""
+    last_hour = SecurityEventHourlyRollup.objects.aggregate(last=Max('hour'))['last']
+    if last_hour is None or last_hour < since:
+        return _from_events(since, 'hour')
+
+    watermark = last_hour + timedelta(hours=1)
+    rows = (
+        SecurityEventHourlyRollup.objects.filter(hour__gte=since, hour__lt=watermark)
+        .order_by()
+        .values_list('hour', 'event_type')
+        .annotate(total=Sum('count'))
+    )
+    totals = {key: 0 for key in ['total_events'] + list(EVENT_TOTALS)}
+    series = Counter()
+    for hour, event_type, count in rows:
+        totals['total_events'] += count
+        for key, total_type in EVENT_TOTALS.items():
+            if event_type == total_type:
+                totals[key] += count
+        series[timezone.localtime(hour) if timezone.is_aware(hour) else hour] += count
+
+    recent_totals, recent_series = _from_events(watermark, 'hour')
+    for key, count in recent_totals.items():
+        totals[key] += count
+    series.update(recent_series)
+    return totals, series
+
+
+def rollup_querysets(bucket, since):
+    """Prefix rollup querysets covering a window starting at since"""
+    if bucket == 'hour':
+        return [SecurityEventHourlyRollup.objects.filter(hour__gte=since)]
+    # Closed days are compacted daily; today is still only in the hourly rollup
+    today = local_now().date()
+    return [
+        SecurityEventDailyPrefixRollup.objects.filter(day__gte=local_day(since), day__lt=today),
+        SecurityEventHourlyRollup.objects.filter(hour__gte=start_of_day(today)),
+    ]
+
+
+def sum_rollups(querysets, *fields):
+    """Sum rollup counts grouped by fields across querysets
+
+    Returns:
+        Counter keyed by the field value (or a tuple for several fields)
+    """
+    totals = Counter()
+    for queryset in querysets:
+        rows = queryset.order_by().values_list(*fields).annotate(total=Sum('count'))
+        for row in rows:
+            totals[row[0] if len(fields) == 1 else row[:-1]] += row[-1]
+    return totals
+
+
+def _breakdown(bucket, since):
+    """Top jails and source prefixes for a window, from the prefix rollups"""
+    querysets = rollup_querysets(bucket, since)
+    jails = sum_rollups(querysets, 'jail_name')
+    prefixes = sum_rollups([queryset.exclude(source_prefix='') for queryset in querysets], 'source_prefix')
+
+    return {
+        'events_by_jail': [
+            {'jail': jail or 'unknown', 'count': count} for jail, count in jails.most_common(TOP_BREAKDOWN)
+        ],
+        'top_prefixes': [
+            {'prefix': prefix, 'count': count} for prefix, count in prefixes.most_common(TOP_BREAKDOWN)
+        ],
+    }
+
+
+def get_statistics(window=DEFAULT_WINDOW, source=None):
+    """Build dashboard statistics for a window ('24h', '7d', '30d' or '1y')
+
+    Windows are served from the daily and hourly rollups, so their cost
+    depends on the window length rather than the number of events. Pass
+    source='events' to compute them from the raw table instead (only
+    complete within the event retention period).
+    """
+    if window not in WINDOWS:
+        raise ValueError(f'Unknown statistics window: {window}')
+    span, bucket = WINDOWS[window]
+    now = local_now()
+
+    if bucket == 'day':
+        today = now.date()
+        periods = [today - timedelta(days=offset) for offset in reversed(range(span.days))]
+        if source == 'events':
+            totals, series = _from_events(start_of_day(periods[0]), bucket)
+        else:
+            totals, series = _from_daily_rollup(periods[0])
+    else:
+        current_hour = now.replace(minute=0, second=0, microsecond=0)
+        hours = int(span.total_seconds() // 3600)
+        periods = [current_hour - timedelta(hours=offset) for offset in reversed(range(hours))]
+        if source == 'events':
+            totals, series = _from_events(periods[0], bucket)
+        else:
+            totals, series = _from_hourly_rollup(periods[0])
+
+    stats = dict(totals)
+    stats.update(_current_counts())
+    stats.update(_breakdown(bucket, periods[0] if bucket == 'hour' else start_of_day(periods[0])))
+    stats['window'] = window
+    stats['bucket'] = bucket
+    stats['events_by_period'] = [
+        {'period': period.isoformat(), 'count': series.get(period, 0)}
+        for period in periods
+    ]
+    if bucket == 'day':
+        stats['events_by_day'] = [
+            {'date': entry['period'], 'count': entry['count']}
+            for entry in stats['events_by_period']
+        ]
+    return stats
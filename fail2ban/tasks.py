@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from .models import CommandTask
+
+TASK_WORKERS = 2
+# Unfinished tasks older than this were lost with the process that ran them
+TASK_STALE_AFTER = timedelta(minutes=15)
+TASK_RETENTION = timedelta(days=1)
+UNFINISHED = ('pending', 'running')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix='fail2ban-task')
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _in_background(task_id, func, args):
+    _get_pool().submit(_worker, task_id, func, args)
+
+
+def _worker(task_id, func, args):
+    close_old_connections()
+    try:
+        run_task(task_id, func, args)
+    finally:
+        close_old_connections()
+
+
+def run_task(task_id, func, args=()):
+    """Run func(*args) for a task and store its result dict"""
+    CommandTask.objects.filter(pk=task_id).update(status='running', started_at=timezone.now())
+    try:
+        result = func(*args)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    CommandTask.objects.filter(pk=task_id).update(
+        running_name=None,
+        status='succeeded' if result.get('success') else 'failed',
+        result=json.dumps(result, cls=DjangoJSONEncoder),
+        finished_at=timezone.now()
+    )
+
+
+def _expire_stale(now):
+    CommandTask.objects.filter(status__in=UNFINISHED, created_at__lt=now - TASK_STALE_AFTER).update(
+        running_name=None,
+        status='failed',
+        result=json.dumps({'success': False, 'error': 'Task was interrupted'}),
+        finished_at=now
+    )
+
+
+def submit_task(name, func, *args, runner=None):
+    """Start func(*args) in the background and return its CommandTask
+
+    func follows the Fail2banManager convention of returning a dict with
+    'success'. While a task of the same name is still pending or running
+    it is returned instead of starting another, so repeated clicks on
+    restart don't queue a string of restarts; the unique running_name
+    keeps that true for requests racing each other too.
+
+    Args:
+        runner: called as runner(task_id, func, args) to start the task;
+            defaults to the process-wide worker pool
+    """
+    now = timezone.now()
+    _expire_stale(now)
+    CommandTask.objects.filter(finished_at__lt=now - TASK_RETENTION).delete()
+
+    while True:
+        try:
+            with transaction.atomic():
+                task = CommandTask.objects.create(id=uuid.uuid4().hex, name=name, running_name=name, created_at=now)
+            break
+        except IntegrityError:
+            existing = CommandTask.objects.filter(running_name=name).first()
+            if existing is not None:
+                return existing
+            # It finished in between; try again
+
+    (runner or _in_background)(task.pk, func, args)
+    return task
+
+
+def get_task(task_id):
+    """A task by id, or None"""
+    _expire_stale(timezone.now())
+    return CommandTask.objects.filter(pk=task_id).first()
+
+
+def task_data(task):
+    """Task as returned by the task status API"""
+    task.refresh_from_db()
+    return {
+        'id': task.pk,
+        'name': task.name,
+        'status': task.status,
+        'finished': task.status not in UNFINISHED,
+        'result': json.loads(task.result) if task.result else None,
+        'created_at': task.created_at.isoformat(),
+        'started_at': task.started_at.isoformat() if task.started_at else None,
+        'finished_at': task.finished_at.isoformat() if task.finished_at else None,
+    }
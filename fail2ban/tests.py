@@ -1,9 +1,37 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Fail2banSettings, SecurityEvent, BannedIP
+from .models import Fail2banSettings, SecurityEvent, BannedIP, SecurityEventDailyRollup, SecurityEventHourlyRollup, OffenderStats, BlacklistIP, BanEscalation, WhitelistIP, BanDelta, FederationPeer, CommandTask
 from .utils import Fail2banManager
+from .ipindex import IPIntervalIndex, merge_ip_entries, source_prefix
+from .jailconfig import JailConfig
+from .logparse import parse_action_line, parse_duration, iter_action_lines
+from .stats import get_statistics, record_events, rebuild_daily_rollups
+from .retention import run_retention
+from .logreader import read_logs
+from .live import EventBroadcaster
+from .analytics import record_offenders, top_offenders, get_recommendations, cluster_prefixes
+from .escalation import EscalationPolicy, parse_steps
+from .expiry import expire_bans
+from .federation import publish_deltas, get_deltas, pull_peer
+from .ingest import Fail2banLogIngester
+from .reconcile import reconcile_bans
+from . import filtertest
+from .filtertest import run_filter_test, benchmark_regex, resolve_jail, strip_date
+from .dashboard import get_dashboard, dashboard_etag, cached_dashboard, DASHBOARD_TTL, _dashboards
+from .executor import CommandExecutor
+from .tasks import submit_task, run_task, get_task, task_data
+from datetime import datetime, timedelta
+from django.utils import timezone
+import gzip
+import ipaddress
+import io
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 
 class Fail2banPluginTestCase(TestCase):
     def setUp(self):
@@ -88,8 +116,833 @@ class Fail2banManagerTestCase(TestCase):
         self.assertFalse(self.manager.is_valid_ip('invalid'))
         self.assertFalse(self.manager.is_valid_ip('192.168.1.256'))
     
+    def test_is_valid_network(self):
+        """Test IP and CIDR range validation"""
+        self.assertTrue(self.manager.is_valid_network('10.0.0.0/24'))
+        self.assertTrue(self.manager.is_valid_network('2001:db8::/32'))
+        self.assertTrue(self.manager.is_valid_network('8.8.8.8'))
+        self.assertFalse(self.manager.is_valid_network('10.0.0.0/33'))
+        self.assertFalse(self.manager.is_valid_network('invalid'))
+    
     def test_run_command(self):
         """Test command execution"""
         result = self.manager.run_command('echo "test"')
         self.assertTrue(result['success'])
         self.assertEqual(result['stdout'], 'test')
+
+
+class IPIntervalIndexTestCase(TestCase):
+    def test_collapses_overlapping_ranges(self):
+        """Test adjacent and nested ranges are collapsed"""
+        index = IPIntervalIndex(['10.0.0.0/24', '10.0.1.0/24', '10.0.0.5', '::1', 'not-an-ip'])
+        self.assertEqual(index.to_list(), ['10.0.0.0/23', '::1'])
+    
+    def test_membership(self):
+        """Test address and range membership lookups"""
+        index = IPIntervalIndex(['192.168.0.0/16', '203.0.113.7', '2001:db8::/32'])
+        self.assertIn('192.168.44.2', index)
+        self.assertIn('192.168.1.0/24', index)
+        self.assertIn('203.0.113.7', index)
+        self.assertIn('2001:db8::1', index)
+        self.assertNotIn('203.0.113.8', index)
+        self.assertNotIn('192.0.0.0/8', index)
+        self.assertNotIn('2001:db9::1', index)
+        self.assertNotIn('invalid', index)
+    
+    def test_merge_keeps_hostnames(self):
+        """Test ignoreip merging keeps non-IP entries"""
+        merged = merge_ip_entries(['127.0.0.1/8', 'example.com', '127.0.0.5', '::1'])
+        self.assertEqual(merged, ['example.com', '127.0.0.0/8', '::1'])
+
+
+class JailConfigTestCase(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.local')
+        with os.fdopen(fd, 'w') as f:
+            f.write(
+                '# Local overrides\n'
+                '[DEFAULT]\n'
+                'ignoreip = 127.0.0.1/8 ::1\n'
+                '    10.0.0.0/24\n'
+                'bantime = 3600\n'
+                '\n'
+                '[sshd]\n'
+                'enabled = true\n'
+                '\n'
+                '[recidive]\n'
+                'ignoreip = 127.0.0.1/8\n'
+            )
+    
+    def tearDown(self):
+        os.unlink(self.path)
+    
+    def test_ignoreip_sections(self):
+        """Test only DEFAULT and overriding jails carry their own ignoreip"""
+        config = JailConfig(self.path)
+        self.assertEqual(config.ignoreip_sections(), ['DEFAULT', 'recidive'])
+        self.assertEqual(config.get_list('DEFAULT', 'ignoreip'), ['127.0.0.1/8', '::1', '10.0.0.0/24'])
+        self.assertEqual(config.get_list('sshd', 'ignoreip'), ['127.0.0.1/8', '::1', '10.0.0.0/24'])
+    
+    def test_set_preserves_comments(self):
+        """Test editing a multi-line option keeps the rest of the file intact"""
+        config = JailConfig(self.path)
+        config.set_list('DEFAULT', 'ignoreip', ['127.0.0.1/8', '::1'])
+        config.set('sshd', 'bantime', '600')
+        config.save()
+        
+        with open(self.path) as f:
+            content = f.read()
+        self.assertIn('# Local overrides', content)
+        self.assertNotIn('10.0.0.0/24', content)
+        reloaded = JailConfig(self.path)
+        self.assertEqual(reloaded.get('sshd', 'bantime'), '600')
+        self.assertEqual(reloaded.get('DEFAULT', 'bantime'), '3600')
+
+
+class LogParseTestCase(TestCase):
+    def test_parse_ban_line(self):
+        """Test Ban lines are parsed with their real timestamp"""
+        event = parse_action_line('2026-01-15 10:23:45,123 fail2ban.actions        [1234]: NOTICE  [sshd] Ban 203.0.113.7\n')
+        self.assertEqual(event['event_type'], 'ban')
+        self.assertEqual(event['jail'], 'sshd')
+        self.assertEqual(event['ip'], '203.0.113.7')
+        self.assertEqual(event['timestamp'].isoformat(), '2026-01-15T10:23:45.123000')
+    
+    def test_parse_other_lines(self):
+        """Test Found/Unban lines and non-action lines"""
+        found = parse_action_line('2026-01-15 10:23:44,001 fail2ban.filter [99]: INFO    [sshd] Found 2001:db8::1 - 2026-01-15 10:23:44')
+        self.assertEqual(found['event_type'], 'attack')
+        self.assertEqual(found['ip'], '2001:db8::1')
+        unban = parse_action_line('2026-01-15 11:23:45,123 fail2ban.actions [1234]: NOTICE  [sshd] Unban 203.0.113.7')
+        self.assertEqual(unban['event_type'], 'unban')
+        self.assertIsNone(parse_action_line("2026-01-15 10:00:00,000 fail2ban.jail [1]: INFO    Jail 'sshd' started"))
+    
+    def test_partial_line_is_not_consumed(self):
+        """Test the trailing line still being written is left for the next read"""
+        data = (
+            b'2026-01-15 10:23:45,123 fail2ban.actions [1]: NOTICE  [sshd] Ban 203.0.113.7\n'
+            b'2026-01-15 10:23:46,123 fail2ban.actions [1]: NOTICE  [sshd] Ban 203.0.'
+        )
+        results = list(iter_action_lines(io.BytesIO(data)))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], data.index(b'\n') + 1)
+    
+    def test_parse_duration(self):
+        """Test fail2ban time abbreviations"""
+        self.assertEqual(parse_duration('3600'), 3600)
+        self.assertEqual(parse_duration('10m'), 600)
+        self.assertEqual(parse_duration('1h 30m'), 5400)
+        self.assertEqual(parse_duration('1w'), 604800)
+        self.assertEqual(parse_duration('-1'), -1)
+        self.assertEqual(parse_duration('', 42), 42)
+
+
+class LogReaderTestCase(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            for second in range(50):
+                f.write(f'2026-01-15 10:00:{second:02d},000 fail2ban.filter [1]: INFO    [sshd] Found 203.0.113.{second} - 2026-01-15 10:00:{second:02d}\n')
+            f.write('2026-01-15 10:01:00,000 fail2ban.actions [1]: ERROR   [nginx] Failed to execute ban\n')
+            f.write('Traceback (most recent call last):\n')
+            f.write('2026-01-15 10:01:01,000 fail2ban.actions [1]: NOTICE  [sshd] Ban 203.0.113.7\n')
+    
+    def tearDown(self):
+        os.unlink(self.path)
+    
+    def test_tail_and_cursor(self):
+        """Test the tail has real timestamps and a cursor returns only new entries"""
+        result = read_logs(limit=5, log_path=self.path)
+        self.assertEqual(len(result['entries']), 5)
+        self.assertEqual(result['entries'][-1]['timestamp'], '2026-01-15T10:01:01')
+        self.assertEqual(result['entries'][-1]['event_type'], 'ban')
+        self.assertIn('Traceback', result['entries'][-2]['message'])
+        
+        self.assertEqual(read_logs(cursor=result['cursor'], log_path=self.path)['entries'], [])
+        with open(self.path, 'a') as f:
+            f.write('2026-01-15 10:02:00,000 fail2ban.actions [1]: NOTICE  [sshd] Unban 203.0.113.7\n')
+            f.write('2026-01-15 10:02:01,000 fail2ban.actions [1]: NOTICE  [sshd] Ban 203.0.')
+        new = read_logs(cursor=result['cursor'], log_path=self.path)
+        self.assertEqual([entry['event_type'] for entry in new['entries']], ['unban'])
+    
+    def test_filters(self):
+        """Test jail, IP range and level filters are applied server-side"""
+        self.assertEqual(len(read_logs(jail='nginx', log_path=self.path)['entries']), 1)
+        self.assertEqual(len(read_logs(level='error', log_path=self.path)['entries']), 1)
+        self.assertEqual(len(read_logs(ip='203.0.113.0/29', log_path=self.path)['entries']), 9)
+        
+        page = read_logs(cursor=f'file:{os.stat(self.path).st_ino}:0', limit=20, log_path=self.path)
+        self.assertEqual(len(page['entries']), 20)
+        self.assertTrue(page['has_more'])
+
+
+class LiveEventsTestCase(TestCase):
+    def setUp(self):
+        self.broadcaster = EventBroadcaster(log_path='/nonexistent/fail2ban.log', buffer_size=5)
+    
+    def publish(self, count):
+        for index in range(count):
+            self.broadcaster.publish({'event_type': 'ban', 'jail': 'sshd', 'ip': f'203.0.113.{index}', 'timestamp': datetime(2026, 1, 15, 10, 0, index)})
+    
+    def test_clients_share_frames(self):
+        """Test every client gets the same preformatted frames after its last id"""
+        self.publish(3)
+        first = self.broadcaster.frames_after(0)
+        self.assertEqual(len(first), 3)
+        self.assertIs(first[1], self.broadcaster.frames_after(1)[0])
+        self.assertIn('event: ban', first[0])
+        self.assertEqual(self.broadcaster.frames_after(3), [])
+    
+    def test_slow_client_resyncs(self):
+        """Test a client behind the bounded buffer is told to resync"""
+        self.publish(10)
+        self.assertIsNone(self.broadcaster.frames_after(2))
+        stream = self.broadcaster.stream(last_event_id=2, max_seconds=1, heartbeat=0.01)
+        self.assertTrue(next(stream).startswith('retry:'))
+        self.assertIn('event: resync', next(stream))
+        self.assertEqual(next(stream), ': heartbeat\n\n')
+        stream.close()
+        self.assertEqual(self.broadcaster.subscribers, 0)
+    
+    def test_streams_are_capped_per_process(self):
+        """Test clients past max_streams are turned away and slots come back on close"""
+        broadcaster = EventBroadcaster(log_path='/nonexistent/fail2ban.log', max_streams=2)
+        streams = [broadcaster.stream(), broadcaster.stream()]
+        self.assertIsNone(broadcaster.stream())
+        # A response closed before it was ever iterated still frees its slot
+        streams[0].close()
+        streams[0].close()
+        self.assertEqual(broadcaster.subscribers, 1)
+        third = broadcaster.stream()
+        self.assertIsNotNone(third)
+        for stream in (streams[1], third):
+            stream.close()
+        self.assertEqual(broadcaster.subscribers, 0)
+
+
+class StatisticsTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        SecurityEvent.objects.bulk_create([
+            SecurityEvent(event_type=event_type, ip_address='203.0.113.7', description='Test', created_at=now - timedelta(hours=hours))
+            for hours in range(0, 24 * 40, 6)
+            for event_type in ('ban', 'attack')
+        ])
+        rebuild_daily_rollups()
+    
+    def test_rollup_matches_raw_events(self):
+        """Test rollup-backed windows agree with counting the raw table"""
+        for window in ('7d', '30d', '1y'):
+            rollup = get_statistics(window)
+            raw = get_statistics(window, source='events')
+            self.assertEqual(rollup['total_events'], raw['total_events'])
+            self.assertEqual(rollup['total_bans'], raw['total_bans'])
+            self.assertEqual(rollup['events_by_day'], raw['events_by_day'])
+    
+    def test_window_lengths(self):
+        """Test each window returns one bucket per hour or day"""
+        self.assertEqual(len(get_statistics('24h')['events_by_period']), 24)
+        self.assertEqual(len(get_statistics('7d')['events_by_day']), 7)
+        self.assertEqual(len(get_statistics('1y')['events_by_day']), 365)
+    
+    def test_record_events(self):
+        """Test the event writer increments the rollup"""
+        before = SecurityEventDailyRollup.objects.filter(event_type='unban').count()
+        record_events([(timezone.now(), 'unban'), (timezone.now(), 'unban')])
+        self.assertEqual(before, 0)
+        self.assertEqual(get_statistics('7d')['total_unbans'], 2)
+
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        SecurityEvent.objects.bulk_create([
+            SecurityEvent(event_type='attack', ip_address=f'198.51.100.{hours % 200}', jail_name='sshd', description='Test', created_at=now - timedelta(hours=hours))
+            for hours in range(1, 24 * 10)
+        ])
+        self.archive_dir = tempfile.mkdtemp()
+    
+    def test_source_prefix(self):
+        """Test addresses are folded into /24 and /48 prefixes"""
+        self.assertEqual(source_prefix('198.51.100.77'), '198.51.100.0/24')
+        self.assertEqual(source_prefix('2001:db8:1:2::1'), '2001:db8:1::/48')
+        self.assertEqual(source_prefix('not-an-ip'), '')
+    
+    def test_prune_keeps_rolled_up_counts(self):
+        """Test pruning deletes old rows only after rolling them up, and archives them"""
+        total = SecurityEvent.objects.count()
+        summary = run_retention(retention_days=3, archive=True, archive_dir=self.archive_dir, chunk_size=50)
+        
+        self.assertGreater(summary['pruned_events'], 0)
+        self.assertEqual(SecurityEvent.objects.count(), total - summary['pruned_events'])
+        self.assertFalse(SecurityEvent.objects.filter(created_at__lt=timezone.now() - timedelta(days=4)).exists())
+        self.assertEqual(sum(SecurityEventHourlyRollup.objects.values_list('count', flat=True)), total)
+        
+        with gzip.open(summary['archive'], 'rt') as f:
+            self.assertEqual(sum(1 for _ in f), summary['pruned_events'])
+    
+    def test_statistics_read_rollups(self):
+        """Test the 24h window agrees with the raw table once events are rolled up"""
+        run_retention(retention_days=30)
+        rollup = get_statistics('24h')
+        raw = get_statistics('24h', source='events')
+        self.assertEqual(rollup['total_events'], raw['total_events'])
+        self.assertEqual(rollup['events_by_period'], raw['events_by_period'])
+        self.assertEqual(rollup['events_by_jail'][0]['jail'], 'sshd')
+
+class AnalyticsTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        events = []
+        # Four hosts of one /24 banned, one of them repeatedly
+        for host in range(1, 5):
+            events.append((f'198.51.100.{host}', 'ban', 'sshd', now - timedelta(hours=host)))
+        events += [('198.51.100.1', 'ban', 'sshd', now - timedelta(days=2))] * 2
+        # A noisy but old attacker and a fresh one
+        events += [('203.0.113.50', 'attack', 'nginx', now - timedelta(days=20))] * 40
+        events += [('203.0.113.60', 'attack', 'nginx', now - timedelta(minutes=5))] * 10
+        record_offenders(events)
+    
+    def test_counters_and_decayed_ranking(self):
+        """Test counters accumulate and recent activity outranks old volume"""
+        offender = OffenderStats.objects.get(ip_address='198.51.100.1')
+        self.assertEqual(offender.ban_count, 3)
+        self.assertEqual(offender.source_prefix, '198.51.100.0/24')
+        ranked = [row['ip'] for row in top_offenders('30d')]
+        self.assertEqual(ranked[0], '198.51.100.1')
+        self.assertLess(ranked.index('203.0.113.60'), ranked.index('203.0.113.50'))
+    
+    def test_recommendations(self):
+        """Test range-ban and blacklist escalations, skipping whitelisted and blacklisted targets"""
+        recommendations = get_recommendations('7d', whitelist=[])
+        targets = {(item['action'], item['target']) for item in recommendations}
+        self.assertIn(('range_ban', '198.51.100.0/24'), targets)
+        self.assertIn(('blacklist', '198.51.100.1'), targets)
+        
+        BlacklistIP.objects.create(ip_address='198.51.100.0/24')
+        self.assertEqual(get_recommendations('7d', whitelist=[]), [])
+        
+        whitelist = [ipaddress.ip_network('198.51.100.200/32')]
+        BlacklistIP.objects.all().delete()
+        targets = [item['target'] for item in get_recommendations('7d', whitelist=whitelist)]
+        self.assertEqual(targets, ['198.51.100.1'])
+    
+    def test_cluster_prefixes(self):
+        """Test adjacent /24s are merged into one block"""
+        clusters = cluster_prefixes({'10.0.0.0/24': 5, '10.0.1.0/24': 3, '10.9.0.0/24': 1})
+        self.assertEqual(clusters, [{'network': '10.0.0.0/23', 'prefixes': 2, 'count': 8}])
+
+class EscalationTestCase(TestCase):
+    def setUp(self):
+        self.policy = EscalationPolicy(parse_steps('1h 1d 1w permanent'), timedelta(days=30), {'recidive': 7 * 86400}, 600)
+        self.now = timezone.now()
+    
+    def test_parse_steps(self):
+        """Test escalation ladders parse to seconds and reject junk"""
+        self.assertEqual(parse_steps('10m, 1h 2d perm'), [600, 3600, 172800, -1])
+        with self.assertRaises(ValueError):
+            parse_steps('1h soon')
+        with self.assertRaises(ValueError):
+            parse_steps('')
+    
+    def test_progressive_durations(self):
+        """Test each repeat ban climbs one step until permanent"""
+        levels = [self.policy.record_ban('192.0.2.7', 'sshd', self.now + timedelta(days=day)) for day in range(5)]
+        self.assertEqual(levels, [(0, 3600), (1, 86400), (2, 604800), (3, -1), (4, -1)])
+        row = BanEscalation.objects.get(ip_address='192.0.2.7')
+        self.assertEqual(row.ban_count, 5)
+    
+    def test_jail_bantime_is_floor(self):
+        """Test escalation never shortens a jail's own bantime"""
+        self.assertEqual(self.policy.record_ban('192.0.2.8', 'recidive', self.now), (0, 7 * 86400))
+        self.policy.enabled = False
+        self.assertEqual(self.policy.record_ban('192.0.2.9', 'sshd', self.now), (0, 600))
+    
+    def test_reset_and_duplicates(self):
+        """Test history resets after a quiet period and a ban seen twice counts once"""
+        self.policy.record_ban('192.0.2.10', 'sshd', self.now)
+        self.assertEqual(self.policy.record_ban('192.0.2.10', 'sshd', self.now + timedelta(seconds=30)), (0, 3600))
+        self.assertEqual(self.policy.record_ban('192.0.2.10', 'sshd', self.now + timedelta(days=1)), (1, 86400))
+        self.assertEqual(self.policy.record_ban('192.0.2.10', 'sshd', self.now + timedelta(days=40)), (0, 3600))
+        results = self.policy.record_bans([
+            ('192.0.2.11', 'sshd', self.now),
+            ('192.0.2.11', 'nginx', self.now + timedelta(minutes=10)),
+        ])
+        self.assertEqual(results, {'192.0.2.11': (1, 86400)})
+
+
+class ExpiryTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        for host in range(1, 6):
+            BannedIP.objects.create(
+                ip_address=f'192.0.2.{host}',
+                jail_name='sshd',
+                expires_at=self.now - timedelta(minutes=host)
+            )
+        BannedIP.objects.create(ip_address='192.0.2.99', jail_name='sshd', expires_at=self.now + timedelta(hours=1))
+        self.policy = EscalationPolicy([3600], timedelta(days=30), {'sshd': 600}, 600)
+    
+    def test_expires_due_rows_in_bounded_batches(self):
+        """Test only due rows expire, oldest first, and a tick stops at its batch limit"""
+        summary = expire_bans(self.now, batch_size=2, max_batches=2)
+        self.assertEqual(summary, {'expired': 4, 'renewed': 0, 'has_more': True})
+        self.assertTrue(BannedIP.objects.get(ip_address='192.0.2.1').is_active)
+        
+        summary = expire_bans(self.now, batch_size=2, max_batches=2)
+        self.assertEqual(summary, {'expired': 1, 'renewed': 0, 'has_more': False})
+        active = list(BannedIP.objects.filter(is_active=True).values_list('ip_address', flat=True))
+        self.assertEqual(active, ['192.0.2.99'])
+    
+    def test_live_bans_are_renewed(self):
+        """Test a due row fail2ban still has banned gets a fresh expiry"""
+        summary = expire_bans(self.now, live_bans={'sshd': {'192.0.2.3'}, 'nginx': {'192.0.2.4'}}, policy=self.policy)
+        self.assertEqual(summary['expired'], 4)
+        self.assertEqual(summary['renewed'], 1)
+        row = BannedIP.objects.get(ip_address='192.0.2.3')
+        self.assertTrue(row.is_active)
+        self.assertEqual(row.expires_at, self.now + timedelta(seconds=600))
+
+
+class IngestTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.log_path = os.path.join(directory, 'fail2ban.log')
+    
+    def write_log(self, *lines):
+        with open(self.log_path, 'a') as f:
+            f.writelines(line + '\n' for line in lines)
+    
+    def ingester(self):
+        return Fail2banLogIngester(self.log_path, config_file='/nonexistent/jail.local', enforce_escalation=False)
+    
+    def test_manual_ban_is_not_counted_again(self):
+        """Test fail2ban's log line for a ban made in the panel doesn't add a second event"""
+        now = timezone.now()
+        BannedIP.objects.create(ip_address='192.0.2.20', jail_name='sshd', banned_at=now, expires_at=now + timedelta(hours=1))
+        SecurityEvent.objects.create(event_type='ban', ip_address='192.0.2.20', jail_name='sshd', description='Manual ban', created_at=now)
+        stamp = timezone.localtime(now).strftime('%Y-%m-%d %H:%M:%S,000')
+        self.write_log(
+            f'{stamp} fail2ban.actions        [1]: NOTICE  [sshd] Ban 192.0.2.20',
+            f'{stamp} fail2ban.actions        [1]: NOTICE  [sshd] Ban 192.0.2.21',
+        )
+        self.assertEqual(self.ingester().ingest()['events'], 1)
+        self.assertEqual(SecurityEvent.objects.filter(event_type='ban', ip_address='192.0.2.20').count(), 1)
+        self.assertEqual(OffenderStats.objects.get(ip_address='192.0.2.20').ban_count, 1)
+        self.assertEqual(OffenderStats.objects.get(ip_address='192.0.2.21').ban_count, 1)
+    
+    def test_manual_ban_is_published_to_peers(self):
+        """Test a ban made in the panel still becomes a federation delta once fail2ban logs it"""
+        settings = Fail2banSettings.get_settings()
+        settings.federation_enabled = True
+        settings.save()
+        now = timezone.now()
+        BannedIP.objects.create(ip_address='192.0.2.22', jail_name='sshd', banned_at=now, expires_at=now + timedelta(hours=1))
+        stamp = timezone.localtime(now).strftime('%Y-%m-%d %H:%M:%S,000')
+        self.write_log(f'{stamp} fail2ban.actions        [1]: NOTICE  [sshd] Ban 192.0.2.22')
+        self.assertEqual(self.ingester().ingest()['events'], 0)
+        delta = BanDelta.objects.get(ip_address='192.0.2.22')
+        self.assertEqual((delta.action, delta.jail_name, delta.duration), ('ban', 'sshd', 3600))
+
+
+class RecordingManager(Fail2banManager):
+    """Fail2banManager that records commands instead of running them"""
+    def __init__(self):
+        super().__init__()
+        self.config_file = '/nonexistent/jail.local'
+        self.commands = []
+    
+    def run_command(self, command, timeout=30):
+        self.commands.append(command)
+        return {'success': True, 'stdout': '', 'stderr': '', 'returncode': 0}
+
+
+class EscalationEnforcementTestCase(TestCase):
+    def test_escalated_bans_are_enforced_in_chunks(self):
+        """Test escalated bans cost one firewall command per chunk and duration"""
+        manager = RecordingManager()
+        durations = {str(ipaddress.ip_address('10.0.0.0') + host): 86400 for host in range(600)}
+        durations.update({'198.51.100.1': 604800, '198.51.100.2': -1, '198.51.100.3': -1})
+        result = manager.extend_bans(durations)
+        self.assertEqual(result, {'success': True, 'extended': 603})
+        # Blacklist (runtime and permanent), then 2 chunks for 1d and 1 for 1w
+        self.assertEqual(len(manager.commands), 5)
+        self.assertEqual(manager.commands[0].count('--add-rich-rule'), 2)
+        self.assertNotIn('--permanent', manager.commands[0])
+        self.assertIn('--permanent', manager.commands[1])
+        self.assertEqual([command.count('--add-rich-rule') for command in manager.commands[2:]], [500, 100, 1])
+        self.assertTrue(manager.commands[2].endswith('--timeout=86400'))
+        self.assertEqual(BlacklistIP.objects.filter(is_active=True).count(), 2)
+    
+    def test_permanent_step_does_not_reload_the_firewall(self):
+        """Test escalating to permanent adds runtime and permanent rules without a reload"""
+        settings = Fail2banSettings.get_settings()
+        settings.escalation_enabled = True
+        settings.escalation_steps = 'permanent'
+        settings.save()
+        manager = RecordingManager()
+        result = manager.ban_ip('192.0.2.50')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['duration'], -1)
+        
+        self.assertFalse(any('--reload' in command for command in manager.commands))
+        rule = '--add-rich-rule="rule family=ipv4 source address=192.0.2.50 drop"'
+        self.assertIn(f'firewall-cmd {rule}', manager.commands)
+        self.assertIn(f'firewall-cmd --permanent {rule}', manager.commands)
+        self.assertTrue(BlacklistIP.objects.filter(ip_address='192.0.2.50', is_active=True).exists())
+
+
+class FederationTestCase(TestCase):
+    def setUp(self):
+        settings = Fail2banSettings.get_settings()
+        settings.federation_enabled = True
+        settings.federation_token = 'x' * 32
+        settings.save()
+        WhitelistIP.objects.create(ip_address='192.0.2.0/24')
+        self.now = timezone.now()
+        publish_deltas([
+            ('ban', '203.0.113.5', 'sshd', 3600, self.now),
+            ('ban', '203.0.113.6', 'sshd', 3600, self.now),
+            ('ban', '192.0.2.1', 'sshd', 3600, self.now),
+            ('unban', '203.0.113.6', 'sshd', 0, self.now),
+        ])
+        self.peer = FederationPeer.objects.create(name='node-b', url='https://node-b/api/federation/deltas/', token='x' * 32)
+        self.manager = RecordingManager()
+    
+    def fetch(self, peer, since, limit):
+        # Stand-in for the peer's HTTP endpoint: the same delta log
+        return get_deltas(since, limit)
+    
+    def test_deltas_are_sequenced(self):
+        """Test deltas come back in sequence order with paging"""
+        page = get_deltas(0, 3)
+        self.assertEqual([delta['ip'] for delta in page['deltas']], ['203.0.113.5', '203.0.113.6', '192.0.2.1'])
+        self.assertTrue(page['has_more'])
+        self.assertEqual(get_deltas(page['deltas'][-1]['seq'])['deltas'][0]['action'], 'unban')
+    
+    def test_pull_applies_in_bulk(self):
+        """Test a pull bans in one command, skips the whitelist and records lag"""
+        summary = pull_peer(self.peer, self.fetch, self.manager, batch_size=2)
+        self.assertEqual(summary['conflicts'], 1)
+        self.assertEqual(summary['seq_lag'], 0)
+        banip = [command for command in self.manager.commands if 'banip' in command and 'unbanip' not in command]
+        self.assertEqual(banip, ['fail2ban-client set sshd banip 203.0.113.5 203.0.113.6'])
+        row = BannedIP.objects.get(ip_address='203.0.113.5')
+        self.assertEqual(row.ban_reason, 'Federated ban from node-b')
+        # Counted in statistics and analytics like any other ban
+        self.assertEqual(SecurityEvent.objects.filter(event_type='ban', ip_address='203.0.113.5').count(), 1)
+        self.assertEqual(OffenderStats.objects.get(ip_address='203.0.113.5').ban_count, 1)
+        self.assertFalse(BannedIP.objects.filter(ip_address='192.0.2.1').exists())
+        self.peer.refresh_from_db()
+        self.assertEqual(self.peer.last_seq, self.peer.remote_seq)
+        self.assertEqual(self.peer.conflict_count, 1)
+    
+    def test_applied_bans_are_not_republished(self):
+        """Test fail2ban's log lines for an applied ban don't echo back to peers"""
+        pull_peer(self.peer, self.fetch, self.manager)
+        head = get_deltas()['head']
+        self.assertEqual(publish_deltas([('ban', '203.0.113.5', 'sshd', 3600, timezone.now())]), 0)
+        self.assertEqual(publish_deltas([('ban', '198.51.100.7', 'sshd', 3600, timezone.now())]), 1)
+        self.assertEqual(get_deltas(head)['deltas'][0]['ip'], '198.51.100.7')
+    
+    def test_permanent_federated_ban_is_blacklisted(self):
+        """Test a permanent peer ban gets a blacklist row and survives a firewalld reload"""
+        result = self.manager.ban_ips(['198.51.100.8'], 'sshd', -1, reason='Federated ban from node-b')
+        self.assertEqual(result['banned'], ['198.51.100.8'])
+        rule = '--add-rich-rule="rule family=ipv4 source address=198.51.100.8 drop"'
+        self.assertIn(f'firewall-cmd {rule}', self.manager.commands)
+        self.assertIn(f'firewall-cmd --permanent {rule}', self.manager.commands)
+        self.assertFalse(any('--reload' in command for command in self.manager.commands))
+        self.assertTrue(BlacklistIP.objects.filter(ip_address='198.51.100.8', is_active=True).exists())
+    
+    def test_unban_only_lifts_peer_bans(self):
+        """Test a peer's unban never lifts a local ban"""
+        BanDelta.objects.create(action='ban', ip_address='203.0.113.6', duration=3600, origin='')
+        pull_peer(self.peer, self.fetch, self.manager)
+        self.assertFalse(any('unbanip' in command for command in self.manager.commands))
+
+
+class ReconcileTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.policy = EscalationPolicy([3600], timedelta(days=30), {'sshd': 600, 'nginx': 600}, 600)
+        bantime = timedelta(minutes=10)
+        BannedIP.objects.create(ip_address='192.0.2.1', jail_name='sshd', expires_at=self.now + bantime)
+        BannedIP.objects.create(ip_address='192.0.2.2', jail_name='sshd', expires_at=self.now + bantime)
+        BannedIP.objects.create(ip_address='192.0.2.3', jail_name='sshd', expires_at=self.now + bantime, is_active=False)
+        # Escalated a day beyond the jail's bantime; only firewalld holds it
+        BannedIP.objects.create(
+            ip_address='192.0.2.4', jail_name='sshd', banned_at=self.now - timedelta(hours=1), expires_at=self.now + timedelta(days=1)
+        )
+        BannedIP.objects.create(ip_address='192.0.2.5', jail_name='sshd', expires_at=self.now + bantime)
+    
+    def test_diff_against_live_bans(self):
+        """Test inserts, reactivations, deactivations and jail moves from one snapshot"""
+        live = {'sshd': {'192.0.2.1', '192.0.2.3'}, 'nginx': {'192.0.2.5', '2001:db8:0::1'}}
+        summary = reconcile_bans(live, self.now, self.policy)
+        self.assertEqual(summary, {'inserted': 1, 'reactivated': 1, 'deactivated': 1, 'updated': 1, 'kept': 1})
+        
+        active = dict(BannedIP.objects.filter(is_active=True).values_list('ip_address', 'jail_name'))
+        self.assertEqual(active, {
+            '192.0.2.1': 'sshd', '192.0.2.3': 'sshd', '192.0.2.4': 'sshd', '192.0.2.5': 'nginx', '2001:db8::1': 'nginx'
+        })
+        
+        # A second pass over the same snapshot changes nothing
+        summary = reconcile_bans(live, self.now, self.policy)
+        self.assertEqual(summary, {'inserted': 0, 'reactivated': 0, 'deactivated': 0, 'updated': 0, 'kept': 1})
+    
+    def test_address_banned_in_several_jails(self):
+        """Test a row in any of the jails holding the address is left alone"""
+        live = {'nginx': {'192.0.2.1', '192.0.2.2'}, 'sshd': {'192.0.2.1', '192.0.2.5'}, 'apache': {'192.0.2.5'}}
+        summary = reconcile_bans(live, self.now, self.policy)
+        self.assertEqual(summary['updated'], 1)
+        active = dict(BannedIP.objects.filter(is_active=True).values_list('ip_address', 'jail_name'))
+        self.assertEqual((active['192.0.2.1'], active['192.0.2.2'], active['192.0.2.5']), ('sshd', 'nginx', 'sshd'))
+
+
+class FilterTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.dir, 'filter.d'))
+        files = {
+            'filter.d/common.conf': (
+                '[DEFAULT]\n'
+                '_daemon = \\S*\n'
+                '__prefix_line = \\s*(?:\\S+ )?%(_daemon)s(?:\\[\\d+\\])?:\\s+\n'
+            ),
+            'filter.d/sshd.conf': (
+                '[INCLUDES]\nbefore = common.conf\n\n'
+                '[Definition]\n'
+                '_daemon = sshd\n'
+                'mode = normal\n'
+                'mdre-normal = ^Invalid user \\S* from <HOST>\n'
+                'mdre-aggressive = ^Invalid user \\S* from <HOST>\n'
+                '                  ^Connection closed by <HOST>\n'
+                'prefregex = ^<F-MLFID>%(__prefix_line)s</F-MLFID><F-CONTENT>.+</F-CONTENT>$\n'
+                'failregex = ^Failed password for \\S+ from <HOST>\n'
+                '            <mdre-<mode>>\n'
+                'ignoreregex = from 10\\.0\\.0\\.1\n'
+            ),
+            'paths-common.conf': '[DEFAULT]\nsshd_log = %s/auth.log\n' % self.dir,
+            'jail.local': '[sshd]\nfilter = sshd[mode=aggressive]\nlogpath = %(sshd_log)s\n',
+            'auth.log': (
+                'Oct 19 10:00:01 host sshd[1]: Failed password for root from 203.0.113.5 port 22\n'
+                'Oct 19 10:00:02 host sshd[1]: Invalid user admin from 203.0.113.6\n'
+                'Oct 19 10:00:03 host sshd[1]: Failed password for root from 10.0.0.1 port 22\n'
+                'Oct 19 10:00:04 host sshd[1]: Connection closed by 203.0.113.7\n'
+                'Oct 19 10:00:05 host cron[2]: Failed password for root from 203.0.113.8\n'
+            ),
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(content)
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def test_jail_filter_on_its_log(self):
+        """Test a jail's filter, mode and logpath resolve and match like fail2ban"""
+        self.assertEqual(strip_date('Oct 19 10:00:01 host sshd[1]: x'), 'host sshd[1]: x')
+        jail = resolve_jail('sshd', os.path.join(self.dir, 'jail.local'))
+        self.assertEqual(jail['options'], {'mode': 'aggressive'})
+        
+        report = run_filter_test(
+            jail='sshd',
+            config_file=os.path.join(self.dir, 'jail.local'),
+            filter_dir=os.path.join(self.dir, 'filter.d'),
+            candidates=['^.*Failed.*from.*<HOST>.*$']
+        )
+        self.assertEqual(report['lines'], 5)
+        self.assertEqual(report['content_lines'], 4)
+        self.assertEqual([result['matches'] for result in report['jail']], [1, 1, 1])
+        self.assertEqual(report['jail'][0]['ignored'], 1)
+        self.assertEqual(report['jail'][0]['examples'][0]['host'], '203.0.113.5')
+        self.assertIn('unbounded wildcards', ' '.join(report['candidates'][0]['warnings']))
+    
+    def test_catastrophic_backtracking_is_stopped(self):
+        """Test a runaway regex is killed and reported instead of hanging"""
+        result = benchmark_regex(r'^(\w+\s?)*$', ['a' * 40 + '!'], timeout=0.5)
+        self.assertIn('catastrophic backtracking', result['error'])
+        self.assertIn('Nested quantifier', result['warnings'][0])
+    
+    def test_whole_run_has_one_time_budget(self):
+        """Test regexes left when the run's budget is spent are skipped, not each given a timeout"""
+        report = run_filter_test(
+            filter_name='sshd',
+            filter_dir=os.path.join(self.dir, 'filter.d'),
+            sample=['Oct 19 10:00:01 host sshd[1]: ' + 'a' * 40 + '!'],
+            candidates=[r'^(\w+\s?)*$', r'^(\w+\s?)*x$'],
+            timeout=5,
+            budget=0.5
+        )
+        self.assertEqual([result['error'] for result in report['jail']], [None, None])
+        self.assertIn('catastrophic backtracking', report['candidates'][0]['error'])
+        self.assertEqual(report['candidates'][1]['error'], 'Skipped: the filter test ran out of time')
+    
+    def test_child_dying_without_a_result(self):
+        """Test a matching process that exits without replying is reported, not raised"""
+        original = filtertest._measure_child
+        filtertest._measure_child = lambda connection, *args: os._exit(1)
+        try:
+            result = benchmark_regex(r'^Failed from <HOST>', ['Failed from 203.0.113.5'])
+        finally:
+            filtertest._measure_child = original
+        self.assertIn('without a result', result['error'])
+
+
+class SnapshotManager(RecordingManager):
+    """RecordingManager answering get_snapshot()'s shell script with canned output"""
+    stdout = '\n'.join([
+        '@@fail2ban-snapshot active',
+        'active',
+        '@@fail2ban-snapshot since',
+        'Mon 2026-10-19 10:00:00 UTC',
+        '@@fail2ban-snapshot jails',
+        'Status for the jail: sshd',
+        '|- Filter',
+        '|  |- Currently failed:\t3',
+        '`- Actions',
+        '   |- Currently banned:\t2',
+        '   `- Banned IP list:\t203.0.113.5 203.0.113.6',
+        '@@fail2ban-snapshot rules',
+        'rule family="ipv4" source address="198.51.100.0/24" drop',
+        'rule family="ipv4" source address="198.51.100.9" accept',
+    ])
+    
+    def run_command(self, command, timeout=30):
+        self.commands.append(command)
+        return {'success': True, 'stdout': self.stdout, 'stderr': '', 'returncode': 0}
+
+
+class DashboardTestCase(TestCase):
+    def setUp(self):
+        self.manager = SnapshotManager()
+        BannedIP.objects.create(ip_address='203.0.113.5', jail_name='sshd', expires_at=timezone.now() + timedelta(hours=1))
+        WhitelistIP.objects.create(ip_address='192.0.2.0/24', description='office')
+        BlacklistIP.objects.create(ip_address='198.51.100.0/24')
+    
+    def test_single_snapshot(self):
+        """Test the whole dashboard model comes from one fail2ban invocation"""
+        data = get_dashboard(self.manager, window='24h')
+        self.assertEqual(len(self.manager.commands), 1)
+        
+        self.assertTrue(data['status']['running'])
+        self.assertEqual(data['status']['jails'], ['sshd'])
+        self.assertEqual(data['status']['banned_ips'], 2)
+        self.assertIsNotNone(data['status']['started_at'])
+        self.assertEqual(data['jails'][0]['failed_attempts'], 3)
+        
+        banned = {entry['ip']: entry for entry in data['banned_ips']}
+        self.assertIsNotNone(banned['203.0.113.5']['expires_at'])
+        self.assertIsNone(banned['203.0.113.6']['banned_at'])
+        
+        self.assertEqual(data['blacklist']['config_ips'], ['198.51.100.0/24'])
+        self.assertEqual([entry['ip_address'] for entry in data['whitelist']['db_ips']], ['192.0.2.0/24'])
+        self.assertEqual([entry['ip_address'] for entry in data['blacklist']['db_ips']], ['198.51.100.0/24'])
+        self.assertEqual(data['statistics']['window'], '24h')
+        self.assertEqual(data['statistics']['blacklisted_ips'], 1)
+        self.assertIn('escalation_steps', data['settings'])
+    
+    def test_etag_tracks_changes(self):
+        """Test the ETag is stable while nothing changes and moves when state does"""
+        etag = dashboard_etag(get_dashboard(self.manager))
+        self.assertEqual(dashboard_etag(get_dashboard(self.manager)), etag)
+        
+        WhitelistIP.objects.create(ip_address='192.0.2.77')
+        self.assertNotEqual(dashboard_etag(get_dashboard(self.manager)), etag)
+    
+    def test_cached_until_markers_move(self):
+        """Test polls reuse the built dashboard until the database changes or the TTL passes"""
+        _dashboards.clear()
+        Fail2banSettings.get_settings()
+        now = [1000.0]
+        clock = lambda: now[0]
+        
+        data, etag = cached_dashboard(manager=self.manager, clock=clock)
+        self.assertEqual(cached_dashboard(manager=self.manager, clock=clock), (data, etag))
+        self.assertEqual(len(self.manager.commands), 1)
+        
+        WhitelistIP.objects.create(ip_address='192.0.2.77')
+        self.assertNotEqual(cached_dashboard(manager=self.manager, clock=clock)[1], etag)
+        self.assertEqual(len(self.manager.commands), 2)
+        
+        now[0] += DASHBOARD_TTL
+        cached_dashboard(manager=self.manager, clock=clock)
+        self.assertEqual(len(self.manager.commands), 3)
+        _dashboards.clear()
+    
+    def test_stopped_service(self):
+        """Test a stopped fail2ban reports no jails and no uptime"""
+        self.manager.stdout = '@@fail2ban-snapshot active\ninactive\n@@fail2ban-snapshot jails\n@@fail2ban-snapshot unavailable'
+        data = get_dashboard(self.manager)
+        self.assertFalse(data['status']['running'])
+        self.assertIsNone(data['status']['started_at'])
+        self.assertEqual(data['banned_ips'], [])
+
+
+class CommandExecutorTestCase(TestCase):
+    def test_timeout_kills_command(self):
+        """Test a command past its timeout is killed and reported"""
+        started = time.monotonic()
+        result = CommandExecutor().run('sleep 5; echo late', timeout=0.3)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['stderr'], 'Command timed out')
+        self.assertLess(time.monotonic() - started, 3)
+    
+    def test_concurrency_cap(self):
+        """Test commands beyond the cap wait for a slot, then give up"""
+        executor = CommandExecutor(max_concurrent=1, queue_timeout=0.2)
+        results = {}
+        first = threading.Thread(target=lambda: results.update(first=executor.run('sleep 1; echo done')))
+        first.start()
+        time.sleep(0.3)
+        results['second'] = executor.run('echo queued')
+        first.join()
+        self.assertEqual(results['first']['stdout'], 'done')
+        self.assertFalse(results['second']['success'])
+        self.assertIn('Too many commands', results['second']['stderr'])
+        self.assertEqual(executor.run('echo free')['stdout'], 'free')
+
+
+class CommandTaskTestCase(TestCase):
+    def test_task_lifecycle(self):
+        """Test a task records its result and repeat submissions reuse a running task"""
+        started = []
+        task = submit_task('restart_fail2ban', lambda: {'success': True}, runner=lambda *args: started.append(args))
+        self.assertEqual(task_data(task)['status'], 'pending')
+        self.assertEqual(submit_task('restart_fail2ban', lambda: {'success': True}, runner=started.append).pk, task.pk)
+        self.assertEqual(len(started), 1)
+        
+        task_id, func, args = started[0]
+        run_task(task_id, func, args)
+        data = task_data(get_task(task.pk))
+        self.assertTrue(data['finished'])
+        self.assertEqual(data['status'], 'succeeded')
+        self.assertEqual(data['result'], {'success': True})
+        self.assertNotEqual(submit_task('restart_fail2ban', func, runner=run_task).pk, task.pk)
+    
+    def test_failures(self):
+        """Test failed and raising operations and interrupted tasks end as failed"""
+        failed = submit_task('reload_jail:sshd', lambda jail: {'success': False, 'error': jail}, 'sshd', runner=run_task)
+        self.assertEqual(task_data(failed)['result'], {'success': False, 'error': 'sshd'})
+        raised = submit_task('restart_litespeed', lambda: 1 / 0, runner=run_task)
+        self.assertEqual(task_data(raised)['status'], 'failed')
+        
+        lost = CommandTask.objects.create(id='0' * 32, name='restart_fail2ban', created_at=timezone.now() - timedelta(hours=1))
+        data = task_data(get_task(lost.pk))
+        self.assertEqual(data['status'], 'failed')
+        self.assertEqual(data['result']['error'], 'Task was interrupted')
+    
+    def test_concurrent_submissions_share_one_task(self):
+        """Test a submission racing an unfinished task gets that task, and the LiteSpeed restart is detached"""
+        racing = CommandTask.objects.create(id='1' * 32, name='restart_litespeed', running_name='restart_litespeed')
+        started = []
+        self.assertEqual(submit_task('restart_litespeed', lambda: {'success': True}, runner=started.append).pk, racing.pk)
+        self.assertEqual(started, [])
+        
+        manager = RecordingManager()
+        run_task(racing.pk, manager.restart_litespeed)
+        self.assertTrue(manager.commands[0].startswith('systemd-run --on-active='))
+        racing.refresh_from_db()
+        self.assertEqual(racing.status, 'succeeded')
+        self.assertIsNone(racing.running_name)
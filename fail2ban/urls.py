@@ -20,17 +20,27 @@ urlpatterns = [
     
     # API endpoints
     re_path(r'^api/status/$', views.api_status, name='api_status'),
+    re_path(r'^api/dashboard/$', views.api_dashboard, name='api_dashboard'),
     re_path(r'^api/jails/$', views.api_jails, name='api_jails'),
     re_path(r'^api/banned-ips/$', views.api_banned_ips, name='api_banned_ips'),
+    re_path(r'^api/banned-ips/reconcile/$', views.api_reconcile_banned_ips, name='api_reconcile_banned_ips'),
     re_path(r'^api/whitelist/$', views.api_whitelist, name='api_whitelist'),
     re_path(r'^api/blacklist/$', views.api_blacklist, name='api_blacklist'),
     re_path(r'^api/ban-ip/$', views.api_ban_ip, name='api_ban_ip'),
     re_path(r'^api/unban-ip/$', views.api_unban_ip, name='api_unban_ip'),
     re_path(r'^api/restart/$', views.api_restart, name='api_restart'),
     re_path(r'^api/restart-litespeed/$', views.api_restart_litespeed, name='api_restart_litespeed'),
+    re_path(r'^api/jails/reload/$', views.api_reload_jail, name='api_reload_jail'),
+    re_path(r'^api/tasks/(?P<task_id>[0-9a-f]{32})/$', views.api_task_status, name='api_task_status'),
     re_path(r'^api/logs/$', views.api_logs, name='api_logs'),
+    re_path(r'^api/events/stream/$', views.api_events_stream, name='api_events_stream'),
     re_path(r'^api/settings/$', views.api_settings, name='api_settings'),
     re_path(r'^api/statistics/$', views.api_statistics, name='api_statistics'),
+    re_path(r'^api/analytics/$', views.api_analytics, name='api_analytics'),
+    re_path(r'^api/analytics/recommendations/$', views.api_recommendations, name='api_recommendations'),
+    re_path(r'^api/filters/test/$', views.api_filter_test, name='api_filter_test'),
+    re_path(r'^api/federation/deltas/$', views.api_federation_deltas, name='api_federation_deltas'),
+    re_path(r'^api/federation/status/$', views.api_federation_status, name='api_federation_status'),
     re_path(r'^api/toggle-plugin/$', views.api_toggle_plugin, name='api_toggle_plugin'),
     
     # Legacy unified settings (for backward compatibility)
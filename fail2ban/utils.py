@@ -1,9 +1,27 @@
-import subprocess
+import ipaddress
 import json
 import re
 import os
 from datetime import datetime, timedelta
-from .models import SecurityEvent, BannedIP
+from django.utils import timezone
+from .models import SecurityEvent, BannedIP, WhitelistIP, BlacklistIP
+from .ipindex import IPIntervalIndex, parse_network, format_network, merge_ip_entries
+from .jailconfig import JailConfig
+from .logreader import read_logs
+from .escalation import EscalationPolicy, PERMANENT_BAN
+from .executor import get_executor
+from .stats import record_events
+from .analytics import record_offenders
+
+# Addresses per fail2ban-client/firewall-cmd invocation in bulk operations
+BULK_COMMAND_CHUNK = 500
+# Section header in get_snapshot()'s combined shell output
+SNAPSHOT_MARKER = '@@fail2ban-snapshot'
+# Restarts and reloads run as background tasks, so they can take longer than a request
+SERVICE_COMMAND_TIMEOUT = 120
+# Seconds before systemd restarts lscpd, which hosts the panel and so this
+# process too: long enough for the restart task to record its result
+LSCPD_RESTART_DELAY = 2
 
 class Fail2banManager:
     """Main class for managing fail2ban operations"""
@@ -12,37 +30,15 @@ class Fail2banManager:
         self.fail2ban_cmd = 'fail2ban-client'
         self.firewall_cmd = 'firewall-cmd'
         self.config_file = '/etc/fail2ban/jail.local'
+        self._whitelist_index = None
     
     def run_command(self, command, timeout=30):
-        """Run a shell command and return the result"""
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-            return {
-                'success': result.returncode == 0,
-                'stdout': result.stdout.strip(),
-                'stderr': result.stderr.strip(),
-                'returncode': result.returncode
-            }
-        except subprocess.TimeoutExpired:
-            return {
-                'success': False,
-                'stdout': '',
-                'stderr': 'Command timed out',
-                'returncode': -1
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'stdout': '',
-                'stderr': str(e),
-                'returncode': -1
-            }
+        """Run a shell command and return the result
+        
+        Commands go through the process-wide executor, which caps how many
+        run at once and kills them on timeout.
+        """
+        return get_executor().run(command, timeout)
     
     def get_status(self):
         """Get fail2ban service status"""
@@ -91,35 +87,38 @@ class Fail2banManager:
             if not result['success']:
                 return []
             
-            jails = []
-            lines = result['stdout'].split('\n')
-            current_jail = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('Status for the jail:'):
-                    jail_name = line.split('Status for the jail:')[1].strip()
-                    current_jail = {
-                        'name': jail_name,
-                        'enabled': True,
-                        'failed_attempts': 0,
-                        'banned_ips': 0,
-                        'banned_ip_list': []
-                    }
-                    jails.append(current_jail)
-                elif current_jail and 'Currently failed:' in line:
-                    current_jail['failed_attempts'] = int(line.split(':')[1].strip())
-                elif current_jail and 'Currently banned:' in line:
-                    current_jail['banned_ips'] = int(line.split(':')[1].strip())
-                elif current_jail and 'Banned IP list:' in line:
-                    banned_ips = line.split('Banned IP list:')[1].strip()
-                    if banned_ips:
-                        current_jail['banned_ip_list'] = [ip.strip() for ip in banned_ips.split() if ip.strip()]
-            
-            return jails
+            return self._parse_jail_status(result['stdout'].split('\n'))
         except Exception as e:
             return []
     
+    def _parse_jail_status(self, lines):
+        """Parse 'fail2ban-client status <jail>' output into jail dicts"""
+        jails = []
+        current_jail = None
+        
+        for line in lines:
+            line = line.strip()
+            if line.startswith('Status for the jail:'):
+                jail_name = line.split('Status for the jail:')[1].strip()
+                current_jail = {
+                    'name': jail_name,
+                    'enabled': True,
+                    'failed_attempts': 0,
+                    'banned_ips': 0,
+                    'banned_ip_list': []
+                }
+                jails.append(current_jail)
+            elif current_jail and 'Currently failed:' in line:
+                current_jail['failed_attempts'] = int(line.split(':')[1].strip())
+            elif current_jail and 'Currently banned:' in line:
+                current_jail['banned_ips'] = int(line.split(':')[1].strip())
+            elif current_jail and 'Banned IP list:' in line:
+                banned_ips = line.split('Banned IP list:')[1].strip()
+                if banned_ips:
+                    current_jail['banned_ip_list'] = [ip.strip() for ip in banned_ips.split() if ip.strip()]
+        
+        return jails
+    
     def get_banned_ips(self):
         """Get all currently banned IPs"""
         try:
@@ -137,24 +136,95 @@ class Fail2banManager:
             return banned_ips
         except Exception as e:
             return []
-    
+
+    def get_live_bans(self):
+        """Snapshot of what fail2ban has banned right now
+
+        Returns:
+            dict: {jail: set of IPs}, or None if fail2ban couldn't be queried
+        """
+        result = self.run_command(f'{self.fail2ban_cmd} status')
+        if not result['success']:
+            return None
+
+        jails = []
+        for line in result['stdout'].split('\n'):
+            if 'Jail list:' in line:
+                jails = [jail.strip() for jail in line.split('Jail list:')[1].split(',') if jail.strip()]
+
+        live = {}
+        for jail in jails:
+            result = self.run_command(f'{self.fail2ban_cmd} status {jail}')
+            if not result['success']:
+                return None
+            live[jail] = set()
+            for line in result['stdout'].split('\n'):
+                if 'Banned IP list:' in line:
+                    live[jail].update(line.split('Banned IP list:')[1].split())
+        return live
+
+    def get_snapshot(self):
+        """Service state, every jail's status and the firewall drop rules from one shell invocation
+
+        Returns:
+            dict: running, started_at (epoch seconds or None), jails as
+            returned by get_jails() and blacklist as returned by get_blacklist()
+        """
+        script = (
+            f'echo "{SNAPSHOT_MARKER} active"; systemctl is-active fail2ban; '
+            f'echo "{SNAPSHOT_MARKER} since"; systemctl show fail2ban --property=ActiveEnterTimestamp --value; '
+            f'echo "{SNAPSHOT_MARKER} jails"; '
+            f'if list=$({self.fail2ban_cmd} status 2>/dev/null); then '
+            f'for jail in $(printf "%s\\n" "$list" | sed -n "s/.*Jail list://p" | tr "," " "); do '
+            f'{self.fail2ban_cmd} status "$jail"; done; '
+            f'else echo "{SNAPSHOT_MARKER} unavailable"; fi; '
+            f'echo "{SNAPSHOT_MARKER} rules"; {self.firewall_cmd} --list-rich-rules'
+        )
+        result = self.run_command(script)
+        
+        sections = {}
+        name = None
+        for line in result['stdout'].split('\n'):
+            if line.startswith(SNAPSHOT_MARKER):
+                name = line[len(SNAPSHOT_MARKER):].strip()
+                sections[name] = []
+            elif name:
+                sections[name].append(line)
+        
+        active = [line.strip() for line in sections.get('active', [])] == ['active']
+        started_at = None
+        match = re.search(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', ' '.join(sections.get('since', [])))
+        if active and match:
+            started_at = datetime.strptime(match.group(0), '%Y-%m-%d %H:%M:%S').timestamp()
+        
+        blacklist = []
+        for line in sections.get('rules', []):
+            ip_match = re.search(r'source address="([^"]+)"', line)
+            if ip_match and 'drop' in line:
+                blacklist.append(ip_match.group(1))
+        
+        return {
+            'running': active and 'unavailable' not in sections,
+            'started_at': started_at,
+            'jails': self._parse_jail_status(sections.get('jails', [])),
+            'blacklist': blacklist,
+        }
+
     def get_whitelist(self):
         """Get whitelisted IPs from configuration"""
         try:
             if not os.path.exists(self.config_file):
                 return []
             
-            with open(self.config_file, 'r') as f:
-                content = f.read()
+            # Collect ignoreip from DEFAULT and every jail overriding it
+            config = JailConfig(self.config_file)
+            ips = []
+            for section in config.ignoreip_sections():
+                for ip in config.get_list(section, 'ignoreip'):
+                    if ip not in ips:
+                        ips.append(ip)
             
-            # Find ignoreip line
-            ignoreip_match = re.search(r'ignoreip\s*=\s*(.+)', content)
-            if ignoreip_match:
-                ignoreip_line = ignoreip_match.group(1).strip()
-                ips = [ip.strip() for ip in ignoreip_line.split() if ip.strip()]
-                return ips
-            
-            return []
+            return ips
         except Exception as e:
             return []
     
@@ -181,120 +251,176 @@ class Fail2banManager:
         except Exception as e:
             return []
     
+    def get_whitelist_index(self):
+        """Get an interval index over the config and database whitelists"""
+        if self._whitelist_index is None:
+            entries = list(self.get_whitelist())
+            entries.extend(WhitelistIP.objects.filter(is_active=True).values_list('ip_address', flat=True))
+            self._whitelist_index = IPIntervalIndex(entries)
+        return self._whitelist_index
+    
+    def is_whitelisted(self, ip):
+        """Check whether an IP or range is covered by the whitelist"""
+        return ip in self.get_whitelist_index()
+    
     def add_to_whitelist(self, ip):
-        """Add IP to whitelist"""
+        """Add IP or CIDR range to whitelist"""
         try:
-            # Validate IP format
-            if not self.is_valid_ip(ip):
-                return {'success': False, 'error': 'Invalid IP address format'}
+            # Validate IP/network format
+            network = parse_network(ip)
+            if network is None:
+                return {'success': False, 'error': 'Invalid IP address or CIDR range'}
+            ip = format_network(network)
             
-            # Read current config
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    content = f.read()
-            else:
+            if not os.path.exists(self.config_file):
                 return {'success': False, 'error': 'Configuration file not found'}
             
-            # Check if IP is already whitelisted
-            if ip in content:
-                return {'success': True, 'message': 'IP already whitelisted'}
+            # Add IP to every effective ignoreip that doesn't cover it yet,
+            # collapsing overlapping ranges
+            config = JailConfig(self.config_file)
+            changed = []
+            for section in config.ignoreip_sections():
+                entries = config.get_list(section, 'ignoreip')
+                if IPIntervalIndex(entries).lookup(network) is None:
+                    config.set_list(section, 'ignoreip', merge_ip_entries(entries + [network]))
+                    changed.append(section)
             
-            # Add IP to ignoreip line
-            new_content = re.sub(
-                r'(ignoreip\s*=\s*[^\n]+)',
-                r'\1 ' + ip,
-                content
-            )
+            if not changed:
+                return {'success': True, 'message': f'IP {ip} already whitelisted'}
             
-            # Write back to file
-            with open(self.config_file, 'w') as f:
-                f.write(new_content)
+            config.save()
+            self._whitelist_index = None
             
-            # Restart fail2ban to apply changes
-            self.restart_service()
+            # Apply to running jails without dropping existing bans
+            self.apply_ignoreip('addignoreip', [ip])
             
             return {'success': True, 'message': f'IP {ip} added to whitelist'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def remove_from_whitelist(self, ip):
-        """Remove IP from whitelist"""
+        """Remove IP or CIDR range from whitelist"""
         try:
+            network = parse_network(ip)
+            if network is None:
+                return {'success': False, 'error': 'Invalid IP address or CIDR range'}
+            ip = format_network(network)
+            
             if not os.path.exists(self.config_file):
                 return {'success': False, 'error': 'Configuration file not found'}
             
-            with open(self.config_file, 'r') as f:
-                content = f.read()
-            
-            # Remove IP from ignoreip line
-            new_content = re.sub(
-                r'\s+' + re.escape(ip) + r'(?=\s|$)',
-                '',
-                content
-            )
-            
-            # Write back to file
-            with open(self.config_file, 'w') as f:
-                f.write(new_content)
-            
-            # Restart fail2ban to apply changes
-            self.restart_service()
+            # Entries inside the removed range go with it; a broader range
+            # covering the IP has to be removed explicitly
+            config = JailConfig(self.config_file)
+            removed = []
+            covering = None
+            for section in config.ignoreip_sections():
+                entries = config.get_list(section, 'ignoreip')
+                kept = []
+                for entry in entries:
+                    entry_network = parse_network(entry)
+                    if entry_network is not None and entry_network.version == network.version and entry_network.subnet_of(network):
+                        if entry not in removed:
+                            removed.append(entry)
+                    else:
+                        kept.append(entry)
+                if len(kept) != len(entries):
+                    config.set_list(section, 'ignoreip', kept)
+                elif covering is None:
+                    covering = IPIntervalIndex(entries).lookup(network)
+            
+            if not removed:
+                if covering is not None:
+                    return {'success': False, 'error': f'IP {ip} is whitelisted by range {format_network(covering)}; remove that range instead'}
+                return {'success': True, 'message': f'IP {ip} is not whitelisted'}
+            
+            config.save()
+            self._whitelist_index = None
+            
+            # Apply to running jails without dropping existing bans
+            self.apply_ignoreip('delignoreip', removed)
             
             return {'success': True, 'message': f'IP {ip} removed from whitelist'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def apply_ignoreip(self, action, ips):
+        """Apply ignoreip changes to running jails, reloading a jail if the live update fails"""
+        results = {}
+        for jail in self.get_status().get('jails', []):
+            success = True
+            for ip in ips:
+                result = self.run_command(f'{self.fail2ban_cmd} set {jail} {action} {ip}')
+                if not result['success']:
+                    success = False
+                    break
+            if not success:
+                success = self.reload_jail(jail).get('success', False)
+            results[jail] = success
+        return results
+    
     def add_to_blacklist(self, ip):
-        """Add IP to blacklist (permanent ban)"""
+        """Add IP or CIDR range to blacklist (permanent ban)"""
         try:
-            if not self.is_valid_ip(ip):
-                return {'success': False, 'error': 'Invalid IP address format'}
-            
-            # Add firewall rule
-            cmd = f'{self.firewall_cmd} --permanent --add-rich-rule="rule family=ipv4 source address={ip} drop"'
-            result = self.run_command(cmd)
-            
-            if not result['success']:
-                return {'success': False, 'error': 'Failed to add firewall rule'}
+            network = parse_network(ip)
+            if network is None:
+                return {'success': False, 'error': 'Invalid IP address or CIDR range'}
+            ip = format_network(network)
             
-            # Reload firewall
-            reload_cmd = f'{self.firewall_cmd} --reload'
-            reload_result = self.run_command(reload_cmd)
-            
-            if not reload_result['success']:
-                return {'success': False, 'error': 'Failed to reload firewall'}
+            # Add the rule at runtime and permanently; a reload would drop
+            # every other runtime rule (escalated holds, fail2ban's bans)
+            error = self._drop_rules('--add-rich-rule', [ip])
+            if error is not None:
+                return {'success': False, 'error': f'Failed to add firewall rule: {error}'}
             
             return {'success': True, 'message': f'IP {ip} added to blacklist'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def remove_from_blacklist(self, ip):
-        """Remove IP from blacklist"""
+        """Remove IP or CIDR range from blacklist"""
         try:
-            # Remove firewall rule
-            cmd = f'{self.firewall_cmd} --permanent --remove-rich-rule="rule family=ipv4 source address={ip} drop"'
-            result = self.run_command(cmd)
-            
-            if not result['success']:
-                return {'success': False, 'error': 'Failed to remove firewall rule'}
+            network = parse_network(ip)
+            if network is None:
+                return {'success': False, 'error': 'Invalid IP address or CIDR range'}
+            ip = format_network(network)
             
-            # Reload firewall
-            reload_cmd = f'{self.firewall_cmd} --reload'
-            reload_result = self.run_command(reload_cmd)
-            
-            if not reload_result['success']:
-                return {'success': False, 'error': 'Failed to reload firewall'}
+            # Remove the rule at runtime and permanently, without a reload
+            error = self._drop_rules('--remove-rich-rule', [ip])
+            if error is not None:
+                return {'success': False, 'error': f'Failed to remove firewall rule: {error}'}
             
             return {'success': True, 'message': f'IP {ip} removed from blacklist'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def ban_ip(self, ip, jail='sshd'):
-        """Ban an IP address"""
+    def ban_ip(self, ip, jail='sshd', escalate=True):
+        """Ban an IP address
+        
+        With escalate, repeat offenders get progressively longer bans
+        (see EscalationPolicy); the last step blacklists them permanently.
+        """
         try:
             if not self.is_valid_ip(ip):
                 return {'success': False, 'error': 'Invalid IP address format'}
             
+            # Never ban whitelisted addresses
+            if self.is_whitelisted(ip):
+                return {'success': False, 'error': f'IP {ip} is whitelisted and cannot be banned'}
+            
+            policy = EscalationPolicy.from_settings(self.config_file)
+            now = timezone.now()
+            level, duration = 0, policy.bantime(jail)
+            if escalate:
+                level, duration = policy.record_ban(ip, jail, now)
+            
+            if duration < 0 and policy.bantime(jail) >= 0:
+                result = self.extend_ban(ip, duration)
+                if not result['success']:
+                    return result
+                self._record_banned_ip(ip, jail, now, duration, level)
+                return {'success': True, 'message': f'IP {ip} blacklisted permanently after repeated bans', 'level': level, 'duration': duration}
+            
             # Ban IP using fail2ban
             cmd = f'{self.fail2ban_cmd} set {jail} banip {ip}'
             result = self.run_command(cmd)
@@ -302,10 +428,90 @@ class Fail2banManager:
             if not result['success']:
                 return {'success': False, 'error': f'Failed to ban IP: {result["stderr"]}'}
             
-            return {'success': True, 'message': f'IP {ip} banned from {jail}'}
+            # fail2ban lifts the ban after the jail's bantime; hold it for the rest
+            if duration > policy.bantime(jail) >= 0:
+                extended = self.extend_ban(ip, duration)
+                if not extended['success']:
+                    return extended
+            
+            self._record_banned_ip(ip, jail, now, duration, level)
+            return {'success': True, 'message': f'IP {ip} banned from {jail}', 'level': level, 'duration': duration}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def extend_ban(self, ip, duration):
+        """Enforce a ban longer than fail2ban's own bantime
+        
+        Permanent bans are added to the blacklist. Others become a firewalld
+        runtime rule with a timeout, which firewalld drops by itself.
+        """
+        try:
+            network = parse_network(ip)
+            if network is None:
+                return {'success': False, 'error': 'Invalid IP address format'}
+            ip = format_network(network)
+            
+            if duration < 0:
+                return self._blacklist([ip], 'Repeat offender (ban escalation)')
+            
+            cmd = f'{self.firewall_cmd} --add-rich-rule="rule family=ipv{network.version} source address={ip} drop" --timeout={int(duration)}'
+            result = self.run_command(cmd)
+            
+            if not result['success'] and 'ALREADY_ENABLED' not in result['stderr']:
+                return {'success': False, 'error': f'Failed to extend ban: {result["stderr"]}'}
+            
+            return {'success': True, 'message': f'IP {ip} held for {int(duration)} seconds'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def extend_bans(self, durations):
+        """Enforce many escalated bans with one command per chunk and duration
+        
+        Like extend_ban(): permanent bans are blacklisted, the others become
+        firewalld runtime rules with a timeout.
+        
+        Args:
+            durations: dict of IP -> ban duration in seconds (-1 for permanent)
+        
+        Returns:
+            dict: success, extended (number of addresses)
+        """
+        try:
+            by_duration = {}
+            for ip, duration in durations.items():
+                network = parse_network(ip)
+                if network is not None:
+                    by_duration.setdefault(int(duration) if duration >= 0 else -1, []).append(format_network(network))
+            
+            permanent = by_duration.pop(-1, [])
+            if permanent:
+                result = self._blacklist(permanent, 'Repeat offender (ban escalation)')
+                if not result['success']:
+                    return result
+            
+            for duration, ips in by_duration.items():
+                for chunk in self._chunks(ips):
+                    result = self.run_command(f'{self.firewall_cmd} {self._rich_rules("--add-rich-rule", chunk)} --timeout={duration}')
+                    if not result['success'] and 'ALREADY_ENABLED' not in result['stderr']:
+                        return {'success': False, 'error': f'Failed to extend bans: {result["stderr"]}'}
+            
+            return {'success': True, 'extended': len(permanent) + sum(len(ips) for ips in by_duration.values())}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def _record_banned_ip(self, ip, jail, banned_at, duration, level):
+        expires_at = banned_at + (PERMANENT_BAN if duration < 0 else timedelta(seconds=duration))
+        BannedIP.objects.update_or_create(
+            ip_address=ip,
+            defaults={
+                'jail_name': jail,
+                'ban_reason': f'Banned from {jail}' + (f' (repeat offence, level {level})' if level else ''),
+                'banned_at': banned_at,
+                'expires_at': expires_at,
+                'is_active': True
+            }
+        )
+    
     def unban_ip(self, ip, jail='sshd'):
         """Unban an IP address"""
         try:
@@ -319,15 +525,159 @@ class Fail2banManager:
             if not result['success']:
                 return {'success': False, 'error': f'Failed to unban IP: {result["stderr"]}'}
             
+            # Drop an escalated hold, if any
+            network = parse_network(ip)
+            self.run_command(f'{self.firewall_cmd} --remove-rich-rule="rule family=ipv{network.version} source address={format_network(network)} drop"')
+            BannedIP.objects.filter(ip_address=ip).update(is_active=False)
+            
             return {'success': True, 'message': f'IP {ip} unbanned from {jail}'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
-    
+
+    def ban_ips(self, ips, jail='sshd', duration=None, reason=None):
+        """Ban many addresses in one jail with a command per chunk
+
+        Invalid and whitelisted addresses are skipped. A duration longer
+        than the jail's bantime is held by firewalld runtime rules, added in
+        the same chunks; -1 blacklists the addresses, as the last escalation
+        step does. BannedIP rows are written in bulk.
+
+        Returns:
+            dict: success, banned (list of IPs) and skipped (whitelisted or invalid)
+        """
+        try:
+            whitelist = self.get_whitelist_index()
+            banned, skipped = [], []
+            for ip in dict.fromkeys(ips):
+                if self.is_valid_ip(ip) and ip not in whitelist:
+                    banned.append(str(ipaddress.ip_address(ip)))
+                else:
+                    skipped.append(ip)
+            if not banned:
+                return {'success': True, 'banned': [], 'skipped': skipped}
+
+            bantime = EscalationPolicy.from_settings(self.config_file).bantime(jail)
+            if duration is None:
+                duration = bantime
+
+            for chunk in self._chunks(banned):
+                result = self.run_command(f'{self.fail2ban_cmd} set {jail} banip {" ".join(chunk)}')
+                if not result['success']:
+                    return {'success': False, 'error': f'Failed to ban IPs: {result["stderr"]}'}
+
+                if duration > bantime >= 0:
+                    result = self.run_command(f'{self.firewall_cmd} {self._rich_rules("--add-rich-rule", chunk)} --timeout={int(duration)}')
+                    if not result['success'] and 'ALREADY_ENABLED' not in result['stderr']:
+                        return {'success': False, 'error': f'Failed to extend bans: {result["stderr"]}'}
+
+            if duration < 0:
+                result = self._blacklist(banned, reason or f'Permanent ban from {jail}')
+                if not result['success']:
+                    return result
+
+            now = timezone.now()
+            expires_at = now + (PERMANENT_BAN if duration < 0 else timedelta(seconds=duration))
+            existing = BannedIP.objects.in_bulk(banned, field_name='ip_address')
+            to_create = []
+            for ip in banned:
+                row = existing.get(ip)
+                if row is None:
+                    row = BannedIP(ip_address=ip)
+                    to_create.append(row)
+                row.jail_name = jail
+                row.ban_reason = reason or f'Banned from {jail}'
+                row.banned_at = now
+                row.expires_at = expires_at
+                row.is_active = True
+            BannedIP.objects.bulk_create(to_create, batch_size=1000)
+            BannedIP.objects.bulk_update(
+                list(existing.values()),
+                ['jail_name', 'ban_reason', 'banned_at', 'expires_at', 'is_active'],
+                batch_size=1000
+            )
+            # The ingester drops fail2ban's log lines for these bans as
+            # already recorded, so the events are written here
+            SecurityEvent.objects.bulk_create([
+                SecurityEvent(
+                    event_type='ban',
+                    ip_address=ip,
+                    jail_name=jail,
+                    description=reason or f'IP {ip} banned from {jail}',
+                    severity='medium',
+                    created_at=now
+                )
+                for ip in banned
+            ], batch_size=1000)
+            # bulk_create skips post_save, so update the rollup and offender counters here
+            record_events((now, 'ban') for _ in banned)
+            record_offenders((ip, 'ban', jail, now) for ip in banned)
+
+            return {'success': True, 'banned': banned, 'skipped': skipped}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def unban_ips(self, ips, jail='sshd'):
+        """Unban many addresses from one jail with a command per chunk"""
+        try:
+            ips = [str(ipaddress.ip_address(ip)) for ip in dict.fromkeys(ips) if self.is_valid_ip(ip)]
+            for chunk in self._chunks(ips):
+                result = self.run_command(f'{self.fail2ban_cmd} set {jail} unbanip {" ".join(chunk)}')
+                if not result['success'] and 'is not banned' not in result['stderr']:
+                    return {'success': False, 'error': f'Failed to unban IPs: {result["stderr"]}'}
+                self.run_command(f'{self.firewall_cmd} {self._rich_rules("--remove-rich-rule", chunk)}')
+            BannedIP.objects.filter(ip_address__in=ips).update(is_active=False)
+            return {'success': True, 'unbanned': ips}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def _blacklist(self, ips, description):
+        """Blacklist normalized addresses: BlacklistIP rows plus runtime and permanent drop rules"""
+        existing = BlacklistIP.objects.in_bulk(ips, field_name='ip_address')
+        for row in existing.values():
+            row.description = description
+            row.is_active = True
+        BlacklistIP.objects.bulk_update(list(existing.values()), ['description', 'is_active'], batch_size=1000)
+        BlacklistIP.objects.bulk_create([
+            BlacklistIP(ip_address=ip, description=description, is_active=True)
+            for ip in ips if ip not in existing
+        ], batch_size=1000)
+        error = self._drop_rules('--add-rich-rule', ips)
+        if error is not None:
+            return {'success': False, 'error': f'Failed to blacklist IPs: {error}'}
+        return {'success': True, 'message': f'{len(ips)} address(es) blacklisted'}
+
+    def _drop_rules(self, option, ips):
+        """Add or remove drop rules both at runtime and permanently, a chunk at a time
+
+        Never reloads firewalld: a reload throws away every runtime rule,
+        the escalated holds and fail2ban's own bans included.
+
+        Returns:
+            str: stderr of the first command that failed, or None
+        """
+        tolerated = 'ALREADY_ENABLED' if option == '--add-rich-rule' else 'NOT_ENABLED'
+        for chunk in self._chunks(ips):
+            for scope in ('', '--permanent '):
+                result = self.run_command(f'{self.firewall_cmd} {scope}{self._rich_rules(option, chunk)}')
+                if not result['success'] and tolerated not in result['stderr']:
+                    return result['stderr'] or 'firewall-cmd failed'
+        return None
+
+    def _chunks(self, items, size=BULK_COMMAND_CHUNK):
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    def _rich_rules(self, option, ips):
+        return ' '.join(
+            f'{option}="rule family=ipv{ipaddress.ip_network(ip, strict=False).version} source address={ip} drop"'
+            for ip in ips
+        )
+
     def restart_service(self):
         """Restart fail2ban service"""
         try:
             cmd = 'systemctl restart fail2ban'
-            result = self.run_command(cmd)
+            result = self.run_command(cmd, timeout=SERVICE_COMMAND_TIMEOUT)
             
             if not result['success']:
                 return {'success': False, 'error': f'Failed to restart service: {result["stderr"]}'}
@@ -336,23 +686,46 @@ class Fail2banManager:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_logs(self, lines=100):
-        """Get fail2ban logs"""
+    def restart_litespeed(self):
+        """Restart the LiteSpeed panel service (lscpd)
+
+        lscpd runs the panel, so restarting it in place would kill the
+        restart task halfway. The restart is handed to a transient systemd
+        timer instead, outside lscpd's cgroup, and succeeds once scheduled.
+        """
         try:
-            cmd = f'journalctl -u fail2ban -n {lines} --no-pager'
-            result = self.run_command(cmd)
+            result = self.run_command(
+                f'systemd-run --on-active={LSCPD_RESTART_DELAY} --timer-property=AccuracySec=100ms '
+                f'systemctl restart lscpd'
+            )
             
             if not result['success']:
-                return []
+                return {'success': False, 'error': result['stderr'] or 'Failed to restart LiteSpeed'}
             
-            logs = []
-            for line in result['stdout'].split('\n'):
-                if line.strip():
-                    logs.append(line.strip())
+            return {'success': True, 'message': 'LiteSpeed restart scheduled'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def reload_jail(self, jail):
+        """Reload a single jail, keeping the others and their bans untouched"""
+        try:
+            cmd = f'{self.fail2ban_cmd} reload {jail}'
+            result = self.run_command(cmd, timeout=SERVICE_COMMAND_TIMEOUT)
+            
+            if not result['success']:
+                return {'success': False, 'error': f'Failed to reload jail {jail}: {result["stderr"]}'}
             
-            return logs
+            return {'success': True, 'message': f'Jail {jail} reloaded successfully'}
         except Exception as e:
-            return []
+            return {'success': False, 'error': str(e)}
+    
+    def get_logs(self, lines=100, cursor=None, jail=None, ip=None, level=None, source='auto'):
+        """Get parsed fail2ban log entries newer than cursor
+        
+        Reads /var/log/fail2ban.log by byte offset, or the systemd journal
+        by journal cursor when the log file doesn't exist.
+        """
+        return read_logs(cursor=cursor, limit=lines, jail=jail, ip=ip, level=level, source=source)
     
     def is_valid_ip(self, ip):
         """Validate IP address format"""
@@ -363,6 +736,10 @@ class Fail2banManager:
         except ValueError:
             return False
     
+    def is_valid_network(self, value):
+        """Validate IP address or CIDR range format"""
+        return parse_network(value) is not None
+    
     def start_service(self):
         """Start fail2ban service"""
         try:
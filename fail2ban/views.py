@@ -1,11 +1,14 @@
+import hashlib
 import json
+import re
 import subprocess
 import os
 from datetime import datetime, timedelta
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from functools import wraps
 from plogical.mailUtilities import mailUtilities
 from plogical.httpProc import httpProc
@@ -13,6 +16,17 @@ from plogical.acl import ACLManager
 from plogical.CyberCPLogFileWriter import CyberCPLogFileWriter as logging
 from .models import Fail2banSettings, SecurityEvent, BannedIP, WhitelistIP, BlacklistIP
 from .utils import Fail2banManager
+from .ipindex import parse_network, format_network
+from .stats import get_statistics, DEFAULT_WINDOW, WINDOWS as STATISTICS_WINDOWS
+from .logreader import DEFAULT_LIMIT as DEFAULT_LOG_LIMIT
+from .live import get_broadcaster, STREAM_RETRY_AFTER
+from .analytics import get_analytics, get_recommendations, ESCALATION_WINDOW, RANGE_BAN_MIN_HOSTS, REPEAT_OFFENDER_MIN_BANS, TOP_LIMIT
+from .escalation import parse_steps
+from .reconcile import run_reconcile
+from .filtertest import run_filter_test, SAMPLE_LINES as FILTER_SAMPLE_LINES
+from .dashboard import cached_dashboard, settings_data
+from .tasks import submit_task, get_task, task_data
+from .federation import check_token, get_deltas, federation_status, PULL_BATCH_SIZE
 
 
 def cyberpanel_login_required(view_func):
@@ -207,6 +221,38 @@ def api_status(request):
         }, status=500)
 
 
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def api_dashboard(request):
+    """Get status, jails, bans, whitelist, blacklist, statistics and settings in one response"""
+    try:
+        window = request.GET.get('window', DEFAULT_WINDOW)
+        if window not in STATISTICS_WINDOWS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid window, expected one of: {", ".join(STATISTICS_WINDOWS)}'
+            }, status=400)
+        
+        data, etag = cached_dashboard(window=window)
+        
+        # Unchanged since the client's last poll: 304 with no body
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse({
+                'success': True,
+                'data': data
+            })
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    except Exception as e:
+        logging.writeToFile(f"api_dashboard error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
 @cyberpanel_login_required
 @require_http_methods(["GET"])
 def api_jails(request):
@@ -245,6 +291,52 @@ def api_banned_ips(request):
         }, status=500)
 
 
+@cyberpanel_login_required
+@require_http_methods(["POST"])
+def api_reconcile_banned_ips(request):
+    """Sync the banned IP table with fail2ban's live ban lists"""
+    try:
+        summary = run_reconcile()
+        if summary is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Could not read ban lists from fail2ban'
+            }, status=503)
+        return JsonResponse({
+            'success': True,
+            'data': summary
+        })
+    except Exception as e:
+        logging.writeToFile(f"api_reconcile_banned_ips error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+def _requested_network(data):
+    """
+    The IP or CIDR range in a whitelist/blacklist request, normalized
+    
+    Returns:
+        tuple: (network string, None), or (None, 400 JsonResponse) when it's missing or invalid
+    """
+    ip = data.get('ip')
+    if not ip:
+        return None, JsonResponse({
+            'success': False,
+            'error': 'IP address is required'
+        }, status=400)
+    
+    network = parse_network(ip)
+    if network is None:
+        return None, JsonResponse({
+            'success': False,
+            'error': 'Invalid IP address or CIDR range'
+        }, status=400)
+    return format_network(network), None
+
+
 @cyberpanel_login_required
 @require_http_methods(["GET", "POST", "DELETE"])
 def api_whitelist(request):
@@ -266,15 +358,11 @@ def api_whitelist(request):
         
         elif request.method == 'POST':
             data = json.loads(request.body)
-            ip = data.get('ip')
+            ip, error = _requested_network(data)
+            if error:
+                return error
             description = data.get('description', '')
             
-            if not ip:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'IP address is required'
-                }, status=400)
-            
             # Add to database
             whitelist_ip, created = WhitelistIP.objects.get_or_create(
                 ip_address=ip,
@@ -300,13 +388,9 @@ def api_whitelist(request):
         
         elif request.method == 'DELETE':
             data = json.loads(request.body)
-            ip = data.get('ip')
-            
-            if not ip:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'IP address is required'
-                }, status=400)
+            ip, error = _requested_network(data)
+            if error:
+                return error
             
             # Remove from database
             WhitelistIP.objects.filter(ip_address=ip).update(is_active=False)
@@ -344,15 +428,11 @@ def api_blacklist(request):
         
         elif request.method == 'POST':
             data = json.loads(request.body)
-            ip = data.get('ip')
+            ip, error = _requested_network(data)
+            if error:
+                return error
             description = data.get('description', '')
             
-            if not ip:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'IP address is required'
-                }, status=400)
-            
             # Add to database
             blacklist_ip, created = BlacklistIP.objects.get_or_create(
                 ip_address=ip,
@@ -378,13 +458,9 @@ def api_blacklist(request):
         
         elif request.method == 'DELETE':
             data = json.loads(request.body)
-            ip = data.get('ip')
-            
-            if not ip:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'IP address is required'
-                }, status=400)
+            ip, error = _requested_network(data)
+            if error:
+                return error
             
             # Remove from database
             BlacklistIP.objects.filter(ip_address=ip).update(is_active=False)
@@ -420,11 +496,18 @@ def api_ban_ip(request):
         result = manager.ban_ip(ip, jail)
         
         if result.get('success'):
+            duration = result.get('duration')
+            if duration is not None and duration < 0:
+                description = f'IP {ip} banned from {jail} permanently'
+            elif duration:
+                description = f'IP {ip} banned from {jail} for {duration} seconds'
+            else:
+                description = f'IP {ip} banned from {jail}'
             SecurityEvent.objects.create(
                 event_type='ban',
                 ip_address=ip,
                 jail_name=jail,
-                description=f'IP {ip} banned from {jail}',
+                description=description,
                 severity='medium'
             )
         
@@ -473,22 +556,27 @@ def api_unban_ip(request):
         }, status=500)
 
 
+def _restart_fail2ban():
+    result = Fail2banManager().restart_service()
+    if result.get('success'):
+        SecurityEvent.objects.create(
+            event_type='plugin_toggle',
+            description='Fail2ban service restarted',
+            severity='low'
+        )
+    return result
+
+
 @cyberpanel_login_required
 @require_http_methods(["POST"])
 def api_restart(request):
-    """Restart fail2ban service"""
+    """Restart fail2ban service in the background"""
     try:
-        manager = Fail2banManager()
-        result = manager.restart_service()
-        
-        if result.get('success'):
-            SecurityEvent.objects.create(
-                event_type='plugin_toggle',
-                description='Fail2ban service restarted',
-                severity='low'
-            )
-        
-        return JsonResponse(result)
+        task = submit_task('restart_fail2ban', _restart_fail2ban)
+        return JsonResponse({
+            'success': True,
+            'data': task_data(task)
+        }, status=202)
     except Exception as e:
         logging.writeToFile(f"api_restart error: {str(e)}")
         return JsonResponse({
@@ -500,27 +588,65 @@ def api_restart(request):
 @cyberpanel_login_required
 @require_http_methods(["POST"])
 def api_restart_litespeed(request):
-    """Restart LiteSpeed service"""
+    """Restart LiteSpeed service in the background"""
     try:
-        result = subprocess.run(
-            ['systemctl', 'restart', 'lscpd'],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
+        task = submit_task('restart_litespeed', Fail2banManager().restart_litespeed)
+        return JsonResponse({
+            'success': True,
+            'data': task_data(task)
+        }, status=202)
+    except Exception as e:
+        logging.writeToFile(f"api_restart_litespeed error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@cyberpanel_login_required
+@require_http_methods(["POST"])
+def api_reload_jail(request):
+    """Reload a single jail in the background"""
+    try:
+        data = json.loads(request.body)
+        jail = str(data.get('jail') or '')
         
-        if result.returncode == 0:
+        if not re.match(r'^[\w.\-]+$', jail):
             return JsonResponse({
-                'success': True,
-                'message': 'LiteSpeed service restarted successfully'
-            })
-        else:
+                'success': False,
+                'error': 'A valid jail name is required'
+            }, status=400)
+        
+        task = submit_task(f'reload_jail:{jail}', Fail2banManager().reload_jail, jail)
+        return JsonResponse({
+            'success': True,
+            'data': task_data(task)
+        }, status=202)
+    except Exception as e:
+        logging.writeToFile(f"api_reload_jail error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def api_task_status(request, task_id):
+    """Get the status and result of a background task"""
+    try:
+        task = get_task(task_id)
+        if task is None:
             return JsonResponse({
                 'success': False,
-                'error': result.stderr or 'Failed to restart LiteSpeed'
-            }, status=500)
+                'error': 'Task not found'
+            }, status=404)
+        return JsonResponse({
+            'success': True,
+            'data': task_data(task)
+        })
     except Exception as e:
-        logging.writeToFile(f"api_restart_litespeed error: {str(e)}")
+        logging.writeToFile(f"api_task_status error: {str(e)}")
         return JsonResponse({
             'success': False,
             'error': str(e)
@@ -530,24 +656,42 @@ def api_restart_litespeed(request):
 @cyberpanel_login_required
 @require_http_methods(["GET"])
 def api_logs(request):
-    """Get fail2ban logs"""
+    """Get fail2ban logs newer than the client's cursor"""
     try:
-        limit = int(request.GET.get('limit', 100))
+        try:
+            limit = int(request.GET.get('limit', DEFAULT_LOG_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LOG_LIMIT
+        source = request.GET.get('source', 'auto')
+        if source not in ('auto', 'file', 'journal'):
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid log source'
+            }, status=400)
+        
         manager = Fail2banManager()
-        logs = manager.get_logs(limit)
-        
-        # Format logs
-        formatted_logs = []
-        for log in logs:
-            formatted_logs.append({
-                'timestamp': datetime.now().isoformat(),
-                'message': log,
-                'level': 'info'
-            })
+        try:
+            result = manager.get_logs(
+                limit,
+                cursor=request.GET.get('cursor') or None,
+                jail=request.GET.get('jail') or None,
+                ip=request.GET.get('ip') or None,
+                level=request.GET.get('level') or None,
+                source=source
+            )
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
         
         return JsonResponse({
             'success': True,
-            'data': formatted_logs
+            'data': result['entries'],
+            'cursor': result['cursor'],
+            'has_more': result['has_more'],
+            'reset': result['reset'],
+            'source': result['source']
         })
     except Exception as e:
         logging.writeToFile(f"api_logs error: {str(e)}")
@@ -557,6 +701,33 @@ def api_logs(request):
         }, status=500)
 
 
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def api_events_stream(request):
+    """Stream ban/unban/found events to the dashboard as server-sent events"""
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    stream = get_broadcaster().stream(last_event_id)
+    if stream is None:
+        # Each stream holds a worker thread; this process has all it can spare
+        response = JsonResponse({
+            'success': False,
+            'error': 'Too many live event streams open, poll /api/dashboard/ instead'
+        }, status=503)
+        response['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response
+    
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @cyberpanel_login_required
 @require_http_methods(["GET", "POST"])
 def api_settings(request):
@@ -566,12 +737,7 @@ def api_settings(request):
             settings = Fail2banSettings.get_settings()
             return JsonResponse({
                 'success': True,
-                'data': {
-                    'email_notifications': settings.email_notifications,
-                    'auto_ban_threshold': settings.auto_ban_threshold,
-                    'ban_duration': settings.ban_duration,
-                    'enabled_jails': settings.enabled_jails or 'sshd,openlitespeed,cyberpanel'
-                }
+                'data': settings_data(settings)
             })
         
         elif request.method == 'POST':
@@ -582,6 +748,52 @@ def api_settings(request):
             settings.auto_ban_threshold = data.get('auto_ban_threshold', settings.auto_ban_threshold)
             settings.ban_duration = data.get('ban_duration', settings.ban_duration)
             settings.enabled_jails = data.get('enabled_jails', settings.enabled_jails)
+            settings.archive_pruned_events = bool(data.get('archive_pruned_events', settings.archive_pruned_events))
+            
+            if 'event_retention_days' in data:
+                try:
+                    retention_days = int(data['event_retention_days'])
+                except (TypeError, ValueError):
+                    retention_days = 0
+                if retention_days < 1:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Event retention must be at least 1 day'
+                    }, status=400)
+                settings.event_retention_days = retention_days
+            
+            settings.escalation_enabled = bool(data.get('escalation_enabled', settings.escalation_enabled))
+            if 'escalation_steps' in data:
+                try:
+                    parse_steps(data['escalation_steps'])
+                except ValueError as e:
+                    return JsonResponse({
+                        'success': False,
+                        'error': str(e)
+                    }, status=400)
+                settings.escalation_steps = ' '.join(str(data['escalation_steps']).split())[:255]
+            
+            if 'escalation_reset_days' in data:
+                try:
+                    reset_days = int(data['escalation_reset_days'])
+                except (TypeError, ValueError):
+                    reset_days = 0
+                if reset_days < 1:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Escalation reset must be at least 1 day'
+                    }, status=400)
+                settings.escalation_reset_days = reset_days
+            
+            settings.federation_enabled = bool(data.get('federation_enabled', settings.federation_enabled))
+            if data.get('federation_token'):
+                settings.federation_token = str(data['federation_token']).strip()[:128]
+            if settings.federation_enabled and len(settings.federation_token) < 16:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Federation needs a token of at least 16 characters'
+                }, status=400)
+            
             settings.save()
             
             SecurityEvent.objects.create(
@@ -610,32 +822,14 @@ def api_settings(request):
 def api_statistics(request):
     """Get security statistics"""
     try:
-        # Get statistics from the last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        
-        stats = {
-            'total_events': SecurityEvent.objects.filter(created_at__gte=thirty_days_ago).count(),
-            'total_bans': SecurityEvent.objects.filter(event_type='ban', created_at__gte=thirty_days_ago).count(),
-            'total_unbans': SecurityEvent.objects.filter(event_type='unban', created_at__gte=thirty_days_ago).count(),
-            'total_attacks': SecurityEvent.objects.filter(event_type='attack', created_at__gte=thirty_days_ago).count(),
-            'currently_banned': BannedIP.objects.filter(is_active=True).count(),
-            'whitelisted_ips': WhitelistIP.objects.filter(is_active=True).count(),
-            'blacklisted_ips': BlacklistIP.objects.filter(is_active=True).count(),
-        }
-        
-        # Get events by day for chart
-        events_by_day = []
-        for i in range(30):
-            day = timezone.now() - timedelta(days=i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            count = SecurityEvent.objects.filter(created_at__gte=day_start, created_at__lt=day_end).count()
-            events_by_day.append({
-                'date': day_start.date().isoformat(),
-                'count': count
-            })
+        window = request.GET.get('window', DEFAULT_WINDOW)
+        if window not in STATISTICS_WINDOWS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid window, expected one of: {", ".join(STATISTICS_WINDOWS)}'
+            }, status=400)
         
-        stats['events_by_day'] = list(reversed(events_by_day))
+        stats = get_statistics(window, source=request.GET.get('source'))
         
         return JsonResponse({
             'success': True,
@@ -649,6 +843,167 @@ def api_statistics(request):
         }, status=500)
 
 
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def api_analytics(request):
+    """Get top offenders, prefix aggregation and per-jail attack rates"""
+    try:
+        window = request.GET.get('window', DEFAULT_WINDOW)
+        if window not in STATISTICS_WINDOWS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid window, expected one of: {", ".join(STATISTICS_WINDOWS)}'
+            }, status=400)
+        try:
+            limit = max(1, min(int(request.GET.get('limit', TOP_LIMIT)), 200))
+        except ValueError:
+            limit = TOP_LIMIT
+        
+        return JsonResponse({
+            'success': True,
+            'data': get_analytics(window, limit)
+        })
+    except Exception as e:
+        logging.writeToFile(f"api_analytics error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def api_recommendations(request):
+    """Get recommended escalations (range bans, blacklisting repeat offenders)"""
+    try:
+        window = request.GET.get('window', ESCALATION_WINDOW)
+        if window not in STATISTICS_WINDOWS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid window, expected one of: {", ".join(STATISTICS_WINDOWS)}'
+            }, status=400)
+        try:
+            min_hosts = max(1, int(request.GET.get('min_hosts', RANGE_BAN_MIN_HOSTS)))
+            min_bans = max(1, int(request.GET.get('min_bans', REPEAT_OFFENDER_MIN_BANS)))
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'min_hosts and min_bans must be integers'
+            }, status=400)
+        
+        return JsonResponse({
+            'success': True,
+            'data': get_recommendations(window, min_hosts=min_hosts, min_bans=min_bans)
+        })
+    except Exception as e:
+        logging.writeToFile(f"api_recommendations error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+def _filter_test(params):
+    try:
+        return {'success': True, 'data': run_filter_test(**params)}
+    except (OSError, ValueError) as e:
+        return {'success': False, 'error': str(e)}
+
+
+@cyberpanel_login_required
+@require_http_methods(["POST"])
+def api_filter_test(request):
+    """Benchmark a jail's failregex and candidate regexes on a sample of its log in the background"""
+    try:
+        data = json.loads(request.body)
+        jail = data.get('jail') or None
+        filter_name = data.get('filter') or None
+        candidates = data.get('candidates') or []
+        if isinstance(candidates, str):
+            candidates = candidates.splitlines()
+        sample = data.get('sample') or None
+        
+        if not jail and not filter_name and not candidates:
+            return JsonResponse({
+                'success': False,
+                'error': 'A jail, filter or candidate regex is required'
+            }, status=400)
+        if filter_name and not re.match(r'^[\w.\-]+$', filter_name):
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid filter name'
+            }, status=400)
+        try:
+            lines = int(data.get('lines', FILTER_SAMPLE_LINES))
+        except (TypeError, ValueError):
+            lines = FILTER_SAMPLE_LINES
+        
+        params = {'jail': jail, 'filter_name': filter_name, 'sample': sample, 'lines': lines, 'candidates': candidates}
+        # The same test submitted again while it runs joins it; different
+        # tests get their own task
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        task = submit_task(f'filter_test:{digest}', _filter_test, params)
+        return JsonResponse({
+            'success': True,
+            'data': task_data(task)
+        }, status=202)
+    except Exception as e:
+        logging.writeToFile(f"api_filter_test error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def api_federation_deltas(request):
+    """Serve this node's ban/unban deltas to federation peers (Bearer token auth)"""
+    try:
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+        if not check_token(token):
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid federation token'
+            }, status=403)
+        try:
+            since = max(0, int(request.GET.get('since', 0)))
+            limit = int(request.GET.get('limit', PULL_BATCH_SIZE))
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'since and limit must be integers'
+            }, status=400)
+        
+        return JsonResponse({
+            'success': True,
+            'data': get_deltas(since, limit)
+        })
+    except Exception as e:
+        logging.writeToFile(f"api_federation_deltas error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@cyberpanel_login_required
+@require_http_methods(["GET"])
+def api_federation_status(request):
+    """Get federation peers with their replication lag"""
+    try:
+        return JsonResponse({
+            'success': True,
+            'data': federation_status()
+        })
+    except Exception as e:
+        logging.writeToFile(f"api_federation_status error: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
 @cyberpanel_login_required
 @require_http_methods(["POST"])
 def api_toggle_plugin(request):